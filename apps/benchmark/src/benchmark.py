@@ -0,0 +1,407 @@
+import argparse
+import copy
+import gc
+import importlib.util
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import utils.etl_util as etlu
+import data_generator as datagen
+
+RETURN_SUCCESS = 0
+RETURN_FAILURE = 1
+APP = 'OpenData benchmark'
+PROCESS_NAME = 'wendizhang'
+DEFAULT_ROWS = [10000, 100000, 1000000]
+DEFAULT_TOLERANCE = 0.2
+STARTUP_ROWS = 100
+# Start-up budget of command line runs which read no record (help, dry run); none of them may import heavy modules.
+DEFAULT_STARTUP_BUDGET = 0.5
+STARTUP_BUDGETED_FEATURES = ('startup_help', 'startup_validate')
+STARTUP_HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl')
+
+
+def main(argv):
+    args = _interpret_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(message)s')
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = list()
+    if args.startup:
+        results += run_startup_benchmark(args.cardinality, args.workdir, repeat=args.repeat)
+    else:
+        for rows in args.rows:
+            results += run_benchmark(rows, args.cardinality, args.workdir, repeat=args.repeat)
+
+    report = {'meta': _environment(), 'results': results}
+    if args.output_path:
+        with open(args.output_path, 'w') as file_output:
+            json.dump(report, file_output, indent=4)
+    print(format_results(results))
+
+    regressions = list()
+    if args.baseline_path:
+        with open(args.baseline_path) as file_baseline:
+            baseline = json.load(file_baseline)
+        comparison, regressions = compare_results(results, baseline['results'], args.tolerance)
+        print(comparison)
+    if args.startup:
+        budget_report, violations = check_startup_budget(results, args.startup_budget)
+        print(budget_report)
+        regressions += violations
+    return RETURN_FAILURE if regressions else RETURN_SUCCESS
+
+
+def _interpret_args(argv):
+    """
+    Read and parse given command line arguments.
+    :param argv: Given argument parameters.
+    :return: argparse.Namespace; Parsed arguments
+    """
+    arg_parser = argparse.ArgumentParser(APP)
+    arg_parser.add_argument('-rows', dest='rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                            help='Numbers of input rows to benchmark, e.g. 10000 1000000 100000000')
+    arg_parser.add_argument('-cardinality', dest='cardinality', type=int, default=26,
+                            help='Number of distinct department codes (mapping keys)')
+    arg_parser.add_argument('-repeat', dest='repeat', type=int, default=1,
+                            help='Number of runs per feature, the fastest one is recorded')
+    arg_parser.add_argument('-workdir', dest='workdir', default=os.path.join('data', 'benchmark'),
+                            help='Directory of generated data and intermediate outputs')
+    arg_parser.add_argument('-output', dest='output_path', help='Fully qualified JSON results file')
+    arg_parser.add_argument('-baseline', dest='baseline_path', help='Fully qualified JSON baseline results file')
+    arg_parser.add_argument('-tolerance', dest='tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='Allowed relative slowdown against baseline before reporting a regression')
+    arg_parser.add_argument('-startup', dest='startup', action='store_true',
+                            help='Benchmark start-up time of the command line instead of ETL features')
+    arg_parser.add_argument('-startup_budget', dest='startup_budget', type=float, default=DEFAULT_STARTUP_BUDGET,
+                            help='Wall seconds allowed to command line runs reading no record (help, dry run)')
+    return arg_parser.parse_args(argv)
+
+
+def run_benchmark(rows, cardinality, workdir, repeat=1):
+    """
+    Benchmark every ETL feature and both workflows on generated data of given size.
+    :param rows: int; Number of input rows
+    :param cardinality: int; Number of distinct department codes
+    :param workdir: str; Directory of generated data and intermediate outputs
+    :param repeat: int, default=1; Number of runs per feature
+    :return: list of dict; Per feature results
+    """
+    input_path = os.path.join(workdir, f'input_{rows}_{cardinality}.csv')
+    mapping_path = os.path.join(workdir, f'mapping_{cardinality}.csv')
+    extraction_path = os.path.join(workdir, f'extraction_{rows}_{cardinality}.csv')
+    transformation_path = os.path.join(workdir, f'transformation_{rows}_{cardinality}.csv')
+    write_path = os.path.join(workdir, f'write_{rows}_{cardinality}.csv')
+    if not os.path.isfile(input_path):
+        datagen.generate_input(input_path, rows, cardinality)
+    if not os.path.isfile(mapping_path):
+        datagen.generate_mapping(mapping_path, cardinality)
+
+    opendata = _load_opendata()
+    # Caches are bypassed, so that repeated runs (and runs of previous benchmarks) do not time cache hits.
+    extraction_argv = ['-process', f'{PROCESS_NAME}_extraction', '-input', input_path, '-output', extraction_path,
+                       '-mapping', mapping_path, '-run_date', '10222020', '-description', 'benchmark',
+                       '-prop_date', '10222020', '-no_mapping_cache', '-no_cache']
+    args, process_name, process_type, extraction_config = opendata._interpret_args(extraction_argv)
+    transformation_argv = ['-process', f'{PROCESS_NAME}_transformation', '-input', extraction_path,
+                           '-output', transformation_path] + extraction_argv[6:]
+    _, _, _, transformation_config = opendata._interpret_args(transformation_argv)
+
+    input_read = dict(extraction_config['input']['read'], path=input_path, description='benchmark input')
+    mapping_config = copy.deepcopy(extraction_config['mapping'])
+    mapping_config['read'].update({'path': mapping_path, 'description': 'benchmark mapping'})
+    input_raw_read = {key: value for key, value in input_read.items() if key != 'apply_dtype'}
+    results = list()
+
+    def measure(feature, func, setup=None):
+        result, metrics = _measure(func, setup, repeat)
+        metrics.update({'rows': rows, 'cardinality': cardinality, 'feature': feature})
+        results.append(metrics)
+        return result
+
+    df_input = measure('read_feature', lambda: etlu.read_feature(input_read))
+    measure('apply_dtype_feature', lambda df: etlu.apply_dtype_feature(df, input_read['apply_dtype']),
+            setup=lambda: etlu.read_feature(input_raw_read))
+    df_mapped = measure('mapping_feature', lambda df: etlu.mapping_feature(df, mapping_config),
+                        setup=lambda: df_input.copy())
+    df_assigned = etlu.assign_feature(df_mapped.copy(), copy.deepcopy(extraction_config['assign']))
+    df_output = measure('rearrange_feature',
+                        lambda df: etlu.rearrange_feature(df, extraction_config['output']['rearrange']),
+                        setup=lambda: df_assigned.copy())
+    measure('write_feature', lambda df: etlu.write_feature(df, {'path': write_path, 'file_type': 'csv',
+                                                                'separator': '|'}, mode='overwrite'),
+            setup=lambda: df_output)
+    measure('aggregate_feature', lambda df: etlu.aggregate_feature(df, transformation_config['aggregate']),
+            setup=lambda: df_output)
+    measure('dupl_feature', lambda df: etlu.dupl_feature(df, transformation_config['dupl']),
+            setup=lambda: df_output.copy())
+    del df_input, df_mapped, df_assigned, df_output
+
+    measure('run_extraction', lambda argv: _run_process(opendata, argv), setup=lambda: _fresh(extraction_argv))
+    measure('run_transformation', lambda argv: _run_process(opendata, argv),
+            setup=lambda: _fresh(transformation_argv))
+    return results
+
+
+def run_startup_benchmark(cardinality, workdir, repeat=1):
+    """
+    Benchmark start-up of the command line, each run in a fresh interpreter: help, dry run (-validate) and a whole
+    Extraction of a tiny input, which is dominated by start-up. Imports are traced (-X importtime), so that heavy
+    modules imported by runs reading no record are reported, along with the time spent importing.
+    :param cardinality: int; Number of distinct department codes
+    :param workdir: str; Directory of generated data and outputs
+    :param repeat: int, default=1; Number of runs per feature, the fastest one is recorded
+    :return: list of dict; Per feature results
+    """
+    input_path = os.path.join(workdir, f'input_{STARTUP_ROWS}_{cardinality}.csv')
+    mapping_path = os.path.join(workdir, f'mapping_{cardinality}.csv')
+    if not os.path.isfile(input_path):
+        datagen.generate_input(input_path, STARTUP_ROWS, cardinality)
+    if not os.path.isfile(mapping_path):
+        datagen.generate_mapping(mapping_path, cardinality)
+
+    extraction_argv = ['-process', f'{PROCESS_NAME}_extraction', '-input', input_path,
+                       '-output', os.path.join(workdir, f'startup_{STARTUP_ROWS}_{cardinality}.csv'),
+                       '-mapping', mapping_path, '-run_date', '10222020', '-description', 'benchmark',
+                       '-prop_date', '10222020', '-log', os.path.join(workdir, 'startup.log'), '-no_cache']
+    features = [('startup_help', ['-process', f'{PROCESS_NAME}_extraction', '-h']),
+                ('startup_validate', extraction_argv + ['-validate']),
+                ('startup_extraction', extraction_argv)]
+    results = list()
+    for feature, argv in features:
+        best = None
+        for _ in range(max(1, repeat)):
+            metrics = _measure_command(argv, workdir)
+            if best is None or metrics['wall_s'] < best['wall_s']:
+                best = metrics
+        best.update({'rows': STARTUP_ROWS, 'cardinality': cardinality, 'feature': feature})
+        results.append(best)
+        if feature == 'startup_extraction':
+            _fresh(argv)
+    return results
+
+
+def check_startup_budget(results, budget=DEFAULT_STARTUP_BUDGET):
+    """
+    Check start-up results of runs reading no record against the budget: they must not take longer than the budget,
+    nor import any heavy module.
+    :param results: list of dict; Start-up results, see run_startup_benchmark
+    :param budget: float, default=DEFAULT_STARTUP_BUDGET; Allowed wall seconds
+    :return: tuple; Formatted report and list of results exceeding the budget
+    """
+    lines = [f'{"FEATURE":<20}  {"BUDGET_S":>9}  {"WALL_S":>9}  {"IMPORT_S":>9}  HEAVY_MODULES']
+    violations = list()
+    for result in results:
+        if result['feature'] not in STARTUP_BUDGETED_FEATURES:
+            continue
+        flag = ''
+        if result['wall_s'] > budget or result['heavy_modules']:
+            flag = '  OVER BUDGET'
+            violations.append(result)
+        lines.append(f'{result["feature"]:<20}  {budget:>9.3f}  {result["wall_s"]:>9.3f}  {result["import_s"]:>9.3f}  '
+                     f'{",".join(result["heavy_modules"]) or "-"}{flag}')
+    return '\n'.join(lines), violations
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results against baseline ones, matching them by rows, cardinality and feature.
+    :param results: list of dict; Current results
+    :param baseline: list of dict; Baseline results
+    :param tolerance: float, default=DEFAULT_TOLERANCE; Allowed relative slowdown
+    :return: tuple; Formatted comparison and list of regressed results
+    """
+    baseline_by_key = {(result['rows'], result['cardinality'], result['feature']): result for result in baseline}
+    lines = [f'{"ROWS":>10}  {"FEATURE":<20}  {"BASE_S":>9}  {"WALL_S":>9}  {"RATIO":>6}']
+    regressions = list()
+    for result in results:
+        base = baseline_by_key.get((result['rows'], result['cardinality'], result['feature']))
+        if not base:
+            continue
+        ratio = result['wall_s'] / base['wall_s'] if base['wall_s'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        lines.append(f'{result["rows"]:>10}  {result["feature"]:<20}  {base["wall_s"]:>9.3f}  '
+                     f'{result["wall_s"]:>9.3f}  {ratio:>6.2f}{flag}')
+    return '\n'.join(lines), regressions
+
+
+def format_results(results):
+    """
+    Format results as a text table.
+    :param results: list of dict; Per feature results
+    :return: str; Formatted results
+    """
+    lines = [f'{"ROWS":>10}  {"FEATURE":<20}  {"WALL_S":>9}  {"CPU_S":>9}  {"PEAK_RSS_MB":>11}  {"RSS_DELTA_MB":>12}']
+    for result in results:
+        lines.append(f'{result["rows"]:>10}  {result["feature"]:<20}  {result["wall_s"]:>9.3f}  '
+                     f'{result["cpu_s"]:>9.3f}  {_format_mb(result["peak_rss_mb"]):>11}  '
+                     f'{_format_mb(result["rss_delta_mb"]):>12}')
+    return '\n'.join(lines)
+
+
+def _format_mb(value):
+    """
+    Format a memory metric.
+    :param value: float; Memory in megabytes, None if it is not measured
+    :return: str; Formatted memory
+    """
+    return '-' if value is None else f'{value:.1f}'
+
+
+def _measure(func, setup, repeat):
+    """
+    Run given function <repeat> times, keeping metrics of the fastest run.
+    :param func: callable; Measured function, called with result of setup, if any
+    :param setup: callable; Untimed preparation of function argument, None for no argument
+    :param repeat: int; Number of runs
+    :return: tuple; Result of the last run and its metrics
+    """
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        func_args = (setup(),) if setup else ()
+        gc.collect()
+        rss_before = _current_rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func(*func_args)
+        metrics = {'wall_s': time.perf_counter() - wall_start,
+                   'cpu_s': time.process_time() - cpu_start,
+                   'peak_rss_mb': _peak_rss_mb(),
+                   'rss_delta_mb': _current_rss_mb() - rss_before}
+        if best is None or metrics['wall_s'] < best['wall_s']:
+            best = metrics
+    return result, best
+
+
+def _measure_command(argv, workdir):
+    """
+    Run the command line in a fresh interpreter, tracing its imports.
+    :param argv: list; Command line arguments
+    :param workdir: str; Directory of the import trace
+    :return: dict; Run metrics, with time spent importing and heavy modules imported
+    """
+    root_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', '..')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.realpath(root_path),
+                                                                    os.environ.get('PYTHONPATH')])))
+    trace_path = os.path.join(workdir, 'startup.importtime')
+    with open(trace_path, 'w') as file_trace:
+        wall_start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-X', 'importtime', _opendata_path()] + argv, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=file_trace)
+        # Resource usage of this very child, rather than the accumulated one of every child so far.
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_s = time.perf_counter() - wall_start
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f'Command line <{" ".join(argv)}> exited with <{process.returncode}>, see <{trace_path}>')
+
+    import_us = 0
+    modules = set()
+    with open(trace_path) as file_trace:
+        for line in file_trace:
+            # import time: self [us] | cumulative | imported package
+            if line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+                own_us, _, name = line[len('import time:'):].split('|', 2)
+                import_us += int(own_us)
+                modules.add(name.strip().split('.')[0])
+    # Peak memory of a child is not reported: it accounts for the memory of this process it was forked from.
+    return {'wall_s': wall_s, 'cpu_s': usage.ru_utime + usage.ru_stime, 'peak_rss_mb': None,
+            'rss_delta_mb': None, 'import_s': import_us / 1e6,
+            'heavy_modules': sorted(modules.intersection(STARTUP_HEAVY_MODULES))}
+
+
+def _run_process(opendata, argv):
+    """
+    Run a whole process, as the command line does.
+    :param opendata: module; Loaded opendata application module
+    :param argv: list; Command line arguments
+    :return: str; Path of the written output file
+    """
+    args, process_name, process_type, process_config = opendata._interpret_args(argv)
+    return opendata.run_process(args, process_type, process_config)
+
+
+def _fresh(argv):
+    """
+    Remove versioned outputs of previous runs, so that every run writes to the same path.
+    :param argv: list; Command line arguments
+    :return: list; Same command line arguments
+    """
+    output_path = argv[argv.index('-output') + 1]
+    root, ext = os.path.splitext(output_path)
+    directory = os.path.dirname(output_path) or '.'
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if path == output_path or (path.startswith(root + '_') and path.endswith(ext)):
+            os.remove(path)
+    return argv
+
+
+def _load_opendata():
+    """
+    Load opendata application module from its source file, as it is run as a script.
+    :return: module; Loaded module
+    """
+    spec = importlib.util.spec_from_file_location('opendata', _opendata_path())
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _opendata_path():
+    """
+    Source file of opendata application module.
+    :return: str; Fully qualified file name
+    """
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'opendata', 'src', 'opendata.py')
+
+
+def _current_rss_mb():
+    """
+    Current resident set size of this process.
+    :return: float; Resident set size in megabytes, 0.0 if it cannot be determined
+    """
+    try:
+        with open('/proc/self/statm') as file_statm:
+            return int(file_statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _peak_rss_mb():
+    """
+    Peak resident set size of this process so far.
+    :return: float; Peak resident set size in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _environment():
+    """
+    Describe benchmark environment, so that results of different machines are not compared blindly.
+    :return: dict; Environment description
+    """
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+if __name__ == '__main__':
+    # Call main process.
+    sys.exit(main(sys.argv[1:]))
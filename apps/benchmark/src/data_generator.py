@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pandas as pd
+
+EMP_TYPES = ['Contract', 'Intern', 'Permanent', 'Seasonal']
+DEPT_NAMES = ['Sales', 'Data', 'Marketing', 'Finance', 'HR', 'Operations']
+GENERATE_CHUNK_SIZE = 1000000
+
+
+def dept_codes(cardinality):
+    """
+    Build department codes, 'A'..'Z', then 'AA'..'ZZ' and so on, as in the sample mapping file.
+    :param cardinality: int; Number of distinct codes
+    :return: list; Department codes
+    """
+    codes = list()
+    for index in range(cardinality):
+        code = ''
+        index += 1
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            code = chr(ord('A') + remainder) + code
+        codes.append(code)
+    return codes
+
+
+def generate_mapping(path, cardinality):
+    """
+    Generate a mapping file of wendizhang schema (CODE, DEPT_NAME), comma separated.
+    :param path: str; Fully qualified file name to write
+    :param cardinality: int; Number of department codes
+    :return: str; Path of the written file
+    """
+    codes = dept_codes(cardinality)
+    df_mapping = pd.DataFrame({'CODE': codes,
+                               'DEPT_NAME': [DEPT_NAMES[index % len(DEPT_NAMES)] if index < len(DEPT_NAMES)
+                                             else f'{DEPT_NAMES[index % len(DEPT_NAMES)]}_{index}'
+                                             for index in range(cardinality)]})
+    df_mapping.to_csv(path, sep=',', index=False)
+    return path
+
+
+def generate_input(path, rows, cardinality, seed=0):
+    """
+    Generate an input file of wendizhang schema (DEPT_CODE, EMP_NAME, EMP_CODE, SALARY, EMP_TYPE), pipe separated.
+    File is written in chunks, so that any number of rows can be generated within bounded memory.
+    :param path: str; Fully qualified file name to write
+    :param rows: int; Number of rows
+    :param cardinality: int; Number of department codes, a few more than the mapping has, to leave some unmatched
+    :param seed: int, default=0; Random generator seed
+    :return: str; Path of the written file
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.array(dept_codes(cardinality + max(1, cardinality // 10)), dtype=object)
+    emp_types = np.array(EMP_TYPES, dtype=object)
+    if os.path.isfile(path):
+        os.remove(path)
+
+    written = 0
+    while written < rows:
+        length = min(GENERATE_CHUNK_SIZE, rows - written)
+        emp_codes = np.arange(written, written + length)
+        df_chunk = pd.DataFrame({'DEPT_CODE': codes[rng.integers(0, len(codes), length)],
+                                 'EMP_NAME': np.char.add('Emp', emp_codes.astype(str)),
+                                 'EMP_CODE': emp_codes,
+                                 'SALARY': rng.integers(30, 150, length) * 1000,
+                                 'EMP_TYPE': emp_types[rng.integers(0, len(emp_types), length)]})
+        df_chunk.to_csv(path, sep='|', index=False, mode='a', header=(written == 0))
+        written += length
+    return path
@@ -1 +0,0 @@
-aa
@@ -1,40 +1,85 @@
 import argparse
+import contextlib
+import contextvars
+import copy
+import functools
 import json
 import logging
 import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
 from types import SimpleNamespace as Namespace
-import utils.etl_util as etlu
+import utils.batch_util as batchu
+import utils.cache_util as cacheu
+import utils.file_util as fileu
+import utils.metrics_util as metricsu
 import utils.misc_util as miscu
+import utils.plan_util as planu
+import utils.profile_util as profileu
+import utils.registry_util as registryu
+import utils.watermark_util as watermarku
 
 RETURN_SUCCESS = 0
 RETURN_FAILURE = 1
 APP = 'OpenData utility'
+DEFAULT_WORKER_CHUNK_SIZE = 100000
+# Config sections whose plugins run chunk by chunk (or in worker processes) when input is chunked.
+EXTRACTION_CHUNK_SECTIONS = ('input', 'mapping', 'assign', 'output')
+TRANSFORMATION_CHUNK_SECTIONS = ('input',)
+# Arguments (destinations) which may be given as a list or range of dates, running a backfill, see run_backfill.
+BACKFILL_ARGS = ('run_date', 'prop_date')
+BACKFILL_DATE_FORMAT = '%m%d%Y'
+BACKFILL_LIST_SEPARATOR = ','
+BACKFILL_RANGE_SEPARATOR = ':'
+# Bumped whenever _compile_config changes, so that configs compiled by a previous version are not used.
+CONFIG_COMPILE_VERSION = 1
+
+# Importing ETL features imports pandas and numpy, which is most of the start-up time; help, argument validation
+# and dry runs do without them.
+etlu = miscu.lazy_import('utils.etl_util')
+# Daemon mode only needs asyncio.
+daemonu = miscu.lazy_import('utils.daemon_util')
+
+# Per-process state of Extraction workers, populated once by _init_extraction_worker.
+_worker_state = dict()
 
 
 def main(argv):
     try:
+        # Batch manifest mode runs many processes within this interpreter.
+        if '-batch' in argv:
+            batch_args = _interpret_batch_args(argv)
+            _init_logging(batch_args.log_path)
+            logging.info('')
+            logging.info(f'Entering {APP} batch')
+            return_code = run_batch(batch_args.batch_path, workers=batch_args.batch_workers,
+                                    log_path=batch_args.log_path, prometheus=batch_args.prometheus)
+            logging.info(f'Leaving {APP} batch')
+            return return_code
+
+        # Daemon mode keeps running jobs within this interpreter until it is stopped.
+        if '-daemon' in argv:
+            daemon_args = _interpret_daemon_args(argv)
+            _init_logging(daemon_args.log_path)
+            logging.info('')
+            logging.info(f'Entering {APP} daemon')
+            return_code = run_daemon(daemon_args.daemon_path, workers=daemon_args.daemon_workers,
+                                     log_path=daemon_args.log_path, prometheus=daemon_args.prometheus)
+            logging.info(f'Leaving {APP} daemon')
+            return return_code
+
         # Parse command line arguments.
         args, process_name, process_type, process_config = _interpret_args(argv)
 
         # Initialize standard logging \ destination file handlers.
-        # TODO: Finish/fix logging below.
-        std_filename = '/Users/WendiZhang/Desktop/frelabpy/apps/opendata/src/opendata.log'
-        logging.basicConfig(filename=std_filename, filemode='a', format='%(asctime)s - %(message)s')
+        _init_logging(args.log_path)
         logging.info('')
         logging.info(f'Entering {APP}')
 
-        # Preparation step.
-        mapping_args = miscu.convert_namespace_to_dict(args)
-        mapping_conf = miscu.convert_namespace_to_dict(process_config)
-
-        # Workflow steps.
-        if process_type == 'extraction':
-            run_extraction(mapping_args, mapping_conf)
-        elif process_type == 'transformation':
-            run_transformation(mapping_args, mapping_conf)
-        else:
-            logging.warning(f'Incorrect feature type: [{process_type}]')
+        # Preparation and workflow steps.
+        run_process(args, process_type, process_config)
 
         logging.info(f'Leaving {APP}')
         return RETURN_SUCCESS
@@ -49,6 +94,498 @@ def main(argv):
         raise gen_exc
 
 
+def _init_logging(log_path=None):
+    """
+    Initialize standard logging / destination file handlers.
+    :param log_path: str, default=None; Fully qualified logging file, <opendata.log> next to this script if not given
+    :return: null
+    """
+    # Replace the default handler a message logged while arguments were interpreted may have installed.
+    logging.basicConfig(filename=_log_path(log_path), filemode='a', level=logging.INFO,
+                        format='%(asctime)s - %(message)s', force=True)
+
+
+def _log_path(log_path=None):
+    """
+    Resolve logging file, which also locates metrics files.
+    :param log_path: str, default=None; Fully qualified logging file
+    :return: str; Fully qualified logging file, <opendata.log> next to this script if not given
+    """
+    return log_path or os.path.join(os.path.dirname(os.path.realpath(__file__)), 'opendata.log')
+
+
+def run_process(args, process_type, process_config):
+    """
+    Run a single process, as interpreted by _interpret_args.
+    :param args: argparse.Namespace; Parsed command line arguments
+    :param process_type: str; Process type, either 'extraction', 'transformation' or 'pipeline'
+    :param process_config: dict; Process configuration mapping, compiled by _load_config
+    :return: str; Path of the written output file, list of paths for a backfill
+    """
+    # Preparation step.
+    mapping_args = miscu.convert_namespace_to_dict(args)
+    mapping_conf = process_config
+
+    # Per-stage metrics are written next to logging file, as JSON lines and optionally as Prometheus textfile.
+    log_path = _log_path(miscu.eval_elem_mapping(mapping_args, 'log_path'))
+    metrics_path, prometheus_path = metricsu.metrics_paths(log_path, mapping_args['process'])
+    run = metricsu.start_run(mapping_args['process'])
+    status = 'failure'
+
+    # Every stage is optionally profiled too, profiles are written into <log root>.profile directory by default.
+    session = None
+    if miscu.eval_elem_mapping(mapping_args, 'profile'):
+        session = profileu.start_session(mapping_args['process'],
+                                         mode=miscu.eval_elem_mapping(mapping_args, 'profile_mode',
+                                                                      default_value=profileu.MODE_DETERMINISTIC))
+    try:
+        # Workflow steps; dates given as a list or range run a backfill.
+        backfill_dates = _backfill_dates(mapping_args)
+        if backfill_dates and process_type in ('extraction', 'transformation', 'pipeline'):
+            output_path = run_backfill(mapping_args, process_type, mapping_conf, backfill_dates)
+        elif process_type == 'extraction':
+            output_path = run_extraction(mapping_args, mapping_conf)
+        elif process_type == 'transformation':
+            output_path = run_transformation(mapping_args, mapping_conf)
+        elif process_type == 'pipeline':
+            output_path = run_pipeline(mapping_args, mapping_conf)
+        else:
+            logging.warning(f'Incorrect feature type: [{process_type}]')
+            return None
+        status = 'success'
+        return output_path
+    finally:
+        if session:
+            profileu.end_session(session)
+            print(profileu.write_profiles(session, miscu.eval_elem_mapping(
+                mapping_args, 'profile_dir', default_value=os.path.splitext(log_path)[0] + '.profile')))
+        metricsu.end_run(run, status)
+        metricsu.write_jsonl(metrics_path, run)
+        if miscu.eval_elem_mapping(mapping_args, 'prometheus'):
+            metricsu.write_prometheus(prometheus_path, run)
+
+
+def run_backfill(args, process_type, config, dates):
+    """
+    Backfill process: run a process once per date of <-run_date> and <-prop_date> given as a list or range (see
+    _backfill_dates), reading input and mapping only once. Stages which do not depend on dates (read, input plugin,
+    mapping; aggregation for Transformation) run once; assignment and following stages, up to write, then run for
+    every date concurrently (<-workers> dates at a time, number of CPUs by default), on shallow copies of the shared
+    result. Every date writes its own output, named after the date, see _backfill_path.
+    Pipeline aggregates once too, unless its Extraction assigns a backfilled date (aggregated records then differ).
+    Backfill always reads whole input, except Transformation aggregation which may stream it in chunks; incremental
+    runs and stage cache are not used.
+    :param args: dict; Command line arguments mapping, with dates as given
+    :param process_type: str; Process type, either 'extraction', 'transformation' or 'pipeline'
+    :param config: dict; Configuration mapping
+    :param dates: list of dict; Values of backfilled arguments for every date, see _backfill_dates
+    :return: list of str; Paths of the written output files, in order of dates
+    """
+    runs = [dict(args, **date_values, output_path=_backfill_path(args.get('output_path'), date_values))
+            for date_values in dates]
+
+    # Dry runs are those of every date (plan of the first one only, the same for every date).
+    if miscu.eval_elem_mapping(args, 'explain') or miscu.eval_elem_mapping(args, 'validate'):
+        run_func = {'extraction': run_extraction, 'transformation': run_transformation,
+                    'pipeline': run_pipeline}[process_type]
+        for date_args in (runs[:1] if miscu.eval_elem_mapping(args, 'explain') else runs):
+            run_func(date_args, copy.deepcopy(config))
+        print(f'Backfill of {len(runs)} dates: {runs[0]["output_path"]} .. {runs[-1]["output_path"]}')
+        return None
+    if miscu.eval_elem_mapping(args, 'incremental'):
+        logging.warning('Backfill does not run incrementally; running in full')
+
+    workers = miscu.eval_elem_mapping(args, 'workers', default_value=os.cpu_count() or 1)
+    logging.info(f'Backfill of <{len(runs)}> dates, <{workers}> at a time')
+    if process_type == 'extraction':
+        return _backfill_extraction(runs, config, workers)
+    if process_type == 'transformation':
+        return _backfill_transformation(runs, config, workers)
+    return _backfill_pipeline(args, config, dates, workers)
+
+
+def _backfill_extraction(runs, config, workers):
+    """
+    Backfill of Extraction process: input and mapping stages once, assignment and following stages per date.
+    :param runs: list of dict; Command line arguments mapping of every date
+    :param config: dict; Configuration mapping
+    :param workers: int; Number of dates run concurrently
+    :return: list of str; Paths of the written output files, in order of dates
+    """
+    stages = [_prepare_extraction(date_args, copy.deepcopy(config)) for date_args in runs]
+    if miscu.eval_elem_mapping(runs[0], 'clear_mapping_cache'):
+        mapping_cache_config = miscu.eval_elem_mapping(stages[0]['mapping'], 'cache')
+        cacheu.clear(miscu.eval_elem_mapping(mapping_cache_config, 'path', default_value=cacheu.READ_CACHE_DIR))
+    df_mapping = _read_mapping(stages[0])
+    df_target = _run_steps(next(_read_frames(stages[0]['input_read'])), _mapping_steps(stages[0], lambda: df_mapping))
+    return _fan_out(df_target, [functools.partial(_write_steps, _assignment_steps(date_stages),
+                                                  date_stages['output_write']) for date_stages in stages], workers)
+
+
+def _backfill_transformation(runs, config, workers):
+    """
+    Backfill of Transformation process: input and aggregation stages once, following stages per date.
+    :param runs: list of dict; Command line arguments mapping of every date
+    :param config: dict; Configuration mapping
+    :param workers: int; Number of dates run concurrently
+    :return: list of str; Paths of the written output files, in order of dates
+    """
+    stages = [_prepare_transformation(date_args, copy.deepcopy(config)) for date_args in runs]
+    chunk_size = None if _whole_input(runs[0], stages[0], TRANSFORMATION_CHUNK_SECTIONS) else \
+        miscu.eval_elem_mapping(runs[0], 'chunk_size',
+                                default_value=miscu.eval_elem_mapping(stages[0]['input_read'], 'chunk_size'))
+    if chunk_size:
+        df_target = _aggregate_chunks(stages[0], chunk_size)
+    else:
+        df_target = _run_steps(next(_read_frames(stages[0]['input_read'])), _aggregation_steps(stages[0]))
+    return _fan_out(df_target, [functools.partial(_write_steps, _transformation_steps(date_stages),
+                                                  date_stages['output_write']) for date_stages in stages], workers)
+
+
+def _backfill_pipeline(args, config, dates, workers):
+    """
+    Backfill of Pipeline process: Extraction up to mapping once, then Extraction assignment and the whole
+    Transformation per date. When Extraction assigns none of the backfilled arguments, its result is the same for
+    every date: Extraction and aggregation then run once, and the intermediate file (if any) is written once, as given.
+    :param args: dict; Command line arguments mapping, with dates as given
+    :param config: dict; Configuration mapping, with <extraction> and <transformation> sections
+    :param dates: list of dict; Values of backfilled arguments for every date, see _backfill_dates
+    :param workers: int; Number of dates run concurrently
+    :return: list of str; Paths of the written output files, in order of dates
+    """
+    extraction_assign = miscu.eval_elem_mapping(config['extraction'], 'assign')
+    extraction_dated = any(args_key in dates[0] for args_key in
+                           miscu.eval_elem_mapping(extraction_assign, 'col_var', default_value=dict()).values())
+    intermediate_path = miscu.eval_elem_mapping(args, 'intermediate_path')
+    extraction_stages = [_prepare_extraction(
+        dict(args, **date_values,
+             output_path=_backfill_path(intermediate_path, date_values) if extraction_dated else intermediate_path),
+        copy.deepcopy(config['extraction'])) for date_values in (dates if extraction_dated else dates[:1])]
+    transformation_stages = [_prepare_transformation(dict(args, **date_values, output_path=_backfill_path(
+        args['output_path'], date_values)), copy.deepcopy(config['transformation'])) for date_values in dates]
+    df_mapping = _read_mapping(extraction_stages[0])
+    df_target = _run_steps(next(_read_frames(extraction_stages[0]['input_read'])),
+                           _mapping_steps(extraction_stages[0], lambda: df_mapping))
+
+    def aggregate(df, date_extraction_stages, date_transformation_stages):
+        df = _run_steps(df, _assignment_steps(date_extraction_stages))
+        if intermediate_path:
+            _write_chunk(df, date_extraction_stages['output_write'], None)
+        # Transformation works on its own shallow copy, so the intermediate result is left untouched.
+        df = _to_transformation_input(df.copy(deep=False), date_transformation_stages)
+        return _run_steps(df, _aggregation_steps(date_transformation_stages))
+
+    def transform(df, date_extraction_stages, date_transformation_stages):
+        if date_extraction_stages is not None:
+            df = aggregate(df, date_extraction_stages, date_transformation_stages)
+        return _write_steps(_transformation_steps(date_transformation_stages),
+                            date_transformation_stages['output_write'], df)
+
+    if not extraction_dated:
+        df_target = aggregate(df_target, extraction_stages[0], transformation_stages[0])
+        extraction_stages = [None] * len(dates)
+    return _fan_out(df_target, [functools.partial(transform, date_extraction_stages=date_extraction_stages,
+                                                  date_transformation_stages=date_transformation_stages)
+                                for date_extraction_stages, date_transformation_stages
+                                in zip(extraction_stages, transformation_stages)], workers)
+
+
+def _write_steps(steps, write_config, df):
+    """
+    Run given steps on a dataframe, then write the result
+    :param steps: list of tuple; Steps, see _run_steps
+    :param write_config: dict; Provided <output.write> configuration section
+    :param df: pd.DataFrame; Provided dataframe
+    :return: str; Path of the written output file
+    """
+    return _write_chunk(_run_steps(df, steps), write_config, None)
+
+
+def _fan_out(df, branches, workers):
+    """
+    Run branches on shallow copies of a shared dataframe concurrently, in threads running in a copy of the current
+    context (e.g. to measure stages). Stages assign or replace whole columns, so that the shared dataframe is left
+    untouched.
+    :param df: pd.DataFrame; Shared dataframe
+    :param branches: list of callable; Called with a shallow copy of the dataframe, returns the written output path
+    :param workers: int; Number of branches run concurrently
+    :return: list; Values returned by branches, in order
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(branches))),
+                            thread_name_prefix='opendata-backfill') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, branch, df.copy(deep=False)) for branch in branches]
+        return [future.result() for future in futures]
+
+
+def _backfill_dates(args):
+    """
+    Expand backfilled arguments (see BACKFILL_ARGS) given as a list of dates ('10222020,10232020'), an inclusive range
+    of days ('10012020:10312020'), or both ('10012020:10052020,10302020'), into the values of every date.
+    Arguments given as a single date are left as they are; several backfilled arguments are paired in order, so they
+    must expand to the same number of dates.
+    :param args: dict; Command line arguments mapping
+    :return: list of dict; Values of backfilled arguments for every date, None if no argument is backfilled
+    """
+    expanded = dict()
+    for dest in BACKFILL_ARGS:
+        value = args.get(dest)
+        if isinstance(value, str) and (BACKFILL_LIST_SEPARATOR in value or BACKFILL_RANGE_SEPARATOR in value):
+            expanded[dest] = _expand_dates(value, dest)
+    if not expanded:
+        return None
+    lengths = {dest: len(values) for dest, values in expanded.items()}
+    if len(set(lengths.values())) > 1:
+        logging.error(f'Backfilled arguments expand to different numbers of dates: <{lengths}>')
+        raise ValueError(f'Backfilled arguments expand to different numbers of dates: <{lengths}>')
+    return [dict(zip(expanded.keys(), values)) for values in zip(*expanded.values())]
+
+
+def _expand_dates(value, dest):
+    """
+    Expand a list or range of dates, see _backfill_dates.
+    :param value: str; Provided argument value
+    :param dest: str; Argument destination, for error reporting
+    :return: list of str; Dates, formatted as BACKFILL_DATE_FORMAT
+    """
+    dates = list()
+    for item in value.split(BACKFILL_LIST_SEPARATOR):
+        bounds = item.strip().split(BACKFILL_RANGE_SEPARATOR)
+        try:
+            start, end = (datetime.strptime(bound.strip(), BACKFILL_DATE_FORMAT) for bound in (bounds[0], bounds[-1]))
+        except ValueError:
+            logging.error(f'Argument <{dest}> holds <{item}>, neither a date nor a range of dates '
+                          f'(formatted as <{BACKFILL_DATE_FORMAT}>)')
+            raise ValueError(f'Argument <{dest}> holds <{item}>, neither a date nor a range of dates '
+                             f'(formatted as <{BACKFILL_DATE_FORMAT}>)')
+        if len(bounds) > 2 or end < start:
+            logging.error(f'Argument <{dest}> holds an invalid range of dates: <{item}>')
+            raise ValueError(f'Argument <{dest}> holds an invalid range of dates: <{item}>')
+        dates += [(start + timedelta(days=day)).strftime(BACKFILL_DATE_FORMAT) for day in range((end - start).days + 1)]
+    return dates
+
+
+def _backfill_path(path, date_values):
+    """
+    Output path of a backfilled date: fields of the path (e.g. '/data/out/ext_{run_date}.csv') are replaced with
+    the date, otherwise the date is appended to the file name root (e.g. '/data/out/ext_10222020.csv').
+    :param path: str; Provided output path, None if there is none
+    :param date_values: dict; Values of backfilled arguments for the date
+    :return: str; Output path of the date
+    """
+    if not path:
+        return path
+    if '{' in path:
+        return path.format(**date_values)
+    root, ext = fileu.split_ext(path)
+    return f'{root}_{"_".join(date_values.values())}{ext}'
+
+
+def run_batch(manifest_path, workers=None, log_path=None, prometheus=False):
+    """
+    Batch process: run every job of given manifest within this interpreter.
+    Independent jobs run concurrently; a job whose <-input> or <-mapping> is the <-output> of another job,
+    or which lists it in <depends_on>, runs once that job has succeeded, reading the file it actually wrote.
+    :param manifest_path: str; Fully qualified manifest file name
+    :param workers: int, default=None; Number of jobs running concurrently, number of CPUs if not given
+    :param log_path: str, default=None; Fully qualified logging file, locating metrics files of jobs without <-log>
+    :param prometheus: bool, default=False; Also write metrics of every job as Prometheus textfile
+    :return: int; RETURN_SUCCESS if every job succeeded, RETURN_FAILURE otherwise
+    Sample:
+    {
+        "jobs": [
+            {"name": "ext", "process": "wendizhang_extraction", "args": {"-input": "in.csv", "-output": "ext.csv"}},
+            {"name": "trf", "process": "wendizhang_transformation", "args": {"-input": "ext.csv", "-output": "trf.csv"}}
+        ]
+    }
+    """
+    with open(manifest_path) as file_manifest:
+        manifest = json.load(file_manifest)
+
+    jobs = list()
+    for job_config in manifest['jobs']:
+        job_args = job_config.get('args', dict())
+        jobs.append({'name': job_config.get('name', job_config['process']),
+                     'argv': _job_argv(job_config, log_path, prometheus),
+                     'inputs': [os.path.abspath(job_args[key]) for key in ('-input', '-mapping')
+                                if isinstance(job_args, dict) and key in job_args],
+                     'outputs': [os.path.abspath(job_args['-output'])]
+                     if isinstance(job_args, dict) and '-output' in job_args else list(),
+                     'depends_on': job_config.get('depends_on', list())})
+
+    results = batchu.run_jobs(jobs, _run_batch_job, workers=workers or os.cpu_count())
+    summary = batchu.format_summary(results)
+    logging.info(summary)
+    print(summary)
+    return RETURN_SUCCESS if all(result['return_code'] == RETURN_SUCCESS for result in results) else RETURN_FAILURE
+
+
+def _job_argv(job_config, log_path=None, prometheus=False):
+    """
+    Command line of a job given as in a batch manifest.
+    :param job_config: dict; Provided job, with <process> and optional <args> elements, see run_batch
+    :param log_path: str, default=None; Fully qualified logging file, used unless the job gives its own <-log>
+    :param prometheus: bool, default=False; Also write metrics of the job as Prometheus textfile
+    :return: list; Command line arguments
+    """
+    job_args = job_config.get('args', dict())
+    job_argv = ['-process', job_config['process']]
+    for key, value in (job_args.items() if isinstance(job_args, dict) else [(arg, None) for arg in job_args]):
+        # Flags are given either as true values in a mapping, or as plain elements of a list.
+        job_argv += [key] if value is True or value is None else [key, str(value)]
+    if log_path and '-log' not in job_argv:
+        job_argv += ['-log', log_path]
+    if prometheus and '-prometheus' not in job_argv:
+        job_argv += ['-prometheus']
+    return job_argv
+
+
+def _run_batch_job(job, upstream):
+    """
+    Run a single batch job, reading outputs of upstream jobs from the paths they actually wrote.
+    :param job: dict; Provided job, see run_batch
+    :param upstream: dict; Mapping of upstream job name to its (declared, written) output paths
+    :return: tuple; Declared and written output paths of this job
+    """
+    written = {declared: path for declared, path in upstream.values() if path}
+    job_argv = list(job['argv'])
+    for index, value in enumerate(job_argv[:-1]):
+        if value in ('-input', '-mapping') and os.path.abspath(job_argv[index + 1]) in written:
+            job_argv[index + 1] = written[os.path.abspath(job_argv[index + 1])]
+
+    args, process_name, process_type, process_config = _interpret_args(job_argv)
+    output_path = run_process(args, process_type, process_config)
+    return (job['outputs'][0] if job['outputs'] else None), output_path
+
+
+def _interpret_batch_args(argv):
+    """
+    Read and parse command line arguments of batch manifest mode.
+    :param argv: Given argument parameters.
+    :return: argparse.Namespace; Parsed arguments
+    """
+    arg_parser = argparse.ArgumentParser(APP)
+    arg_parser.add_argument('-log', dest='log_path', help='Fully qualified logging file')
+    arg_parser.add_argument('-prometheus', dest='prometheus', action='store_true',
+                            help='Also write per-stage metrics as Prometheus textfile, next to logging file')
+    arg_parser.add_argument('-batch', dest='batch_path', help='Fully qualified batch manifest file', required=True)
+    arg_parser.add_argument('-batch_workers', dest='batch_workers', type=int,
+                            help='Number of batch jobs running concurrently')
+    return arg_parser.parse_args(argv)
+
+
+def run_daemon(spec_path, workers=None, log_path=None, prometheus=False):
+    """
+    Daemon process: keep running jobs submitted through watched drop directories and a local Unix socket, until
+    SIGINT or SIGTERM, see daemonu.serve.
+    Pandas is imported once; compiled configs, resolved plugins and mapping dataframes are kept in memory, configs and
+    mapping tables being loaded again once their files change, so that a job only reads and writes its own files.
+    A file dropped into a watched directory runs the process of its watch on it (as <-input>); <args> values may refer
+    to the file as {path}, {name} (base name) or {stem} (base name without extension). A socket request is a job
+    given as in a batch manifest, see run_batch.
+    :param spec_path: str; Fully qualified daemon specification file name
+    :param workers: int, default=None; Number of jobs running concurrently, <workers> of specification or number of
+                    CPUs if not given
+    :param log_path: str, default=None; Fully qualified logging file, locating metrics files of jobs without <-log>
+    :param prometheus: bool, default=False; Also write metrics of every job as Prometheus textfile
+    :return: int; RETURN_SUCCESS once stopped
+    Sample:
+    {
+        "socket": "/run/opendata/opendata.sock",
+        "workers": 4,
+        "queue_size": 64,
+        "poll_interval": 0.5,
+        "watch": [
+            {"path": "/data/drop", "pattern": "*.csv", "process": "wendizhang_extraction",
+             "args": {"-output": "/data/out/{stem}_ext.csv", "-mapping": "/data/mapping.csv", "-run_date": "10222020",
+                      "-description": "wendizhang", "-prop_date": "10222020"},
+             "done_dir": "/data/drop/done", "error_dir": "/data/drop/error"}
+        ]
+    }
+    """
+    with open(spec_path) as file_spec:
+        spec = json.load(file_spec)
+
+    watches = list()
+    for watch_config in spec.get('watch', list()):
+        if not watch_config.get('path') or not watch_config.get('process'):
+            logging.error(f'Watch <{watch_config}> of daemon specification has no <path> or <process> element')
+            raise KeyError(f'Watch <{watch_config}> of daemon specification has no <path> or <process> element')
+        watches.append({'path': watch_config['path'], 'pattern': watch_config.get('pattern'),
+                        'done_dir': watch_config.get('done_dir'), 'error_dir': watch_config.get('error_dir'),
+                        'job': functools.partial(_daemon_file_job, watch_config, log_path, prometheus)})
+
+    # Warm state: ETL features (pandas) are imported before the first job, configs and mapping tables are memoized.
+    cacheu.enable_memo()
+    logging.info(f'ETL features imported from <{etlu.__file__}>')
+    daemon_status = daemonu.serve(_run_daemon_job, watches=watches, socket_path=spec.get('socket'),
+                                  socket_job=functools.partial(_daemon_socket_job, log_path, prometheus),
+                                  workers=workers or spec.get('workers') or os.cpu_count(),
+                                  queue_size=spec.get('queue_size') or daemonu.DEFAULT_QUEUE_SIZE,
+                                  poll_interval=spec.get('poll_interval') or daemonu.DEFAULT_POLL_INTERVAL)
+    summary = daemonu.format_status(daemon_status)
+    logging.info(summary)
+    print(summary)
+    return RETURN_SUCCESS
+
+
+def _daemon_file_job(watch_config, log_path, prometheus, path):
+    """
+    Build the job of a file dropped into a watched directory.
+    :param watch_config: dict; Watch of daemon specification, see run_daemon
+    :param log_path: str; Fully qualified logging file, used unless the watch gives its own <-log>
+    :param prometheus: bool; Also write metrics of the job as Prometheus textfile
+    :param path: str; Fully qualified name of the dropped file
+    :return: dict; Job with <name> and <argv> elements
+    """
+    name = os.path.basename(path)
+    fields = {'path': path, 'name': name, 'stem': fileu.split_ext(name)[0]}
+    job_args = {key: value.format(**fields) if isinstance(value, str) else value
+                for key, value in watch_config.get('args', dict()).items()}
+    job_args['-input'] = path
+    return {'name': f'{watch_config["process"]}:{name}',
+            'argv': _job_argv(dict(watch_config, args=job_args), log_path, prometheus)}
+
+
+def _daemon_socket_job(log_path, prometheus, request):
+    """
+    Build the job of a socket request.
+    :param log_path: str; Fully qualified logging file, used unless the request gives its own <-log>
+    :param prometheus: bool; Also write metrics of the job as Prometheus textfile
+    :param request: dict; Job given as in a batch manifest, see run_batch
+    :return: dict; Job with <name> and <argv> elements
+    """
+    if not isinstance(request, dict) or not request.get('process'):
+        raise KeyError('Request has no <process> element')
+    return {'name': request.get('name', request['process']), 'argv': _job_argv(request, log_path, prometheus)}
+
+
+def _run_daemon_job(job):
+    """
+    Run a single daemon job.
+    :param job: dict; Provided job, see _daemon_file_job and _daemon_socket_job
+    :return: str; Path of the written output file
+    """
+    args, process_name, process_type, process_config = _interpret_args(job['argv'])
+    return run_process(args, process_type, process_config)
+
+
+def _interpret_daemon_args(argv):
+    """
+    Read and parse command line arguments of daemon mode.
+    :param argv: Given argument parameters.
+    :return: argparse.Namespace; Parsed arguments
+    """
+    arg_parser = argparse.ArgumentParser(APP)
+    arg_parser.add_argument('-log', dest='log_path', help='Fully qualified logging file')
+    arg_parser.add_argument('-prometheus', dest='prometheus', action='store_true',
+                            help='Also write per-stage metrics as Prometheus textfile, next to logging file')
+    arg_parser.add_argument('-daemon', dest='daemon_path', help='Fully qualified daemon specification file',
+                            required=True)
+    arg_parser.add_argument('-daemon_workers', dest='daemon_workers', type=int,
+                            help='Number of daemon jobs running concurrently')
+    return arg_parser.parse_args(argv)
+
+
 def _interpret_args(argv):
     """
     Read, parse, and interpret given command line arguments.
@@ -58,38 +595,690 @@ def _interpret_args(argv):
     """
     arg_parser = argparse.ArgumentParser(APP)
     arg_parser.add_argument('-log', dest='log_path', help='Fully qualified logging file')
+    arg_parser.add_argument('-prometheus', dest='prometheus', action='store_true',
+                            help='Also write per-stage metrics as Prometheus textfile, next to logging file')
     arg_parser.add_argument('-process', dest='process', help='Process type', required=True)
+    arg_parser.add_argument('-chunk_size', dest='chunk_size', type=int,
+                            help='Number of input rows per chunk; streams input when given')
+    arg_parser.add_argument('-workers', dest='workers', type=int,
+                            help='Number of worker processes running Extraction stages in parallel')
+    arg_parser.add_argument('-no_mapping_cache', dest='no_mapping_cache', action='store_true',
+                            help='Bypass persistent cache of mapping dataframes')
+    arg_parser.add_argument('-clear_mapping_cache', dest='clear_mapping_cache', action='store_true',
+                            help='Clear persistent cache of mapping dataframes before running')
+    arg_parser.add_argument('-intermediate', dest='intermediate_path',
+                            help='Extraction output data path, optionally written by Pipeline in background')
+    arg_parser.add_argument('-explain', dest='explain', action='store_true',
+                            help='Print optimized plan of the process instead of running it')
+    arg_parser.add_argument('-no_cache', '-no-cache', dest='no_cache', action='store_true',
+                            help='Bypass content-addressed cache of stage outputs, configured by <cache> config '
+                                 'section (path, default ~/.cache/opendata/stage; max_size_mb, default 1024)')
+    arg_parser.add_argument('-incremental', dest='incremental', action='store_true',
+                            help='Process only input records appended since the previous run of the process')
+    arg_parser.add_argument('-state_dir', dest='state_dir',
+                            help='Directory of incremental state files, one per process name')
+    arg_parser.add_argument('-profile', dest='profile', action='store_true',
+                            help='Profile every workflow stage, writing pstats and collapsed stacks (flamegraph input)')
+    arg_parser.add_argument('-profile_mode', dest='profile_mode', choices=profileu.PROFILE_MODES,
+                            default=profileu.MODE_DETERMINISTIC,
+                            help='Profiling mode: cProfile per stage, or low overhead periodic stack sampling')
+    arg_parser.add_argument('-profile_dir', dest='profile_dir',
+                            help='Directory of profiles, <log root>.profile next to logging file by default')
+    arg_parser.add_argument('-validate', dest='validate', action='store_true',
+                            help='Dry run: validate configuration, plugins and paths without reading any record')
+
+    # Without a process there is no configuration to read: parser prints help or reports missing arguments.
+    if '-process' not in argv[:-1]:
+        return arg_parser.parse_args(argv), None, None, None
 
     # Extract and interpret rest of the arguments, using static config file, based on given specific feature.
     process_arg = argv[argv.index('-process') + 1]
     process_args = process_arg.rsplit('_', 1)
     process_name = process_args[0]
-    process_type = process_args[1]
+    process_type = process_args[1] if len(process_args) > 1 else None
     current_path = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
-    with open(os.path.join(current_path, f'../config/{process_name}.json')) as file_config:
-        mapping_config = json.load(file_config, object_hook=lambda d: Namespace(**d))
-        if process_type == 'extraction':
-            process_config = vars(mapping_config.extraction)
-        elif process_type == 'transformation':
-            process_config = vars(mapping_config.transformation)
-
-        feature_args = vars(mapping_config.feature_args)
-        # Add necessary arguments to <arg_parser> instance, using static JSON-based configuration.
-        if feature_args:
-            for key, value in feature_args.items():
-                if isinstance(value, Namespace):
-                    value = vars(value)
-                arg_parser.add_argument(key, dest=value['dest'], help=value['help'], required=value['required'])
+    mapping_config = _load_config(os.path.join(current_path, f'../config/{process_name}.json'))
+    if process_type in ('extraction', 'transformation'):
+        process_config = _config_section(mapping_config, process_type, process_name)
+    elif process_type == 'pipeline':
+        process_config = {'extraction': _config_section(mapping_config, 'extraction', process_name),
+                          'transformation': _config_section(mapping_config, 'transformation', process_name)}
+    else:
+        process_config = dict()
+
+    # Add necessary arguments to <arg_parser> instance, using static JSON-based configuration.
+    for key, value in mapping_config['feature_args'].items():
+        arg_parser.add_argument(key, dest=value['dest'], help=value['help'], required=value['required'])
     return arg_parser.parse_args(argv), process_name, process_type, process_config
 
 
+def _load_config(config_path):
+    """
+    Load a process configuration file, compiled into plain mappings and validated (see _compile_config).
+    Compiled configuration is cached under the hash of the file content, so that an unchanged file is neither parsed
+    nor validated again; the hash itself is only computed again once the file is modified. Long-running processes
+    (see cacheu.enable_memo) keep it in memory, until the file is modified.
+    :param config_path: str; Fully qualified config file name
+    :return: dict; Compiled configuration mapping, a fresh copy which the caller may update
+    """
+    try:
+        mapping_config = cacheu.memoize(f'config:{os.path.realpath(config_path)}',
+                                        lambda: cacheu.file_signature(config_path),
+                                        lambda: _load_compiled_config(config_path))
+    except FileNotFoundError:
+        logging.error(f'Config file of the process does not exist: <{config_path}>')
+        raise FileNotFoundError(f'Config file of the process does not exist: <{config_path}>')
+    return copy.deepcopy(mapping_config)
+
+
+def _load_compiled_config(config_path):
+    """
+    Load a process configuration file through the cache of compiled configurations, see _load_config.
+    :param config_path: str; Fully qualified config file name
+    :return: dict; Compiled configuration mapping
+    """
+    digest = cacheu.file_digest(config_path, cacheu.CONFIG_CACHE_DIR)
+    key = cacheu.make_key('config', CONFIG_COMPILE_VERSION, digest)
+    mapping_config = cacheu.load(cacheu.CONFIG_CACHE_DIR, key)
+    if mapping_config is None:
+        with open(config_path) as file_config:
+            mapping_config = _compile_config(json.load(file_config), config_path)
+        cacheu.store(cacheu.CONFIG_CACHE_DIR, key, mapping_config)
+    return mapping_config
+
+
+def _compile_config(mapping_config, config_path):
+    """
+    Validate a parsed configuration file and compile it into the form used by processes:
+    feature arguments get every element the parser needs, with <required> turned into a boolean.
+    :param mapping_config: dict; Parsed configuration file
+    :param config_path: str; Fully qualified config file name, for error reporting
+    :return: dict; Compiled configuration mapping
+    """
+    if not isinstance(mapping_config, dict):
+        logging.error(f'Config file <{config_path}> does not hold a mapping')
+        raise ValueError(f'Config file <{config_path}> does not hold a mapping')
+    feature_args = dict()
+    for key, value in miscu.eval_elem_mapping(mapping_config, 'feature_args', default_value=dict()).items():
+        if not isinstance(value, dict) or not value.get('dest'):
+            logging.error(f'Feature argument <{key}> of config file <{config_path}> has no <dest> element')
+            raise ValueError(f'Feature argument <{key}> of config file <{config_path}> has no <dest> element')
+        feature_args[key] = {'dest': value['dest'], 'help': value.get('help'),
+                             'required': str(value.get('required')).lower() == 'true'}
+    for section in ('extraction', 'transformation'):
+        if section in mapping_config and not isinstance(mapping_config[section], dict):
+            logging.error(f'Section <{section}> of config file <{config_path}> is not a mapping')
+            raise ValueError(f'Section <{section}> of config file <{config_path}> is not a mapping')
+    return dict(mapping_config, feature_args=feature_args)
+
+
+def _config_section(mapping_config, section, process_name):
+    """
+    Select a process section of a compiled configuration.
+    :param mapping_config: dict; Compiled configuration mapping, see _load_config
+    :param section: str; Section name, either 'extraction' or 'transformation'
+    :param process_name: str; Process name, for error reporting
+    :return: dict; Configuration section
+    """
+    if section not in mapping_config:
+        logging.error(f'Config file of <{process_name}> has no <{section}> section')
+        raise KeyError(f'Config file of <{process_name}> has no <{section}> section')
+    return mapping_config[section]
+
+
 def run_extraction(args, config):
     """
     Extraction process
+    Input is processed either whole or, when <chunk_size> is given (command line or <input.read> config section),
+    streamed in chunks of rows through the same row-local stages and appended to a single output file.
+    :param args: dict; Command line arguments mapping
+    :param config: dict; Configuration mapping
+    :return: str; Path of the written output file
+    """
+    stages = _prepare_extraction(args, config)
+    if miscu.eval_elem_mapping(args, 'explain'):
+        print(planu.explain(stages['plan'], 'Extraction plan'))
+        return None
+    if miscu.eval_elem_mapping(args, 'validate'):
+        print(_validate('Extraction', [stages['input_read']] + _mapping_reads(stages), [stages['output_write']]))
+        return None
+
+    if miscu.eval_elem_mapping(args, 'clear_mapping_cache'):
+        mapping_cache_config = miscu.eval_elem_mapping(stages['mapping'], 'cache')
+        cacheu.clear(miscu.eval_elem_mapping(mapping_cache_config, 'path', default_value=cacheu.READ_CACHE_DIR))
+
+    whole_input = _whole_input(args, stages, EXTRACTION_CHUNK_SECTIONS)
+    if miscu.eval_elem_mapping(args, 'incremental') and not whole_input and _incremental_supported(stages):
+        return _run_extraction_incremental(args, stages)
+
+    chunk_size = None if whole_input else miscu.eval_elem_mapping(
+        args, 'chunk_size', default_value=miscu.eval_elem_mapping(stages['input_read'], 'chunk_size'))
+    workers = 1 if whole_input else miscu.eval_elem_mapping(args, 'workers', default_value=1)
+    if workers > 1:
+        return _run_extraction_parallel(stages, int(chunk_size or DEFAULT_WORKER_CHUNK_SIZE), workers)
+
+    # Whole input goes through stage cache, unless it is bypassed; mapping is then read only if mapping stage runs.
+    stage_cache_config = _stage_cache(args, config)
+    if not chunk_size and stage_cache_config is not None:
+        steps = _extraction_steps(stages, functools.cache(lambda: _read_mapping(stages)))
+        return _run_cached(stages['input_read'], steps, stages['output_write'], stage_cache_config)
+
+    # Read mapping dataframe only once, so that it can be shared by every chunk.
+    df_mapping = _read_mapping(stages)
+
+    # Chunks are written in background while next ones are extracted.
+    with _chunk_writer(stages['output_write']) as output:
+        for df_frame in _read_frames(stages['input_read'], chunk_size):
+            output.put(_extract_frame(df_frame, stages, df_mapping))
+    return output.path
+
+
+def _run_extraction_incremental(args, stages):
+    """
+    Incremental Extraction: process only input records appended since the previous run and append them to its output.
+    Runs in full (into a new output file) when the state of the previous run cannot be resumed, see watermarku.resume.
+    :param args: dict; Command line arguments mapping
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :return: str; Path of the output file
+    """
+    state_path, fingerprint, watermark = _resume_incremental(args, stages)
+    if not watermark['full'] and watermark['start'] == watermark['end']:
+        logging.info('No input records appended since previous run')
+        return watermark['output_path']
+
+    df_mapping = _read_mapping(stages)
+    input_read_config = dict(stages['input_read'], byte_range=[watermark['start'], watermark['end']])
+    df_target = next(_read_frames(input_read_config))
+    rows = metricsu.rows(df_target)
+    df_target = _extract_frame(df_target, stages, df_mapping)
+    output_path = _write_chunk(df_target, stages['output_write'], watermark['output_path'])
+    watermarku.commit(state_path, watermark, input_read_config['path'], fingerprint, rows, output_path)
+    return output_path
+
+
+def _whole_input(args, stages, sections):
+    """
+    Check whether plugins of given config sections need the whole input (global scope, see registryu.plugin),
+    which rules out incremental, chunked and parallel runs.
+    :param args: dict; Command line arguments mapping
+    :param stages: dict; Prepared configuration sections, with their plan
+    :param sections: tuple; Names of config sections whose plugins would run chunk by chunk
+    :return: bool; True if input must be processed whole
+    """
+    global_plugins = [node['func'] for node in stages['plan'] if node['op'] == 'plugin' and node['name'] in sections
+                      and node['scope'] == registryu.SCOPE_GLOBAL]
+    chunked = miscu.eval_elem_mapping(args, 'incremental') or miscu.eval_elem_mapping(args, 'chunk_size') or \
+        miscu.eval_elem_mapping(stages['input_read'], 'chunk_size') or miscu.eval_elem_mapping(args, 'workers', 1) > 1
+    if global_plugins and chunked:
+        logging.warning(f'Plugins <{global_plugins}> need the whole input; running on whole input')
+    return bool(global_plugins)
+
+
+def _validate(title, read_configs, write_configs):
+    """
+    Dry run of a process: check every file it would read and write, without reading any record (nor importing pandas).
+    Configuration sections are validated by then, they are prepared and their plugins resolved by the plan compiler.
+    :param title: str; Process title, e.g. 'Extraction'
+    :param read_configs: list of dict; Read configuration mappings, e.g. <input.read> and <mapping.read>
+    :param write_configs: list of dict; Write configuration mappings, e.g. <output.write>
+    :return: str; Validation summary
+    """
+    lines = [f'{title} is valid:']
+    for config in read_configs + write_configs:
+        path = miscu.eval_elem_mapping(config, 'path')
+        file_type = miscu.eval_elem_mapping(config, 'file_type', default_value='excel')
+        if file_type.lower() not in fileu.FILE_EXTENSIONS:
+            logging.error(f'File type <{file_type}> of <{path}> is not supported')
+            raise ValueError(f'File type <{file_type}> of <{path}> is not supported')
+        compression = miscu.eval_elem_mapping(config, 'compression')
+        if config in read_configs:
+            paths = fileu.expand_paths(path, file_type)
+            for source_path in paths:
+                fileu.validate_path(source_path)
+                fileu.compression_of(source_path, file_type, compression)
+            lines.append(f'  read  {file_type:<8} {len(paths):>5} file(s)  {path}')
+        else:
+            fileu.compression_of(path, file_type, compression)
+            if not miscu.eval_elem_mapping(config, 'partition_by'):
+                fileu.validate_path(os.path.dirname(os.path.abspath(path)), isfile=False)
+            lines.append(f'  write {file_type:<8} {"":>13}  {path}')
+    return '\n'.join(lines)
+
+
+def _incremental_supported(stages):
+    """
+    Check whether a process can run incrementally: records are appended to a single uncompressed csv input file and
+    (Extraction) to a single csv output file.
+    :param stages: dict; Prepared configuration sections
+    :return: bool; True if process can run incrementally
+    """
+    input_type = miscu.eval_elem_mapping(stages['input_read'], 'file_type', default_value='excel')
+    output_type = miscu.eval_elem_mapping(stages['output_write'], 'file_type', default_value='excel')
+    if input_type.lower() != 'csv' or output_type.lower() != 'csv':
+        logging.warning(f'Incremental run needs csv input and output, not <{input_type}> and <{output_type}>; '
+                        f'running in full')
+        return False
+    input_path = miscu.eval_elem_mapping(stages['input_read'], 'path')
+    if etlu.source_paths(stages['input_read']) != [input_path] or \
+            miscu.eval_elem_mapping(stages['output_write'], 'partition_by'):
+        logging.warning('Incremental run needs a single input file and an unpartitioned output; running in full')
+        return False
+    if fileu.compression_of(input_path, input_type, miscu.eval_elem_mapping(stages['input_read'], 'compression')):
+        logging.warning('Incremental run needs an uncompressed input file, byte offsets of compressed ones cannot be '
+                        'resumed from; running in full')
+        return False
+    if 'aggregate' in stages and not stages['aggregate']:
+        logging.warning('Incremental Transformation needs <aggregate> config section; running in full')
+        return False
+    return True
+
+
+def _resume_incremental(args, stages):
+    """
+    Resume incremental run of a process from its state file.
+    State is only resumed with the same configuration: every prepared section (command line arguments injected)
+    and the mapping file, if any, take part in its fingerprint.
+    :param args: dict; Command line arguments mapping
+    :param stages: dict; Prepared configuration sections
+    :return: tuple; State file name, configuration fingerprint and watermark (see watermarku.resume)
+    """
+    state_path = watermarku.state_path(miscu.eval_elem_mapping(args, 'state_dir'), args['process'])
+    mapping_paths = [miscu.eval_elem_mapping(read_config, 'path') for read_config in _mapping_reads(stages)]
+    fingerprint = cacheu.make_key({key: value for key, value in stages.items() if key != 'plan'},
+                                  *[cacheu.file_signature(path) if path else None for path in mapping_paths])
+    input_path = miscu.eval_elem_mapping(stages['input_read'], 'path')
+    return state_path, fingerprint, watermarku.resume(state_path, input_path, fingerprint)
+
+
+def _run_extraction_parallel(stages, chunk_size, workers):
+    """
+    Run Extraction stages on row ranges of the input in a pool of worker processes.
+    Results are written in the original row order; the number of chunks in flight is bounded by the pool size.
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :param chunk_size: int; Number of input rows per chunk
+    :param workers: int; Number of worker processes
+    :return: str; Path of the written output file
+    """
+    pending = deque()
+    chunks = _measure_frames(etlu.read_chunks_feature(stages['input_read'], chunk_size, apply_dtype=False),
+                             stages['input_read'])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_extraction_worker,
+                             initargs=(stages,)) as executor, _chunk_writer(stages['output_write']) as output:
+        for df_chunk in chunks:
+            pending.append(executor.submit(_extract_worker_frame, df_chunk))
+            if len(pending) >= 2 * workers:
+                output.put(pending.popleft().result())
+        while pending:
+            output.put(pending.popleft().result())
+    return output.path
+
+
+def _init_extraction_worker(stages):
+    """
+    Initialize Extraction worker process: keep prepared stages and read mapping dataframe once per worker
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :return: null
+    """
+    _worker_state['stages'] = stages
+    _worker_state['df_mapping'] = etlu.read_mapping_feature(stages['mapping'], stages['mapping_cache'])
+
+
+def _extract_worker_frame(df):
+    """
+    Apply input data types and run Extraction stages on a chunk, inside an Extraction worker process
+    :param df: pd.DataFrame; Provided raw input chunk
+    :return: pd.DataFrame; Resulted dataframe, ready to be written
+    """
+    stages = _worker_state['stages']
+    df_target = etlu.apply_read_dtype_feature(df, stages['input_read'])
+    return _extract_frame(df_target, stages, _worker_state['df_mapping'])
+
+
+def _write_chunk(df, write_config, output_path, mode='append'):
+    """
+    Write a chunk of output: the first chunk creates the output file (with header), the rest are appended to it.
+    :param df: pd.DataFrame; Provided output chunk
+    :param write_config: dict; Provided <output.write> configuration section
+    :param output_path: str; Path created by the first chunk, None if nothing was written yet
+    :param mode: str, default='append'; Write mode of an existing output file, either 'append' or 'overwrite'
+    :return: str; Path of the output file
+    """
+    size_before = metricsu.file_size(output_path) if mode == 'append' else 0
+    with metricsu.stage('write', rows_in=metricsu.rows(df)) as record:
+        if output_path is None:
+            output_path = etlu.write_feature(df, write_config)
+        else:
+            etlu.write_feature(df, dict(write_config, path=output_path), mode=mode)
+        record['bytes_written'] = metricsu.file_size(output_path) - size_before
+    return output_path
+
+
+@contextlib.contextmanager
+def _chunk_writer(write_config, output_path=None):
+    """
+    Write output chunks on a background thread, while next chunks are computed, see fileu.async_writer.
+    A new output is written into a temporary file, published under its (versioned) path once every chunk is written,
+    so that no reader sees a partial output; an existing output (output_path) or a partitioned one is written in place.
+    Csv outputs are appended chunk by chunk and a new parquet output gets a row group per chunk (see
+    fileu.parquet_writer); other outputs (feather, excel, partitioned parquet) cannot be appended to, their chunks
+    are kept and written at once.
+    Usage: with _chunk_writer(write_config) as output: output.put(df); ... then output.path is the written output
+    :param write_config: dict; Provided <output.write> configuration section
+    :param output_path: str, default=None; Path of an existing output to append chunks to, None for a new output
+    :return: Namespace; <put> callable and <path> of the output, None until every chunk is written
+    """
+    output = Namespace(put=None, path=output_path)
+    file_type = miscu.eval_elem_mapping(write_config, 'file_type', default_value='excel').lower()
+    tmp_path = None
+    if output_path is None and not miscu.eval_elem_mapping(write_config, 'partition_by'):
+        tmp_path = fileu.temp_path(miscu.eval_elem_mapping(write_config, 'path'))
+    written = list()
+    kept = list()
+    put_row_group = None
+
+    def write_file(df):
+        if tmp_path is None:
+            output.path = _write_chunk(df, write_config, output.path)
+        else:
+            _write_chunk(df, dict(write_config, path=tmp_path), tmp_path, mode='append' if written else 'overwrite')
+        written.append(True)
+
+    def write_frame(df):
+        if put_row_group is not None:
+            size_before = metricsu.file_size(tmp_path)
+            with metricsu.stage('write', rows_in=metricsu.rows(df)) as record:
+                put_row_group(df)
+                record['bytes_written'] = metricsu.file_size(tmp_path) - size_before
+            written.append(True)
+        elif file_type in fileu.APPENDABLE_FILE_TYPES:
+            write_file(df)
+        else:
+            kept.append(df)
+
+    try:
+        with contextlib.ExitStack() as exit_stack:
+            if file_type == 'parquet' and tmp_path is not None:
+                put_row_group = exit_stack.enter_context(
+                    fileu.parquet_writer(tmp_path, miscu.eval_elem_mapping(write_config, 'index')))
+            with fileu.async_writer(write_frame) as output.put:
+                yield output
+        if kept:
+            write_file(etlu.concat_feature(kept))
+        if tmp_path is not None and written:
+            output.path = fileu.publish_new(tmp_path, miscu.eval_elem_mapping(write_config, 'path'))
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_frames(read_config, chunk_size=None):
+    """
+    Read input, either whole or in chunks of rows, measuring it as <input> stage
+    :param read_config: dict; Provided <input.read> configuration section
+    :param chunk_size: int, default=None; Number of input rows per chunk, None to read the whole input
+    :return: generator of pd.DataFrame; Input dataframe or its chunks
+    """
+    if chunk_size:
+        frames = etlu.read_chunks_feature(read_config, int(chunk_size))
+    else:
+        frames = (etlu.read_feature(read_config) for _ in range(1))
+    return _measure_frames(frames, read_config)
+
+
+def _measure_frames(frames, read_config):
+    """
+    Measure reading of every frame of given iterable as <input> stage; file size is counted once as bytes read
+    :param frames: iterable of pd.DataFrame; Lazily read dataframes
+    :param read_config: dict; Provided read configuration section
+    :return: generator of pd.DataFrame; Same dataframes
+    """
+    frames = iter(frames)
+    bytes_read = sum(metricsu.file_size(path) for path in etlu.source_paths(read_config))
+    while True:
+        with metricsu.stage('input', bytes_read=bytes_read) as record:
+            df_frame = next(frames, None)
+            record['rows_out'] = metricsu.rows(df_frame)
+        if df_frame is None:
+            return
+        bytes_read = 0
+        yield df_frame
+
+
+def _count_rows(frames, record):
+    """
+    Count rows of every frame of given iterable into given stage record, as its <rows_in>
+    :param frames: iterable of pd.DataFrame; Lazily produced dataframes
+    :param record: dict; Stage metrics, see metricsu.stage
+    :return: generator of pd.DataFrame; Same dataframes
+    """
+    record['rows_in'] = 0
+    for df_frame in frames:
+        record['rows_in'] += metricsu.rows(df_frame) or 0
+        yield df_frame
+
+
+def _read_mapping(stages):
+    """
+    Read mapping dataframe (along with lookup ones, if any) through its persistent cache, measuring it as <input> stage
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :return: pd.DataFrame or list; Extracted mapping dataframe, or mapping and lookup dataframes,
+             see etlu.mapping_feature
+    """
+    read_configs = _mapping_reads(stages)
+    with metricsu.stage('input') as record:
+        def read_mapping():
+            record['bytes_read'] = sum(metricsu.file_size(path) for read_config in read_configs
+                                       for path in etlu.source_paths(read_config))
+            return etlu.read_mapping_feature(stages['mapping'], stages['mapping_cache'])
+
+        # Long-running processes keep mapping dataframes in memory, until a mapping file changes; bypassing the
+        # persistent cache bypasses them too.
+        if stages['mapping_cache'] is None:
+            df_mapping = read_mapping()
+        else:
+            df_mapping = cacheu.memoize(
+                cacheu.make_key('read_mapping', [{key: value for key, value in read_config.items()
+                                                  if key != 'description'} for read_config in read_configs]),
+                lambda: [_file_signatures(etlu.source_paths(read_config)) for read_config in read_configs],
+                read_mapping)
+        record['rows_out'] = sum(metricsu.rows(df_join) for df_join in
+                                 (df_mapping if isinstance(df_mapping, list) else [df_mapping]))
+    return df_mapping
+
+
+def _file_signatures(paths):
+    """
+    Signatures of given files, validating they exist, see cacheu.file_signature.
+    :param paths: list; Fully qualified file names
+    :return: list; File signatures
+    """
+    for path in paths:
+        fileu.validate_path(path)
+    return [cacheu.file_signature(path) for path in paths]
+
+
+def _mapping_reads(stages):
+    """
+    Read configuration sections of every mapping table: <mapping.read>, then <read> of every <mapping.lookups> element
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction or _prepare_transformation
+    :return: list of dict; Read configuration sections, none for Transformation
+    """
+    if 'mapping' not in stages:
+        return list()
+    return [join_config['read'] for join_config in planu.mapping_joins(stages['mapping'])]
+
+
+def _run_stage(name, feature, df, *feature_args, **feature_kwargs):
+    """
+    Run an ETL feature on given dataframe, measuring it as a stage
+    :param name: str; Stage name, e.g. 'mapping'
+    :param feature: callable; ETL feature, called as feature(df, *feature_args, **feature_kwargs)
+    :param df: pd.DataFrame; Provided dataframe
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    with metricsu.stage(name, rows_in=metricsu.rows(df)) as record:
+        df_target = feature(df, *feature_args, **feature_kwargs)
+        record['rows_out'] = metricsu.rows(df_target)
+    return df_target
+
+
+def _plugin_follows(stages, op):
+    """
+    Check whether a plugin runs after given stage of the plan, e.g. so that it gets plain columns.
+    :param stages: dict; Prepared configuration sections, with their plan
+    :param op: str; Operation of the stage, e.g. 'assign'
+    :return: bool; True if a plugin node comes after the stage
+    """
+    ops = [node['op'] for node in stages['plan']]
+    return op in ops and 'plugin' in ops[ops.index(op) + 1:]
+
+
+def _plugin_steps(name, config):
+    """
+    Step engaging plugin from given config section; its result depends on source of the plugin module too,
+    and is not cached at all if the plugin declares itself non-cacheable (see registryu.plugin).
+    :param name: str; Name of config section
+    :param config: dict; Provided config section
+    :return: list of tuple; Single step if plugin is configured, none otherwise, see _run_steps
+    """
+    if not miscu.eval_elem_mapping(config, 'plugin'):
+        return list()
+
+    def key_parts():
+        plugin = registryu.resolve(config['plugin'])
+        return [config['plugin'], cacheu.func_digest(plugin)] if registryu.is_cacheable(plugin) else None
+    return [(f'{name}_plugin', key_parts, lambda df: _engage_plugin(config, df))]
+
+
+def _run_steps(df, steps):
+    """
+    Run given steps on a dataframe, in order
+    :param df: pd.DataFrame; Provided dataframe
+    :param steps: list of tuple; Steps as (name, key, func): stage name, callable returning cache key parts (everything
+                  but the input dataframe its result depends on, see _run_cached; None if its result must not be
+                  cached) and callable running the stage
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    for _, _, func in steps:
+        df = func(df)
+    return df
+
+
+def _stage_cache(args, config):
+    """
+    Configuration of stage cache, from optional <cache> config section, unless cache is bypassed from command line.
     :param args: dict; Command line arguments mapping
     :param config: dict; Configuration mapping
+    :return: dict; Stage cache configuration, None if stage cache is bypassed
+    Sample:
+    "cache": {
+        "path": "/var/cache/opendata/stage",
+        "max_size_mb": 1024
+    }
+    """
+    if miscu.eval_elem_mapping(args, 'no_cache'):
+        return None
+    return miscu.eval_elem_mapping(config, 'cache', default_value=dict())
+
+
+def _run_cached(read_config, steps, write_config, cache_config):
+    """
+    Run process stages on whole input make-style, through a content-addressed stage cache.
+    Key of every stage output chains key of its input with the stage key parts, starting from the digest of input file
+    content and read configuration; command line arguments take part through the configuration sections they are
+    injected into. Stages resume from the last cached output, and nothing runs when the output file written from the
+    same result is still unchanged. Caching stops at the first stage whose result must not be cached (e.g. a plugin
+    stamping current date): that stage and the following ones always run. Outputs estimated larger than the cache
+    size cap are not stored, since they would be evicted right away.
+    :param read_config: dict; Provided <input.read> configuration section
+    :param steps: list of tuple; Stages run after read, see _run_steps
+    :param write_config: dict; Provided <output.write> configuration section
+    :param cache_config: dict; Stage cache configuration, see _stage_cache
+    :return: str; Path of the output file
+    """
+    cache_dir = miscu.eval_elem_mapping(cache_config, 'path', default_value=cacheu.STAGE_CACHE_DIR)
+    max_size_mb = miscu.eval_elem_mapping(cache_config, 'max_size_mb', default_value=cacheu.DEFAULT_MAX_SIZE_MB)
+    # keys[0] identifies read input, keys[n] identifies output of n-th step, up to the first step not cached.
+    keys = [cacheu.make_key('input', [cacheu.file_digest(path, cache_dir) for path in etlu.source_paths(read_config)],
+                            read_config)]
+    for name, key_parts, _ in steps:
+        parts = key_parts()
+        if parts is None:
+            logging.info(f'Stage <{name}> is not cacheable, it is run along with following stages')
+            break
+        keys.append(cacheu.make_key(keys[-1], name, parts))
+
+    cached_steps = len(keys) - 1
+    write_key = cacheu.make_key(keys[-1], 'write', write_config) if cached_steps == len(steps) else None
+    written = cacheu.load(cache_dir, write_key) if write_key else None
+    if written and os.path.isfile(written['path']) and cacheu.file_signature(written['path']) == written['signature']:
+        logging.info(f'Output <{written["path"]}> is up to date, no stage is run')
+        return written['path']
+
+    df_target = None
+    with metricsu.stage('cache') as record:
+        for resumed in reversed(range(len(keys))):
+            df_target = cacheu.load(cache_dir, keys[resumed])
+            if df_target is not None:
+                record['rows_out'] = metricsu.rows(df_target)
+                break
+    if df_target is None:
+        resumed = 0
+        df_target = next(_read_frames(read_config))
+        _store_stage(cache_dir, keys[0], df_target, max_size_mb)
+
+    for index in range(resumed + 1, len(keys)):
+        df_target = steps[index - 1][2](df_target)
+        _store_stage(cache_dir, keys[index], df_target, max_size_mb)
+    df_target = _run_steps(df_target, steps[cached_steps:])
+
+    output_path = _write_chunk(df_target, write_config, None)
+    if write_key:
+        cacheu.store(cache_dir, write_key, {'path': output_path, 'signature': cacheu.file_signature(output_path)},
+                     max_size_mb)
+    return output_path
+
+
+def _store_stage(cache_dir, key, df, max_size_mb):
+    """
+    Store a stage output into stage cache, unless its estimated size exceeds the cache size cap.
+    :param cache_dir: str; Stage cache directory
+    :param key: str; Cache key of the stage output
+    :param df: pd.DataFrame; Stage output
+    :param max_size_mb: int; Size cap of stage cache, in megabytes
     :return: null
     """
+    size_mb = df.memory_usage(index=True, deep=True).sum() / 1024 / 1024 if hasattr(df, 'memory_usage') else 0
+    if size_mb > max_size_mb:
+        logging.info(f'Stage output <{key}> of <{size_mb:.1f}> MB exceeds stage cache cap, it is not cached')
+        return
+    cacheu.store(cache_dir, key, df, max_size_mb)
+
+
+def _engage_plugin(config, df):
+    """
+    Engage plugin from given config section, if available, measuring it as <plugin> stage
+    Plugin is resolved once per process, see registryu.resolve
+    :param config: dict; Provided config section
+    :param df: pd.DataFrame; Provided dataframe
+    :return: pd.DataFrame; Resulted dataframe, the provided one if no plugin is configured
+    """
+    plugin = registryu.resolve(miscu.eval_elem_mapping(config, 'plugin'))
+    if not plugin:
+        return df
+    with metricsu.stage('plugin', rows_in=metricsu.rows(df)) as record:
+        df = registryu.apply(plugin, df)
+        record['rows_out'] = metricsu.rows(df)
+    return df
+
+
+def _prepare_extraction(args, config):
+    """
+    Prepare configuration sections of Extraction process, injecting command line arguments where appropriate
+    :param args: dict; Command line arguments mapping
+    :param config: dict; Configuration mapping
+    :return: dict; Prepared configuration sections, keyed by workflow stage
+    """
 
     # --------------------------------
     # Input section
@@ -101,14 +1290,6 @@ def run_extraction(args, config):
     input_config = miscu.eval_elem_mapping(config, 'input')
     input_read_config = miscu.eval_update_mapping(input_config, "read", input_update_with)
 
-    # Run read ETL feature.
-    df_target = etlu.read_feature(input_read_config)
-
-    # Engage plugin from <input> config section, if available.
-    input_plugin = miscu.eval_func(input_config, "plugin")
-    if input_plugin:
-        df_target = input_plugin(df_target)
-
     # --------------------------------
     # Mapping section
     # --------------------------------
@@ -117,15 +1298,13 @@ def run_extraction(args, config):
     # Inject 'path' and 'description' into <mapping> config section.
     mapping_update_with = {'path': miscu.eval_elem_mapping(args, 'mapping_path'), 'description': config['description']}
     mapping_config = miscu.eval_elem_mapping(config, 'mapping')
-    mapping_read_config = miscu.eval_update_mapping(mapping_config, 'read', mapping_update_with)
+    miscu.eval_update_mapping(mapping_config, 'read', mapping_update_with)
 
-    # Run mapping ETL feature.
-    df_target = etlu.mapping_feature(df_target, mapping_config)
-
-    # Engage plugin from <mapping> config section, if available.
-    mapping_plugin = miscu.eval_func(mapping_config, "plugin")
-    if mapping_plugin:
-        df_target = mapping_plugin(df_target)
+    # Mapping dataframe is read through persistent cache, configured by optional <mapping.cache> config section,
+    # unless cache is bypassed from command line.
+    mapping_cache_config = None
+    if not miscu.eval_elem_mapping(args, 'no_mapping_cache'):
+        mapping_cache_config = miscu.eval_elem_mapping(mapping_config, 'cache', default_value=dict())
 
     # --------------------------------
     # Assignment section
@@ -137,15 +1316,7 @@ def run_extraction(args, config):
     assign_update_with = dict()
     for col_name, args_key in assign_config_var.items():
         assign_update_with[col_name] = args[args_key]
-    assign_config_var = miscu.eval_update_mapping(assign_config, 'col_var', assign_update_with)
-
-    # Run assignment ETL feature.
-    df_target = etlu.assign_feature(df_target, assign_config)
-
-    # Engage plugin from <assign> config section, if available.
-    assign_plugin = miscu.eval_func(assign_config, "plugin")
-    if assign_plugin:
-        df_target = assign_plugin(df_target)
+    miscu.eval_update_mapping(assign_config, 'col_var', assign_update_with)
 
     # --------------------------------
     # Output section
@@ -155,59 +1326,223 @@ def run_extraction(args, config):
     # Inject 'path' and 'description' into <output> config section.
     output_update_with = {'path': miscu.eval_elem_mapping(args, 'output_path'), 'description': config['description']}
     output_config = miscu.eval_elem_mapping(config, 'output')
-    output_read_config = miscu.eval_update_mapping(output_config, "write", output_update_with)
+    output_write_config = miscu.eval_update_mapping(output_config, "write", output_update_with)
+
+    stages = {'input': input_config, 'input_read': input_read_config, 'mapping': mapping_config,
+              'mapping_cache': mapping_cache_config, 'assign': assign_config, 'output': output_config,
+              'output_write': output_write_config}
+
+    # Compile configuration into a logical plan, then push projection down to input and mapping readers.
+    stages['plan'] = planu.optimize(planu.compile_extraction(stages))
+    return planu.apply_plan(stages['plan'], stages)
+
+
+def _extract_frame(df, stages, df_mapping):
+    """
+    Run row-local stages of Extraction process on given dataframe (either whole input or a chunk of it)
+    :param df: pd.DataFrame; Provided dataframe, as returned by read feature
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :param df_mapping: pd.DataFrame; Extracted mapping dataframe
+    :return: pd.DataFrame; Resulted dataframe, ready to be written
+    """
+    return _run_steps(df, _extraction_steps(stages, lambda: df_mapping))
+
+
+def _extraction_steps(stages, mapping):
+    """
+    Row-local stages of Extraction process, in order of execution
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :param mapping: callable; Returns extracted mapping dataframe, called once mapping stage runs
+    :return: list of tuple; Steps, see _run_steps
+    """
+    return _mapping_steps(stages, mapping) + _assignment_steps(stages)
+
+
+def _mapping_steps(stages, mapping):
+    """
+    Stages of Extraction process up to mapping, which do not depend on command line arguments, in order of execution
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :param mapping: callable; Returns extracted mapping dataframe, called once mapping stage runs
+    :return: list of tuple; Steps, see _run_steps
+    """
+    mapping_config = stages['mapping']
+    mapping_paths = [miscu.eval_elem_mapping(read_config, 'path') for read_config in _mapping_reads(stages)]
+
+    # --------------------------------
+    # Input section
+    # --------------------------------
+
+    # Engage plugin from <input> config section, if available.
+    steps = _plugin_steps('input', stages['input'])
+
+    # --------------------------------
+    # Mapping section
+    # --------------------------------
+
+    # Run mapping ETL feature; its result depends on content of mapping (and lookup) files too.
+    steps.append(('mapping', lambda: [mapping_config] + [cacheu.file_digest(path) if path else None
+                                                         for path in mapping_paths],
+                  lambda df: _run_stage('mapping', etlu.mapping_feature, df, mapping_config, df_mapping=mapping())))
+
+    # Engage plugin from <mapping> config section, if available.
+    steps += _plugin_steps('mapping', mapping_config)
+    return steps
+
+
+def _assignment_steps(stages):
+    """
+    Stages of Extraction process from assignment on, in order of execution
+    :param stages: dict; Prepared configuration sections, see _prepare_extraction
+    :return: list of tuple; Steps, see _run_steps
+    """
+    rearrange_config = miscu.eval_elem_mapping(stages['output'], 'rearrange')
+
+    # --------------------------------
+    # Assignment section
+    # --------------------------------
+
+    # Run assignment ETL feature; text constants stay plain str columns when a plugin may work on them.
+    as_category = not _plugin_follows(stages, 'assign')
+    steps = [('assign', lambda: [stages['assign'], as_category],
+              lambda df: _run_stage('assign', etlu.assign_feature, df, stages['assign'], as_category=as_category))]
+
+    # Engage plugin from <assign> config section, if available.
+    steps += _plugin_steps('assign', stages['assign'])
 
     # --------------------------------
     # Rearrange section
     # --------------------------------
 
     # Run rearrange ETL feature.
-    rearrange_config = miscu.eval_elem_mapping(output_config, 'rearrange')
-    df_target = etlu.rearrange_feature(df_target, rearrange_config)
+    steps.append(('rearrange', lambda: rearrange_config,
+                  lambda df: _run_stage('rearrange', etlu.rearrange_feature, df, rearrange_config)))
 
     # Engage plugin from <output> config section, if available.
-    output_plugin = miscu.eval_func(output_config, "plugin")
-    if output_plugin:
-        df_target = output_plugin(df_target)
-
-    # Run write ETL feature.
-    etlu.write_feature(df_target, output_read_config)
+    steps += _plugin_steps('output', stages['output'])
+    return steps
 
 
 def run_transformation(args, config):
     """
     Transformation process
+    Input is processed either whole or, when <chunk_size> is given (command line or <input.read> config section),
+    streamed in chunks of rows which are aggregated into mergeable partial states.
     :param args: dict; Command line arguments mapping
     :param config: dict; Configuration mapping
-    :return: null
+    :return: str; Path of the written output file
     """
+    stages = _prepare_transformation(args, config)
+    if miscu.eval_elem_mapping(args, 'explain'):
+        print(planu.explain(stages['plan'], 'Transformation plan'))
+        return None
+    if miscu.eval_elem_mapping(args, 'validate'):
+        print(_validate('Transformation', [stages['input_read']], [stages['output_write']]))
+        return None
+    whole_input = _whole_input(args, stages, TRANSFORMATION_CHUNK_SECTIONS)
+    if miscu.eval_elem_mapping(args, 'incremental') and not whole_input and _incremental_supported(stages):
+        return _run_transformation_incremental(args, stages)
 
     # --------------------------------
     # Input section
     # --------------------------------
 
     # Extract normalized data source (output of Extraction process)
-    # Prepare additional input parameters and update appropriate configuration section.
-    # Inject 'path' and 'description' into <input> config section.
-    input_update_with = {'path': miscu.eval_elem_mapping(args, 'input_path'), 'description': config['description']}
-    input_config = miscu.eval_elem_mapping(config, 'input')
-    input_read_config = miscu.eval_update_mapping(input_config, "read", input_update_with)
+    # Run read ETL feature and engage plugin from <input> config section, if available.
+    chunk_size = None if whole_input else miscu.eval_elem_mapping(
+        args, 'chunk_size', default_value=miscu.eval_elem_mapping(stages['input_read'], 'chunk_size'))
+    if chunk_size:
+        df_target = _aggregate_chunks(stages, chunk_size)
+    else:
+        # Whole input goes through stage cache, unless it is bypassed.
+        steps = _aggregation_steps(stages) + _transformation_steps(stages)
+        stage_cache_config = _stage_cache(args, config)
+        if stage_cache_config is not None:
+            return _run_cached(stages['input_read'], steps, stages['output_write'], stage_cache_config)
+        return _write_chunk(_run_steps(next(_read_frames(stages['input_read'])), steps), stages['output_write'], None)
 
-    # Run read ETL feature.
-    df_target = etlu.read_feature(input_read_config)
+    df_target = _transform_frame(df_target, stages)
+
+    # Run write ETL feature.
+    return _write_chunk(df_target, stages['output_write'], None)
 
-    # Engage plugin from <input> config section, if available.
-    input_plugin = miscu.eval_func(input_config, "plugin")
-    if input_plugin:
-        df_target = input_plugin(df_target)
+
+def _aggregate_chunks(stages, chunk_size):
+    """
+    Read input of Transformation process in chunks of rows, aggregating them into mergeable partial states
+    :param stages: dict; Prepared configuration sections, see _prepare_transformation
+    :param chunk_size: int; Number of input rows per chunk
+    :return: pd.DataFrame; Aggregated dataframe
+    """
+    chunks = (_engage_plugin(stages['input'], df_chunk)
+              for df_chunk in _read_frames(stages['input_read'], chunk_size))
 
     # --------------------------------
     # Aggregate section
     # --------------------------------
 
-    # Run aggregate ETL feature to sum AMOUNT column, grouping by the combination of EXT_ACCOUNT, MAP_ACCOUNT, TYPE.
-    aggregate_config = miscu.eval_elem_mapping(config, 'aggregate')
-    df_target = etlu.aggregate_feature(df_target, aggregate_config)
+    # Run aggregate ETL feature chunk by chunk, merging partial states of every chunk.
+    # Chunks are read within aggregation, but reading is measured as its own (nested) stage.
+    with metricsu.stage('aggregate') as record:
+        df_target = etlu.aggregate_chunks_feature(_count_rows(chunks, record), stages['aggregate'])
+        record['rows_out'] = metricsu.rows(df_target)
+    return df_target
+
+
+def _run_transformation_incremental(args, stages):
+    """
+    Incremental Transformation: aggregate only input records appended since the previous run, merging their partial
+    aggregation states into those kept from the previous run, then rewrite its output from the merged states.
+    Runs in full (into a new output file) when the state of the previous run cannot be resumed, see watermarku.resume.
+    :param args: dict; Command line arguments mapping
+    :param stages: dict; Prepared configuration sections, see _prepare_transformation
+    :return: str; Path of the output file
+    """
+    state_path, fingerprint, watermark = _resume_incremental(args, stages)
+    df_partial = None if watermark['full'] else watermarku.load_partial(state_path)
+    if not watermark['full'] and df_partial is None:
+        logging.info(f'Partial aggregation states of <{state_path}> not found, running in full')
+        watermark = dict(watermark, full=True, start=0, rows=0, output_path=None)
+    if not watermark['full'] and watermark['start'] == watermark['end']:
+        logging.info('No input records appended since previous run')
+        return watermark['output_path']
+
+    input_read_config = dict(stages['input_read'], byte_range=[watermark['start'], watermark['end']])
+    df_target = next(_read_frames(input_read_config))
+    rows = metricsu.rows(df_target)
+    df_target = _engage_plugin(stages['input'], df_target)
+
+    # Run aggregate ETL feature on new records only, merging their partial states into the stored ones.
+    with metricsu.stage('aggregate', rows_in=rows) as record:
+        df_chunk_partial = etlu.partial_aggregate_feature(df_target, stages['aggregate'])
+        df_partial = df_chunk_partial if df_partial is None else etlu.combine_aggregate_feature(
+            df_partial, df_chunk_partial, stages['aggregate'])
+        df_target = etlu.finalize_aggregate_feature(df_partial, stages['aggregate'])
+        record['rows_out'] = metricsu.rows(df_target)
+
+    df_target = _transform_frame(df_target, stages)
+    output_path = _write_chunk(df_target, stages['output_write'], watermark['output_path'], mode='overwrite')
+    watermarku.store_partial(state_path, df_partial)
+    watermarku.commit(state_path, watermark, input_read_config['path'], fingerprint, rows, output_path)
+    return output_path
+
+
+def _prepare_transformation(args, config):
+    """
+    Prepare configuration sections of Transformation process, injecting command line arguments where appropriate
+    :param args: dict; Command line arguments mapping
+    :param config: dict; Configuration mapping
+    :return: dict; Prepared configuration sections, keyed by workflow stage
+    """
+
+    # --------------------------------
+    # Input section
+    # --------------------------------
+
+    # Prepare additional input parameters and update appropriate configuration section.
+    # Inject 'path' and 'description' into <input> config section.
+    input_update_with = {'path': miscu.eval_elem_mapping(args, 'input_path'), 'description': config['description']}
+    input_config = miscu.eval_elem_mapping(config, 'input')
+    input_read_config = miscu.eval_update_mapping(input_config, "read", input_update_with)
 
     # --------------------------------
     # Assignment section
@@ -219,24 +1554,7 @@ def run_transformation(args, config):
     assign_update_with = dict()
     for col_name, args_key in assign_config_var.items():
         assign_update_with[col_name] = args[args_key]
-    assign_config_var = miscu.eval_update_mapping(assign_config, 'col_var', assign_update_with)
-
-    # Run assignment ETL feature (as per requirements).
-    df_target = etlu.assign_feature(df_target, assign_config)
-
-    # Engage plugin from <assign> config section, if available.
-    assign_plugin = miscu.eval_func(assign_config, "plugin")
-    if assign_plugin:
-        df_target = assign_plugin(df_target)
-
-    # --------------------------------
-    # Duplication section
-    # --------------------------------
-
-    # Run duplicate ETL feature (as per requirements).
-    # Sign of Amount value of duplicated row will be flipped
-    dupl_config = miscu.eval_elem_mapping(config, 'dupl')
-    df_target = etlu.dupl_feature(df_target, dupl_config)
+    miscu.eval_update_mapping(assign_config, 'col_var', assign_update_with)
 
     # --------------------------------
     # Output section
@@ -248,24 +1566,162 @@ def run_transformation(args, config):
     output_config = miscu.eval_elem_mapping(config, 'output')
     output_write_config = miscu.eval_update_mapping(output_config, "write", output_update_with)
 
+    stages = {'input': input_config, 'input_read': input_read_config,
+              'aggregate': miscu.eval_elem_mapping(config, 'aggregate'), 'assign': assign_config,
+              'dupl': miscu.eval_elem_mapping(config, 'dupl'), 'output': output_config,
+              'output_write': output_write_config}
+
+    # Compile configuration into a logical plan, then push projection down to input reader.
+    stages['plan'] = planu.optimize(planu.compile_transformation(stages))
+    return planu.apply_plan(stages['plan'], stages)
+
+
+def _transform_frame(df, stages):
+    """
+    Run post-aggregation stages of Transformation process on given (aggregated) dataframe
+    :param df: pd.DataFrame; Provided aggregated dataframe
+    :param stages: dict; Prepared configuration sections, see _prepare_transformation
+    :return: pd.DataFrame; Resulted dataframe, ready to be written
+    """
+    return _run_steps(df, _transformation_steps(stages))
+
+
+def _aggregation_steps(stages):
+    """
+    Stages of Transformation process on whole input, up to aggregation, in order of execution
+    :param stages: dict; Prepared configuration sections, see _prepare_transformation
+    :return: list of tuple; Steps, see _run_steps
+    """
+
+    # --------------------------------
+    # Input section
+    # --------------------------------
+
+    # Engage plugin from <input> config section, if available.
+    steps = _plugin_steps('input', stages['input'])
+
+    # --------------------------------
+    # Aggregate section
+    # --------------------------------
+
+    # Run aggregate ETL feature to sum AMOUNT column, grouping by the combination of EXT_ACCOUNT, MAP_ACCOUNT, TYPE.
+    steps.append(('aggregate', lambda: stages['aggregate'],
+                  lambda df: _run_stage('aggregate', etlu.aggregate_feature, df, stages['aggregate'])))
+    return steps
+
+
+def _transformation_steps(stages):
+    """
+    Post-aggregation stages of Transformation process, in order of execution
+    :param stages: dict; Prepared configuration sections, see _prepare_transformation
+    :return: list of tuple; Steps, see _run_steps
+    """
+    rearrange_config = miscu.eval_elem_mapping(stages['output'], 'rearrange')
+
+    # --------------------------------
+    # Assignment section
+    # --------------------------------
+
+    # Run assignment ETL feature (as per requirements); text constants stay plain str columns when a plugin may work
+    # on them.
+    as_category = not _plugin_follows(stages, 'assign')
+    steps = [('assign', lambda: [stages['assign'], as_category],
+              lambda df: _run_stage('assign', etlu.assign_feature, df, stages['assign'], as_category=as_category))]
+
+    # Engage plugin from <assign> config section, if available.
+    steps += _plugin_steps('assign', stages['assign'])
+
+    # --------------------------------
+    # Duplication section
+    # --------------------------------
+
+    # Run duplicate ETL feature (as per requirements).
+    # Sign of Amount value of duplicated row will be flipped
+    steps.append(('dupl', lambda: stages['dupl'],
+                  lambda df: _run_stage('dupl', etlu.dupl_feature, df, stages['dupl'])))
+
     # --------------------------------
     # Rearrange section
     # --------------------------------
 
     # Run rearrange ETL feature.
-    rearrange_config = miscu.eval_elem_mapping(output_config, 'rearrange')
-    df_target = etlu.rearrange_feature(df_target, rearrange_config)
+    steps.append(('rearrange', lambda: rearrange_config,
+                  lambda df: _run_stage('rearrange', etlu.rearrange_feature, df, rearrange_config)))
 
     # Engage plugin from <output> config section.
     # Our plugin will add Total Amount value.
-    output_plugin = miscu.eval_func(output_config, "plugin")
-    if output_plugin:
-        df_target = output_plugin(df_target)
+    steps += _plugin_steps('output', stages['output'])
+    return steps
 
-    # Run write ETL feature.
-    etlu.write_feature(df_target, output_write_config)
+
+def run_pipeline(args, config):
+    """
+    Pipeline process: Extraction immediately followed by Transformation of its in-memory result,
+    skipping write and read of the intermediate file, which is only written (in background) if <-intermediate> is given.
+    :param args: dict; Command line arguments mapping; <-input> and <-output> are those of the whole pipeline
+    :param config: dict; Configuration mapping, with <extraction> and <transformation> sections
+    :return: str; Path of the written output file
+    """
+    intermediate_path = miscu.eval_elem_mapping(args, 'intermediate_path')
+    extraction_stages = _prepare_extraction(dict(args, output_path=intermediate_path), config['extraction'])
+    transformation_stages = _prepare_transformation(args, config['transformation'])
+    if miscu.eval_elem_mapping(args, 'explain'):
+        print(planu.explain(extraction_stages['plan'], 'Extraction plan'))
+        print(planu.explain(transformation_stages['plan'], 'Transformation plan'))
+        return None
+    if miscu.eval_elem_mapping(args, 'validate'):
+        # Transformation reads the in-memory Extraction result, intermediate file is written only when given.
+        print(_validate('Pipeline', [extraction_stages['input_read']] + _mapping_reads(extraction_stages),
+                        [transformation_stages['output_write']] +
+                        ([extraction_stages['output_write']] if intermediate_path else [])))
+        return None
+    df_mapping = _read_mapping(extraction_stages)
+    whole_input = _whole_input(args, extraction_stages, EXTRACTION_CHUNK_SECTIONS) | \
+        _whole_input(args, transformation_stages, TRANSFORMATION_CHUNK_SECTIONS)
+    chunk_size = None if whole_input else miscu.eval_elem_mapping(
+        args, 'chunk_size', default_value=miscu.eval_elem_mapping(extraction_stages['input_read'], 'chunk_size'))
+
+    # Background writer writes intermediate chunks in order, while the pipeline carries on.
+    with contextlib.ExitStack() as exit_stack:
+        intermediate = exit_stack.enter_context(_chunk_writer(extraction_stages['output_write'])) \
+            if intermediate_path else None
+
+        def extracted_frames():
+            for df_frame in _read_frames(extraction_stages['input_read'], chunk_size):
+                df_frame = _extract_frame(df_frame, extraction_stages, df_mapping)
+                if intermediate is not None:
+                    intermediate.put(df_frame)
+                # Transformation works on its own shallow copy, so the frame being written is left untouched.
+                yield _to_transformation_input(df_frame.copy(deep=False), transformation_stages)
+
+        # Extraction stages run within aggregation, but each of them is measured as its own (nested) stage.
+        with metricsu.stage('aggregate') as record:
+            if chunk_size:
+                df_target = etlu.aggregate_chunks_feature(_count_rows(extracted_frames(), record),
+                                                          transformation_stages['aggregate'])
+            else:
+                df_target = etlu.aggregate_feature(next(_count_rows(extracted_frames(), record)),
+                                                   transformation_stages['aggregate'])
+            record['rows_out'] = metricsu.rows(df_target)
+        df_target = _transform_frame(df_target, transformation_stages)
+        output_path = _write_chunk(df_target, transformation_stages['output_write'], None)
+    return output_path
+
+
+def _to_transformation_input(df, stages):
+    """
+    Turn Extraction result into Transformation input, as if it was read back from the intermediate file
+    :param df: pd.DataFrame; Provided Extraction result
+    :param stages: dict; Prepared Transformation configuration sections, see _prepare_transformation
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    df_target = etlu.apply_dtype_feature(df, miscu.eval_elem_mapping(stages['input_read'], 'apply_dtype'))
+
+    # Engage plugin from <input> config section, if available.
+    df_target = _engage_plugin(stages['input'], df_target)
+    return df_target
 
 
 if __name__ == '__main__':
     # Call main process.
-    sys.exit(main(sys.argv[1:]))
\ No newline at end of file
+    sys.exit(main(sys.argv[1:]))
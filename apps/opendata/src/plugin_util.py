@@ -1,13 +1,16 @@
 from datetime import date
+import utils.registry_util as registryu
 
 
+# Result changes every day, so it must not be served from stage cache.
+@registryu.plugin(scope=registryu.SCOPE_ROW_LOCAL, cacheable=False)
 def add_datetime_into_comments_plugin(df):
     """
     Add current datetime stamp into COMMENTS dataframe column.
     :param df: pd.DataFrame; Provided dataframe
-    :return: null
+    :return: dict; Vectorized expression of COMMENTS column, or the dataframe as is if there is no such column
     """
     if "COMMENTS" in df:
-        df["COMMENTS"] = f'{date.today()} ' + df["COMMENTS"]
+        return {"COMMENTS": f'{date.today()} ' + df["COMMENTS"]}
 
     return df
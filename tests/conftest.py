@@ -0,0 +1,76 @@
+import os
+import pytest
+from apps.opendata.src import opendata
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, 'data')
+EXTRACTION_INPUT_PATH = os.path.join(DATA_DIR, 'wendizhang_extraction_input.csv')
+MAPPING_PATH = os.path.join(DATA_DIR, 'wendizhang_extraction_mapping.csv')
+PROCESS_NAME = 'wendizhang'
+RUN_DATE = '10222020'
+# Records whose department code is not mapped, leaving an empty department (MAP_ACCOUNT) after Extraction.
+UNMATCHED_RECORDS = ['Z|Ann|900|5000|Contract', 'Z|Bob|901|7000|Intern', 'Q|Cid|902|100|Contract']
+
+
+@pytest.fixture
+def extraction_input(tmp_path):
+    """
+    Extraction input: sample input along with records of unmapped departments.
+    :return: str; Fully qualified input file name
+    """
+    with open(EXTRACTION_INPUT_PATH) as file_source:
+        lines = file_source.read().rstrip('\n').split('\n')
+    path = tmp_path / 'extraction_input.csv'
+    path.write_text('\n'.join(lines + UNMATCHED_RECORDS) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def run_process(tmp_path):
+    """
+    Run a wendizhang process in this interpreter, bypassing persistent caches, unless they are asked for:
+    stage cache is then kept in <cache> directory of tmp_path, mapping cache in its <mapping_cache> directory.
+    Usage: run_process('extraction', input_path, output_path, '-chunk_size', '7', update_config=func, cache=False)
+    :return: callable; Runs a process and returns the path of its written output file
+    """
+    log_path = str(tmp_path / 'opendata.log')
+
+    def run(process_type, input_path, output_path, *options, update_config=None, cache=False):
+        argv = ['-process', f'{PROCESS_NAME}_{process_type}', '-input', input_path, '-output', output_path,
+                '-mapping', MAPPING_PATH, '-run_date', RUN_DATE, '-description', PROCESS_NAME, '-prop_date', RUN_DATE,
+                '-log', log_path, *options]
+        if not cache:
+            argv += ['-no_cache', '-no_mapping_cache']
+        args, process_name, process_type, process_config = opendata._interpret_args(argv)
+        if cache:
+            process_config['cache'] = dict(process_config.get('cache') or dict(), path=str(tmp_path / 'cache'))
+            if 'mapping' in process_config:
+                process_config['mapping']['cache'] = {'path': str(tmp_path / 'mapping_cache')}
+        if update_config:
+            update_config(process_config)
+        return opendata.run_process(args, process_type, process_config)
+    return run
+
+
+def read_text(path):
+    """
+    Content of a written text file.
+    :param path: str; Fully qualified file name
+    :return: str; File content
+    """
+    with open(path) as file_target:
+        return file_target.read()
+
+
+def process_input(process_type, tmp_path, extraction_input, run_process):
+    """
+    Input of given process: Extraction output for Transformation, otherwise Extraction input.
+    :param process_type: str; Process type
+    :param tmp_path: pathlib.Path; Directory the Extraction output is written into
+    :param extraction_input: str; Fully qualified Extraction input file name
+    :param run_process: callable; See run_process fixture
+    :return: str; Fully qualified input file name
+    """
+    if process_type == 'transformation':
+        return run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+    return extraction_input
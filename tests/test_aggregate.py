@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils.etl_util as etlu
+
+
+def _frame(rows=500):
+    """
+    Records spread over a few text groups, with a numeric column to aggregate.
+    """
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'K': rng.choice(['', 'a', 'b', 'c', 'd'], rows), 'L': rng.choice(['x', 'y'], rows),
+                         'V': rng.integers(0, 1000, rows).astype(float)})
+
+
+def _chunks(df, size):
+    return [df.iloc[start:start + size] for start in range(0, len(df.index), size)]
+
+
+@pytest.mark.parametrize('group_by', ['K', ['K'], ['K', 'L']])
+def test_chunked_aggregation_matches_whole(group_by):
+    df = _frame()
+    config = {'group_by': group_by, 'agg': {'V': ['sum', 'mean', 'min', 'max', 'count']}}
+    expected = etlu.aggregate_feature(df.copy(), config)
+    pd.testing.assert_frame_equal(etlu.aggregate_chunks_feature(_chunks(df, 37), config), expected)
+
+
+SPILL_CONFIGS = [
+    {'group_by': ['K', 'L'], 'agg': {'V': 'sum', 'W': 'mean'}},
+    {'group_by': 'K', 'agg': {'V': ['sum', 'max'], 'W': 'count'}},
+    {'group_by': ['L', 'K'], 'agg': {'V': 'min'}}
+]
+
+
+def _spill_frame(rows=20000):
+    """
+    Records spread over many groups, so that aggregation exceeds a small memory budget.
+    """
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({'K': rng.integers(0, 3000, rows).astype(str),
+                       'L': pd.Categorical(rng.choice(list('pqrs'), rows)),
+                       'V': rng.normal(size=rows) * 1e6, 'W': rng.integers(0, 100, rows).astype(float)})
+    df.loc[::97, 'W'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('config', SPILL_CONFIGS)
+def test_spilled_aggregation_matches_in_memory(tmp_path, config):
+    df = _spill_frame()
+    spill_config = dict(config, memory_budget_mb=0.05, spill_dir=str(tmp_path))
+
+    pd.testing.assert_frame_equal(etlu.aggregate_feature(df, spill_config), etlu.aggregate_feature(df, config))
+    pd.testing.assert_frame_equal(etlu.aggregate_chunks_feature(_chunks(df, 1500), spill_config),
+                                  etlu.aggregate_chunks_feature(_chunks(df, 1500), config))
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('option', [{'spill_partitions': 0}, {'spill_partitions': -1}, {'memory_budget_mb': 0}])
+def test_invalid_spill_options(option):
+    config = dict({'group_by': 'K', 'agg': {'V': 'sum'}, 'memory_budget_mb': 0.01}, **option)
+
+    with pytest.raises(ValueError):
+        etlu.aggregate_feature(_spill_frame(2000), config)
@@ -0,0 +1,21 @@
+import pytest
+from tests.conftest import read_text
+
+DATES = ['10302020', '10312020', '11012020', '11052020']
+DATE_OPTIONS = ('-run_date', '10302020:11012020,11052020', '-prop_date', '10302020:11012020,11052020')
+
+
+@pytest.mark.parametrize('process_type, options', [('extraction', ()), ('transformation', ()),
+                                                   ('transformation', ('-chunk_size', '7')), ('pipeline', ())])
+def test_backfill_matches_single_date_runs(tmp_path, extraction_input, run_process, process_type, options):
+    input_path = extraction_input
+    if process_type == 'transformation':
+        input_path = run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+
+    backfill_paths = run_process(process_type, input_path, str(tmp_path / 'backfill.csv'), *DATE_OPTIONS,
+                                 '-workers', '2', *options)
+    single_paths = [run_process(process_type, input_path, str(tmp_path / f'single_{date}.csv'),
+                                '-run_date', date, '-prop_date', date, *options) for date in DATES]
+
+    assert [path.rsplit('/', 1)[-1] for path in backfill_paths] == [f'backfill_{date}_{date}.csv' for date in DATES]
+    assert [read_text(path) for path in backfill_paths] == [read_text(path) for path in single_paths]
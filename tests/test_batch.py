@@ -0,0 +1,92 @@
+import json
+import threading
+import pytest
+import utils.batch_util as batchu
+from apps.opendata.src import opendata
+from tests.conftest import MAPPING_PATH, PROCESS_NAME, RUN_DATE, read_text
+
+
+def _recording_runner(failing=()):
+    """
+    Job runner recording the order jobs start in, failing given jobs.
+    """
+    started = list()
+    lock = threading.Lock()
+
+    def run_job(job, upstream):
+        with lock:
+            started.append((job['name'], sorted(upstream)))
+        if job['name'] in failing:
+            raise RuntimeError(f'{job["name"]} failed')
+        return job['name'].upper()
+    return started, run_job
+
+
+def test_jobs_run_after_their_dependencies():
+    jobs = [{'name': 'report', 'inputs': ['trf.csv']},
+            {'name': 'trf', 'inputs': ['ext.csv'], 'outputs': ['trf.csv']},
+            {'name': 'ext', 'outputs': ['ext.csv']},
+            {'name': 'audit', 'depends_on': ['ext']}]
+    assert batchu.resolve_dependencies(jobs) == {'report': {'trf'}, 'trf': {'ext'}, 'ext': set(), 'audit': {'ext'}}
+
+    started, run_job = _recording_runner()
+    results = batchu.run_jobs(jobs, run_job, workers=3)
+
+    order = [name for name, _ in started]
+    assert order.index('ext') < order.index('trf') < order.index('report')
+    assert order.index('ext') < order.index('audit')
+    assert dict(started)['report'] == ['trf']
+    assert [(result['name'], result['status'], result['return_code']) for result in results] == \
+        [(name, batchu.STATUS_SUCCESS, batchu.RETURN_SUCCESS) for name in ('report', 'trf', 'ext', 'audit')]
+
+
+def test_jobs_downstream_of_a_failure_are_skipped():
+    jobs = [{'name': 'ext', 'outputs': ['ext.csv']}, {'name': 'trf', 'inputs': ['ext.csv'], 'outputs': ['trf.csv']},
+            {'name': 'report', 'inputs': ['trf.csv']}, {'name': 'other'}]
+    started, run_job = _recording_runner(failing=('ext',))
+
+    results = {result['name']: result for result in batchu.run_jobs(jobs, run_job, workers=2)}
+
+    assert sorted(name for name, _ in started) == ['ext', 'other']
+    assert results['ext']['status'] == batchu.STATUS_FAILURE and 'ext failed' in results['ext']['error']
+    assert results['trf']['status'] == results['report']['status'] == batchu.STATUS_SKIPPED
+    assert results['other']['status'] == batchu.STATUS_SUCCESS
+    assert results['report']['return_code'] == batchu.RETURN_FAILURE
+    assert 'failed or skipped: 3' in batchu.format_summary(list(results.values()))
+
+
+@pytest.mark.parametrize('jobs, error', [
+    ([{'name': 'ext'}, {'name': 'ext'}], ValueError),
+    ([{'name': 'a', 'depends_on': ['b']}, {'name': 'b', 'inputs': ['c.csv']}, {'name': 'c', 'outputs': ['c.csv'],
+                                                                          'depends_on': ['a']}], ValueError),
+    ([{'name': 'a', 'depends_on': ['missing']}], KeyError)
+])
+def test_invalid_job_dependencies(jobs, error):
+    with pytest.raises(error):
+        batchu.resolve_dependencies(jobs)
+
+
+def test_manifest_runs_transformation_on_extraction_output(tmp_path, extraction_input, run_process, capsys):
+    common = {'-mapping': MAPPING_PATH, '-run_date': RUN_DATE, '-description': PROCESS_NAME, '-prop_date': RUN_DATE,
+              '-no_cache': True, '-no_mapping_cache': True}
+    extraction_path, transformation_path = str(tmp_path / 'ext.csv'), str(tmp_path / 'trf.csv')
+    manifest = {'jobs': [
+        {'name': 'trf', 'process': f'{PROCESS_NAME}_transformation',
+         'args': dict(common, **{'-input': extraction_path, '-output': transformation_path})},
+        {'name': 'ext', 'process': f'{PROCESS_NAME}_extraction',
+         'args': dict(common, **{'-input': extraction_input, '-output': extraction_path})},
+        {'name': 'broken', 'process': f'{PROCESS_NAME}_extraction',
+         'args': dict(common, **{'-input': str(tmp_path / 'missing.csv'), '-output': str(tmp_path / 'broken.csv')})}
+    ]}
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text(json.dumps(manifest))
+
+    return_code = opendata.run_batch(str(manifest_path), workers=2, log_path=str(tmp_path / 'batch.log'))
+
+    assert return_code == opendata.RETURN_FAILURE
+    expected_path = run_process('transformation', run_process('extraction', extraction_input,
+                                                              str(tmp_path / 'single_ext.csv')),
+                                str(tmp_path / 'single_trf.csv'))
+    assert read_text(transformation_path) == read_text(expected_path)
+    summary = capsys.readouterr().out
+    assert 'Jobs: 3, failed or skipped: 1' in summary
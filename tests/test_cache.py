@@ -0,0 +1,54 @@
+import datetime
+import pandas as pd
+import pytest
+import utils.cache_util as cacheu
+from apps.opendata.src import plugin_util
+from tests.conftest import process_input, read_text
+
+
+@pytest.mark.parametrize('process_type', ['extraction', 'transformation'])
+def test_cached_rerun_writes_same_output(tmp_path, extraction_input, run_process, process_type):
+    input_path = process_input(process_type, tmp_path, extraction_input, run_process)
+    expected = read_text(run_process(process_type, input_path, str(tmp_path / 'uncached.csv')))
+
+    # The first run fills the stage cache, the second one is served by it.
+    for name in ('cold', 'warm'):
+        assert read_text(run_process(process_type, input_path, str(tmp_path / f'{name}.csv'), cache=True)) == expected
+    assert list((tmp_path / 'cache').iterdir())
+
+
+class _FakeDate(datetime.date):
+    today_value = None
+
+    @classmethod
+    def today(cls):
+        return cls.today_value
+
+
+def test_date_stamping_plugin_is_not_cached(tmp_path, extraction_input, run_process, monkeypatch):
+    monkeypatch.setattr(plugin_util, 'date', _FakeDate)
+    output_path = str(tmp_path / 'output.csv')
+
+    # Unchanged rerun on a later day stamps the later date, as a fresh run does.
+    for day in (datetime.date(2020, 10, 22), datetime.date(2020, 10, 23)):
+        _FakeDate.today_value = day
+        cached = read_text(run_process('extraction', extraction_input, output_path, cache=True))
+        fresh = read_text(run_process('extraction', extraction_input, str(tmp_path / f'fresh_{day}.csv')))
+        assert cached == fresh
+        assert f'{day} ' in cached
+
+
+def test_oversized_stage_outputs_are_not_stored(tmp_path, extraction_input, run_process, monkeypatch):
+    stored = list()
+    store = cacheu.store
+    monkeypatch.setattr(cacheu, 'store', lambda cache_dir, key, value, *args, **kwargs: (
+        stored.append((cache_dir, value)), store(cache_dir, key, value, *args, **kwargs)))
+
+    def cap_cache(config):
+        config['cache']['max_size_mb'] = 0.001
+    output_path = run_process('extraction', extraction_input, str(tmp_path / 'output.csv'), cache=True,
+                              update_config=cap_cache)
+
+    assert read_text(output_path)
+    assert not [value for cache_dir, value in stored if cache_dir == str(tmp_path / 'cache')
+                and isinstance(value, pd.DataFrame)]
@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import utils.cache_util as cacheu
+from apps.opendata.src import opendata
+from tests.conftest import EXTRACTION_INPUT_PATH, MAPPING_PATH, PROCESS_NAME, REPO_DIR, RUN_DATE
+
+
+def test_modified_config_invalidates_compiled_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(cacheu, 'CONFIG_CACHE_DIR', str(tmp_path / 'config_cache'))
+    config_path = tmp_path / 'process.json'
+    config = {'feature_args': {'-input': {'dest': 'input_path', 'help': 'Input', 'required': 'True'}},
+              'extraction': {'description': 'first'}}
+    config_path.write_text(json.dumps(config))
+    assert opendata._load_config(str(config_path))['feature_args']['-input']['required'] is True
+
+    # Unchanged file is neither parsed nor compiled again; callers get their own copy.
+    with monkeypatch.context() as patch:
+        patch.setattr(opendata, '_compile_config', None)
+        loaded = opendata._load_config(str(config_path))
+        loaded['extraction']['description'] = 'updated'
+        assert opendata._load_config(str(config_path))['extraction']['description'] == 'first'
+
+    config['extraction']['description'] = 'second'
+    config_path.write_text(json.dumps(config))
+    assert opendata._load_config(str(config_path))['extraction']['description'] == 'second'
+
+
+@pytest.mark.parametrize('options', [['-h'], ['-input', EXTRACTION_INPUT_PATH, '-output', 'output.csv',
+                                              '-mapping', MAPPING_PATH, '-run_date', RUN_DATE, '-prop_date', RUN_DATE,
+                                              '-description', PROCESS_NAME, '-validate']])
+def test_help_and_dry_run_do_not_import_pandas(tmp_path, options):
+    argv = ['-process', f'{PROCESS_NAME}_extraction', '-log', str(tmp_path / 'opendata.log')] + options
+    # Fresh interpreter, with caches of its own.
+    script = ('import sys\n'
+              'from apps.opendata.src import opendata\n'
+              'try:\n'
+              f'    opendata.main({argv!r})\n'
+              'except SystemExit:\n'
+              '    pass\n'
+              'sys.stderr.write(str(sorted(name for name in sys.modules if name.split(".")[0] in '
+              '("pandas", "numpy", "pyarrow"))))\n')
+    completed = subprocess.run([sys.executable, '-c', script], cwd=REPO_DIR, capture_output=True, text=True,
+                               env=dict(os.environ, HOME=str(tmp_path), PYTHONPATH=REPO_DIR), timeout=60)
+
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout
+    assert completed.stderr.splitlines()[-1] == '[]'
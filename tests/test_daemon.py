@@ -0,0 +1,121 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import utils.batch_util as batchu
+import utils.daemon_util as daemonu
+
+
+def _connect(socket_path, timeout=10):
+    """
+    Connect to the daemon socket once it is listening.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(socket_path)
+            return client, client.makefile('r')
+        except (FileNotFoundError, ConnectionRefusedError):
+            client.close()
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _request(client, request):
+    client.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_socket_jobs_status_and_drain_on_stop(tmp_path):
+    socket_path = str(tmp_path / 'daemon.sock')
+    release = threading.Event()
+    ran = list()
+
+    def run_job(job):
+        release.wait(10)
+        if job['name'] == 'bad':
+            raise ValueError('bad job')
+        ran.append(job['name'])
+        return f'{job["name"]}.csv'
+
+    responses = dict()
+
+    def daemon_status(connections):
+        _request(connections['status'][0], {'command': daemonu.COMMAND_STATUS})
+        return json.loads(connections['status'][1].readline())
+
+    def client_session():
+        connections = dict()
+        try:
+            connections.update({name: _connect(socket_path) for name in ('first', 'second', 'bad', 'status')})
+            # First job keeps the only worker busy, the next ones wait in the queue.
+            for name in ('first', 'second', 'bad'):
+                _request(connections[name][0], {'name': name})
+                if name == 'first':
+                    _wait_for(lambda: daemon_status(connections)['running'] == 1)
+            _wait_for(lambda: daemon_status(connections)['queued'] == 2)
+            responses['status'] = daemon_status(connections)
+        finally:
+            # Queued jobs still run once the daemon is asked to stop.
+            os.kill(os.getpid(), signal.SIGTERM)
+            release.set()
+        for name in ('first', 'second', 'bad'):
+            responses[name] = json.loads(connections[name][1].readline())
+        for client, reader in connections.values():
+            reader.close()
+            client.close()
+
+    client = threading.Thread(target=client_session)
+    client.start()
+    final_status = daemonu.serve(run_job, socket_path=socket_path, socket_job=lambda request: {'name': request['name']},
+                                 workers=1, queue_size=4)
+    client.join(10)
+
+    assert responses['status'] == {'jobs': 0, 'failed': 0, 'queued': 2, 'running': 1,
+                                   'latency_ms': {'p50': None, 'p95': None, 'max': None}}
+    assert ran == ['first', 'second']
+    assert responses['first']['status'] == responses['second']['status'] == batchu.STATUS_SUCCESS
+    assert responses['second']['output_path'] == 'second.csv'
+    assert responses['bad']['status'] == batchu.STATUS_FAILURE and 'bad job' in responses['bad']['error']
+    assert final_status['jobs'] == 3 and final_status['failed'] == 1 and final_status['queued'] == 0
+    assert not os.path.exists(socket_path)
+
+
+def test_dropped_files_are_run_once_complete_and_moved(tmp_path):
+    drop_dir, done_dir, error_dir = tmp_path / 'drop', tmp_path / 'done', tmp_path / 'error'
+    drop_dir.mkdir()
+    (drop_dir / '.partial.csv').write_text('hidden')
+    (drop_dir / 'good.csv').write_text('good')
+    (drop_dir / 'bad.csv').write_text('bad')
+    (drop_dir / 'other.txt').write_text('other')
+
+    def run_job(job):
+        if job['name'] == 'bad.csv':
+            raise ValueError('bad file')
+        return job['path']
+
+    def stop_once_moved():
+        try:
+            _wait_for(lambda: (done_dir / 'good.csv').exists() and (error_dir / 'bad.csv').exists())
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    stopper = threading.Thread(target=stop_once_moved)
+    stopper.start()
+    watch = {'path': str(drop_dir), 'pattern': '*.csv', 'done_dir': str(done_dir), 'error_dir': str(error_dir),
+             'job': lambda path: {'name': os.path.basename(path), 'path': path}}
+    final_status = daemonu.serve(run_job, watches=[watch], workers=2, poll_interval=0.05)
+    stopper.join(10)
+
+    assert final_status['jobs'] == 2 and final_status['failed'] == 1
+    assert sorted(os.listdir(drop_dir)) == ['.partial.csv', 'other.txt']
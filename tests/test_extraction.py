@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+import utils.etl_util as etlu
+
+FILE_TYPES = {
+    'csv': ('.csv', lambda path: pd.read_csv(path, sep='|', dtype=str, keep_default_na=False)),
+    'parquet': ('.parquet', pd.read_parquet),
+    'feather': ('.feather', pd.read_feather),
+    'excel': ('.xlsx', pd.read_excel)
+}
+RUN_MODES = {
+    'chunked': ('-chunk_size', '7'),
+    'workers': ('-workers', '2', '-chunk_size', '13')
+}
+
+
+def _write_as(file_type):
+    """
+    Extraction writing its output as given file type.
+    """
+    def update_config(config):
+        config['output']['write']['file_type'] = file_type
+    return update_config
+
+
+@pytest.mark.parametrize('run_mode', RUN_MODES)
+@pytest.mark.parametrize('file_type', FILE_TYPES)
+def test_streamed_output_matches_whole(tmp_path, extraction_input, run_process, file_type, run_mode):
+    ext, read = FILE_TYPES[file_type]
+    whole_path = run_process('extraction', extraction_input, str(tmp_path / f'whole{ext}'),
+                             update_config=_write_as(file_type))
+    streamed_path = run_process('extraction', extraction_input, str(tmp_path / f'{run_mode}{ext}'),
+                                *RUN_MODES[run_mode], update_config=_write_as(file_type))
+
+    # Categories of streamed outputs are united chunk by chunk, in order of appearance.
+    pd.testing.assert_frame_equal(read(streamed_path), read(whole_path), check_categorical=False)
+    assert not list(tmp_path.glob('.*.tmp*'))
+
+
+@pytest.mark.parametrize('run_mode', RUN_MODES)
+@pytest.mark.parametrize('ext', ['.gz', '.bz2', '.xz'])
+def test_compressed_streamed_output_matches_whole(tmp_path, extraction_input, run_process, ext, run_mode):
+    whole_path = run_process('extraction', extraction_input, str(tmp_path / 'whole.csv'))
+    # Chunks are appended to the compressed output, each as its own compressed blocks.
+    streamed_path = run_process('extraction', extraction_input, str(tmp_path / f'{run_mode}.csv{ext}'),
+                                *RUN_MODES[run_mode])
+
+    assert streamed_path.endswith(ext)
+    pd.testing.assert_frame_equal(FILE_TYPES['csv'][1](streamed_path), FILE_TYPES['csv'][1](whole_path))
+
+
+# Data types of assigned columns seen by assign_dtypes_plugin.
+_plugin_dtypes = dict()
+
+
+def assign_dtypes_plugin(df):
+    """
+    Plugin recording data types of assigned columns, then working on one of them as str.
+    """
+    _plugin_dtypes.update({col_name: df[col_name].dtype for col_name in ('ASSIGN_CURRENCY', 'ASSIGN_DATE')})
+    return {'ASSIGN_CURRENCY': 'X' + df['ASSIGN_CURRENCY']}
+
+
+def test_plugins_get_plain_assigned_columns(tmp_path, extraction_input, run_process):
+    def update_config(config):
+        config['assign']['plugin'] = f'{__name__}.assign_dtypes_plugin'
+
+    output_path = run_process('extraction', extraction_input, str(tmp_path / 'output.csv'), update_config=update_config)
+
+    assert _plugin_dtypes == {'ASSIGN_CURRENCY': object, 'ASSIGN_DATE': object}
+    df = pd.read_csv(output_path, sep='|', dtype=str, keep_default_na=False)
+    assert set(df['CURRENCY']) == {'XUSD'}
+    # Sample output plugin prefixes assigned (empty) comments with the current date.
+    assert all(comments.endswith(' ') and len(comments) > 1 for comments in df['COMMENTS'])
+
+
+@pytest.mark.parametrize('as_category, dtype', [(True, 'category'), (False, object)])
+def test_assigned_text_constants(as_category, dtype):
+    df = etlu.assign_feature(pd.DataFrame({'AMOUNT': [1.0, 2.0]}), {'col_const': {'CURRENCY': 'USD', 'RATE': 1.5}},
+                             as_category=as_category)
+
+    assert df['CURRENCY'].dtype == dtype
+    assert list(df['CURRENCY'].astype(object)) == ['USD', 'USD']
+    assert df['RATE'].dtype == float
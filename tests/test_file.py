@@ -0,0 +1,162 @@
+import bz2
+import gzip
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+import utils.etl_util as etlu
+import utils.file_util as fileu
+
+DECOMPRESS = {'.gz': gzip.decompress, '.bz2': bz2.decompress, '.xz': lzma.decompress}
+
+
+def _publish(path, content):
+    """
+    Publish a new version of given path, see fileu.publish_new.
+    """
+    tmp_path = fileu.temp_path(path)
+    with open(tmp_path, 'w') as file_target:
+        file_target.write(content)
+    return fileu.publish_new(tmp_path, path)
+
+
+def test_versions_are_distinct_and_counters_kept_out_of_output_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileu, 'VERSION_DIR', str(tmp_path / 'version'))
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    path = str(output_dir / 'output.csv')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda index: _publish(path, str(index)), range(20)))
+
+    assert sorted(os.listdir(output_dir)) == sorted(os.path.basename(new_path) for new_path in paths)
+    assert set(os.listdir(output_dir)) == {'output.csv'} | {f'output_{version}.csv' for version in range(1, 20)}
+
+
+def test_versions_start_again_in_emptied_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(fileu, 'VERSION_DIR', str(tmp_path / 'version'))
+    path = str(tmp_path / 'output.csv')
+    for index in range(3):
+        _publish(path, str(index))
+    for name in os.listdir(tmp_path):
+        if name.startswith('output'):
+            os.remove(tmp_path / name)
+
+    assert [os.path.basename(_publish(path, str(index))) for index in range(2)] == ['output.csv', 'output_1.csv']
+
+
+def _records(rows, seed=0):
+    """
+    Records of text, integer and float columns.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'CODE': rng.choice(['A', 'B', 'C'], rows), 'ID': np.arange(rows),
+                         'AMOUNT': rng.integers(0, 10000, rows) / 100})
+
+
+@pytest.mark.parametrize('ext', DECOMPRESS)
+def test_compressed_csv_round_trip(tmp_path, monkeypatch, ext):
+    # Small blocks, so that records are compressed by several threads, in several blocks.
+    monkeypatch.setattr(fileu, 'COMPRESSION_BLOCK_ROWS', 7)
+    df, df_appended = _records(50), _records(23, seed=1)
+    path = str(tmp_path / f'output.csv{ext}')
+
+    fileu.write(df, 'test', path, 'csv', False, separator='|', workers=3)
+    fileu.write(df_appended, 'test', path, 'csv', False, separator='|', mode='append', workers=3)
+
+    df_expected = pd.concat([df, df_appended], ignore_index=True)
+    with open(path, 'rb') as file_source:
+        assert DECOMPRESS[ext](file_source.read()).decode('utf-8') == df_expected.to_csv(sep='|', index=False)
+    pd.testing.assert_frame_equal(fileu.read('test', path, file_type='csv', separator='|'), df_expected)
+    chunks = list(fileu.read_chunks('test', path, 10, file_type='csv', separator='|'))
+    assert len(chunks) == 8
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df_expected)
+
+
+def test_only_csv_files_are_compressed(tmp_path):
+    with pytest.raises(ValueError):
+        fileu.compression_of(str(tmp_path / 'output.parquet.gz'), 'parquet')
+    with pytest.raises(ValueError):
+        fileu.compression_of(str(tmp_path / 'output.csv'), 'csv', 'zip')
+
+
+def test_glob_and_directory_inputs_read_files_in_path_order(tmp_path):
+    frames = {name: _records(rows, seed) for seed, (name, rows) in enumerate([('region_2', 5), ('region_10', 8),
+                                                                               ('region_1', 3)])}
+    for name, df in frames.items():
+        df.to_csv(tmp_path / f'{name}.csv', sep='|', index=False)
+    # Markers and hidden files of a directory are not read.
+    (tmp_path / '_SUCCESS').write_text('')
+    (tmp_path / '.region_0.csv').write_text('CODE|ID|AMOUNT\nZ|0|0\n')
+    names = ['region_1', 'region_10', 'region_2']
+    df_expected = pd.concat([frames[name] for name in names], ignore_index=True)
+    df_expected['SOURCE'] = [str(tmp_path / f'{name}.csv') for name in names for _ in range(len(frames[name]))]
+
+    for path in (str(tmp_path / 'region_*.csv'), str(tmp_path)):
+        config = {'path': path, 'file_type': 'csv', 'separator': '|', 'source_column': 'SOURCE', 'read_workers': 3}
+        assert etlu.source_paths(config) == [str(tmp_path / f'{name}.csv') for name in names]
+        pd.testing.assert_frame_equal(etlu.read_feature(config).astype({'SOURCE': object}), df_expected)
+        chunks = list(etlu.read_chunks_feature(config, 4))
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True).astype({'SOURCE': object}), df_expected)
+
+
+def test_partitioned_output_layout(tmp_path):
+    df = _records(40)
+    df.loc[::9, 'CODE'] = np.nan
+    path = str(tmp_path / 'output.csv')
+
+    dataset_path = fileu.write_partitions(df, 'test', path, 'csv', False, ['CODE'], separator='|', workers=3)
+
+    assert dataset_path == str(tmp_path / 'output')
+    assert sorted(os.listdir(dataset_path)) == ['CODE=A', 'CODE=B', 'CODE=C', 'CODE=null']
+    for directory in os.listdir(dataset_path):
+        assert os.listdir(os.path.join(dataset_path, directory)) == ['part.csv']
+    df_read = etlu.read_feature({'path': dataset_path, 'file_type': 'csv', 'separator': '|'})
+    pd.testing.assert_frame_equal(df_read.sort_values('ID', ignore_index=True), df)
+    # A new dataset is written next to the existing one.
+    assert fileu.write_partitions(df, 'test', path, 'csv', False, ['CODE'], separator='|', mode='new') == \
+        str(tmp_path / 'output_1')
+
+
+def _write_workbook(path, sheets):
+    """
+    Write dataframes as sheets of an Excel workbook.
+    """
+    with pd.ExcelWriter(path) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+
+
+def test_streamed_excel_read_matches_whole_read(tmp_path):
+    path = str(tmp_path / 'input.xlsx')
+    df_first, df_second = _records(11), _records(6, seed=1)
+    df_first.loc[3, 'AMOUNT'] = np.nan
+    _write_workbook(path, {'First': df_first, 'Second': df_second, 'Other': _records(2, seed=2)})
+
+    for sheet_name, use_cols in ((0, None), (['First', 'Second'], ['ID', 'AMOUNT'])):
+        df_expected = pd.concat(pd.read_excel(path, sheet_name=[sheet_name] if isinstance(sheet_name, int)
+                                              else sheet_name, usecols=use_cols).values(), ignore_index=True)
+        chunks = list(fileu.read_chunks('test', path, 4, file_type='excel', sheet_name=sheet_name, use_cols=use_cols))
+        assert max(len(df_chunk.index) for df_chunk in chunks) == 4
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df_expected)
+        pd.testing.assert_frame_equal(fileu.read('test', path, sheet_name=sheet_name, use_cols=use_cols), df_expected)
+
+
+def test_excel_sheet_cache_is_reused_until_workbook_changes(tmp_path, monkeypatch):
+    path, cache_dir = str(tmp_path / 'input.xlsx'), str(tmp_path / 'sheet')
+    _write_workbook(path, {'First': _records(5)})
+    pd.testing.assert_frame_equal(fileu.read('test', path, sheet_cache_dir=cache_dir), _records(5))
+
+    # Unchanged workbook is served from cache, for any column selection, whole or streamed.
+    with monkeypatch.context() as patch:
+        patch.setattr(fileu.pd, 'ExcelFile', None)
+        patch.setattr(fileu, 'read', None)
+        pd.testing.assert_frame_equal(fileu._read_excel(path, use_cols=['ID'], cache_dir=cache_dir),
+                                      _records(5)[['ID']])
+        chunks = list(fileu.read_chunks('test', path, 2, file_type='excel', sheet_cache_dir=cache_dir))
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), _records(5))
+
+    _write_workbook(path, {'First': _records(7, seed=3)})
+    pd.testing.assert_frame_equal(fileu.read('test', path, sheet_cache_dir=cache_dir), _records(7, seed=3))
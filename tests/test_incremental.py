@@ -0,0 +1,21 @@
+from tests.conftest import read_text
+
+
+def test_incremental_runs_match_full_run(tmp_path, extraction_input, run_process):
+    with open(extraction_input) as file_source:
+        lines = file_source.read().rstrip('\n').split('\n')
+    full_extraction = run_process('extraction', extraction_input, str(tmp_path / 'full_extraction.csv'))
+    full_transformation = run_process('transformation', full_extraction, str(tmp_path / 'full_transformation.csv'))
+
+    # Input grows between runs: only appended records are processed by the second runs.
+    input_path = tmp_path / 'incremental_input.csv'
+    input_path.write_text('\n'.join(lines[:40]) + '\n')
+    options = ('-incremental', '-state_dir', str(tmp_path / 'state'))
+    for _ in range(2):
+        extraction = run_process('extraction', str(input_path), str(tmp_path / 'extraction.csv'), *options)
+        transformation = run_process('transformation', extraction, str(tmp_path / 'transformation.csv'), *options)
+        input_path.write_text('\n'.join(lines) + '\n')
+
+    assert read_text(extraction) == read_text(full_extraction)
+    assert read_text(transformation) == read_text(full_transformation)
+    assert list((tmp_path / 'state').iterdir())
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils.etl_util as etlu
+
+
+def _frames(left_dtype):
+    """
+    Records whose keys are partly unmapped, along with an unsorted mapping of unique codes.
+    """
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({'K': pd.Series(rng.choice(['a', 'b', 'c', 'x', np.nan], 60), dtype=left_dtype),
+                       'V': range(60)}, index=range(100, 160))
+    df_mapping = pd.DataFrame({'CODE': ['c', 'a', 'b', 'd'], 'NAME': ['Cc', 'Aa', 'Bb', 'Dd'], 'RANK': range(4)})
+    return df, df_mapping
+
+
+@pytest.mark.parametrize('left_dtype', [object, 'category'])
+@pytest.mark.parametrize('strategy', etlu.JOIN_STRATEGIES)
+def test_join_strategies_match_merge(monkeypatch, strategy, left_dtype):
+    # Small inputs take the sorted join under the automatic strategy as well.
+    monkeypatch.setattr(etlu, 'SORTED_JOIN_MIN_ROWS', 10)
+    df, df_mapping = _frames(left_dtype)
+    config = {'read': {'path': 'mapping'}, 'left_on': ['K'], 'right_on': ['CODE'], 'strategy': strategy,
+              'report_unmatched': False}
+
+    expected = pd.merge(df, df_mapping.rename(columns={'CODE': 'K'}), how='left', on=['K'])
+    pd.testing.assert_frame_equal(etlu.mapping_feature(df, config, df_mapping=df_mapping), expected)
@@ -0,0 +1,33 @@
+import shutil
+import utils.etl_util as etlu
+from tests.conftest import MAPPING_PATH, read_text
+
+
+def test_modified_mapping_invalidates_cached_table(tmp_path, extraction_input, run_process, monkeypatch):
+    mapping_path = tmp_path / 'mapping.csv'
+    shutil.copyfile(MAPPING_PATH, mapping_path)
+    mapping_cache = tmp_path / 'mapping_cache'
+    read_feature = etlu.read_feature
+    reads = list()
+    monkeypatch.setattr(etlu, 'read_feature', lambda config: (reads.append(config['path']), read_feature(config))[1])
+
+    def run(name, *options, cache=True):
+        # Stage cache is bypassed, so that every run reads its mapping table.
+        return read_text(run_process('extraction', extraction_input, str(tmp_path / f'{name}.csv'), '-no_cache',
+                                     '-mapping', str(mapping_path), *options, cache=cache))
+
+    cold = run('cold')
+    assert cold == run('warm') == run('uncached', cache=False)
+    assert 'Sales' in cold and len(list(mapping_cache.iterdir())) == 1
+    assert reads.count(str(mapping_path)) == 2
+
+    # Same size, so that only the modification time tells the files apart.
+    mapping_path.write_text(mapping_path.read_text().replace('A,Sales', 'A,Sells'))
+    modified = run('modified')
+    assert modified == run('modified_uncached', cache=False)
+    assert 'Sales' not in modified and 'Sells' in modified
+    assert len(list(mapping_cache.iterdir())) == 2
+
+    # Stale tables are dropped by -clear_mapping_cache, then the current one is cached again.
+    assert run('cleared', '-clear_mapping_cache') == modified
+    assert len(list(mapping_cache.iterdir())) == 1
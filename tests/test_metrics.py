@@ -0,0 +1,44 @@
+import threading
+import time
+import utils.metrics_util as metricsu
+
+
+def _burn(seconds):
+    """
+    Keep the calling thread busy for given CPU time.
+    """
+    start = time.thread_time()
+    while time.thread_time() - start < seconds:
+        sum(range(1000))
+
+
+def test_stage_cpu_time_excludes_other_threads():
+    run = metricsu.start_run('test')
+    worker = threading.Thread(target=_burn, args=(0.3,))
+    with metricsu.stage('idle'):
+        worker.start()
+        worker.join()
+    metricsu.end_run(run, 'success')
+
+    stage = run['stages']['idle']
+    assert stage['wall_s'] >= 0.3
+    assert stage['cpu_s'] < 0.1
+    assert stage['calls'] == 1
+
+
+def test_stage_process_cpu_time_counts_threads_it_starts():
+    run = metricsu.start_run('test')
+    with metricsu.stage('outer'):
+        with metricsu.stage('pool'):
+            workers = [threading.Thread(target=_burn, args=(0.2,)) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+    metricsu.end_run(run, 'success')
+
+    pool, outer = run['stages']['pool'], run['stages']['outer']
+    assert pool['process_cpu_s'] >= 0.4
+    assert pool['cpu_s'] < 0.1
+    # Nested stages are excluded from the enclosing one.
+    assert outer['process_cpu_s'] < 0.1
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+import utils.plan_util as planu
+from tests.conftest import process_input, read_text
+from tests.test_run_modes import PROCESS_TYPES, RUN_MODES
+
+
+def _duplicate_type(config):
+    """
+    Transformation without aggregation, whose duplicated records get another employment type.
+    """
+    config['aggregate'] = None
+    config['dupl'] = {'col_const': {'TYPE': 'Duplicated'}}
+
+
+def test_dupl_column_is_not_pruned(tmp_path, extraction_input, run_process, monkeypatch):
+    extraction_path = run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+    optimized_path = run_process('transformation', extraction_path, str(tmp_path / 'optimized.csv'),
+                                 update_config=_duplicate_type)
+    monkeypatch.setattr(planu, 'optimize', lambda plan: plan)
+    unoptimized_path = run_process('transformation', extraction_path, str(tmp_path / 'unoptimized.csv'),
+                                   update_config=_duplicate_type)
+
+    assert read_text(optimized_path) == read_text(unoptimized_path)
+    df = pd.read_csv(optimized_path, sep='|', dtype=str, keep_default_na=False)
+    assert list(df['Employment_Type'][::2].unique()) == ['Duplicated']
+    assert 'Duplicated' not in set(df['Employment_Type'][1::2])
+    assert '' not in set(df['Employment_Type'][1::2])
+
+
+def _group_by_department(group_by):
+    """
+    Transformation aggregating by department only, given as a column name or a list of column names.
+    """
+    def update_config(config):
+        config['aggregate']['group_by'] = group_by
+        reorder = config['output']['rearrange']['col_reorder']
+        config['output']['rearrange']['col_reorder'] = [col_name for col_name in reorder
+                                                        if col_name != 'Employment_Type']
+    return update_config
+
+
+def test_single_group_by_column_is_not_pruned(tmp_path, extraction_input, run_process):
+    extraction_path = run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+    outputs = [run_process('transformation', extraction_path, str(tmp_path / f'{name}.csv'), *options,
+                           update_config=_group_by_department(group_by))
+               for name, group_by, options in (('list', ['MAP_ACCOUNT'], ()), ('str', 'MAP_ACCOUNT', ()),
+                                               ('chunked', 'MAP_ACCOUNT', ('-chunk_size', '7')))]
+
+    assert read_text(outputs[0]) == read_text(outputs[1]) == read_text(outputs[2])
+
+
+@pytest.mark.parametrize('run_mode', RUN_MODES)
+@pytest.mark.parametrize('process_type', PROCESS_TYPES)
+def test_plan_optimization_keeps_output(tmp_path, extraction_input, run_process, monkeypatch, process_type, run_mode):
+    input_path = process_input(process_type, tmp_path, extraction_input, run_process)
+    optimized_path = run_process(process_type, input_path, str(tmp_path / 'optimized.csv'), *RUN_MODES[run_mode])
+    monkeypatch.setattr(planu, 'optimize', lambda plan: plan)
+    unoptimized_path = run_process(process_type, input_path, str(tmp_path / 'unoptimized.csv'),
+                                   *RUN_MODES[run_mode])
+
+    assert read_text(optimized_path) == read_text(unoptimized_path)
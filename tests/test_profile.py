@@ -0,0 +1,73 @@
+import os
+import pstats
+import time
+import utils.profile_util as profileu
+
+
+def _leaf(seconds):
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        pass
+
+
+def _busy():
+    _leaf(0.02)
+    _leaf(0.02)
+
+
+def test_deterministic_profiles_are_written(tmp_path):
+    session = profileu.start_session('test')
+    with profileu.profile_stage('outer'):
+        _busy()
+        with profileu.profile_stage('inner'):
+            _leaf(0.02)
+    profileu.end_session(session)
+
+    summary = profileu.write_profiles(session, str(tmp_path), top=3)
+
+    assert sorted(os.listdir(tmp_path)) == ['test.inner.collapsed', 'test.inner.pstats', 'test.outer.collapsed',
+                                            'test.outer.pstats', 'test.summary.txt']
+    assert (tmp_path / 'test.summary.txt').read_text() == summary + '\n'
+    assert summary.startswith('Profile of test (deterministic):') and '_leaf (test_profile.py:' in summary
+    # Nested stage is profiled on its own, pausing the enclosing one.
+    outer_functions = {func[2] for func in pstats.Stats(str(tmp_path / 'test.outer.pstats')).stats}
+    assert '_busy' in outer_functions
+    inner_functions = {func[2] for func in pstats.Stats(str(tmp_path / 'test.inner.pstats')).stats}
+    assert '_busy' not in inner_functions and '_leaf' in inner_functions
+
+    stacks = dict(line.rsplit(' ', 1) for line in (tmp_path / 'test.outer.collapsed').read_text().splitlines())
+    assert all(stack.startswith('outer;') and int(weight) > 0 for stack, weight in stacks.items())
+    leaf_stacks = [stack for stack in stacks if stack.split(';')[-1].startswith('_leaf ')]
+    assert leaf_stacks and all(';_busy (test_profile.py:' in stack for stack in leaf_stacks)
+
+
+def test_collapsed_stacks_split_time_among_call_paths():
+    profiler = profileu.cProfile.Profile()
+    profiler.enable()
+    _busy()
+    _leaf(0.02)
+    profiler.disable()
+    stats = pstats.Stats(profiler)
+
+    stacks = profileu.collapse_stats(stats, 'stage')
+
+    own_us = {profileu._func_name(func): entry[2] * 1e6 for func, entry in stats.stats.items()}
+    leaf_name = next(name for name in own_us if name.startswith('_leaf '))
+    by_path = {stack: weight for stack, weight in stacks.items() if stack.endswith(';' + leaf_name)}
+    # Two thirds of _leaf time is spent under _busy, one third is called directly.
+    busy_path = next(weight for stack, weight in by_path.items() if ';_busy ' in stack)
+    assert abs(busy_path / sum(by_path.values()) - 2 / 3) < 0.1
+    assert abs(sum(by_path.values()) - own_us[leaf_name]) <= len(by_path)
+
+
+def test_sampling_profiles_are_written(tmp_path):
+    session = profileu.start_session('test', mode=profileu.MODE_SAMPLING, interval=0.001)
+    with profileu.profile_stage('outer'):
+        _busy()
+    profileu.end_session(session)
+
+    summary = profileu.write_profiles(session, str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == ['test.outer.collapsed', 'test.summary.txt']
+    assert summary.startswith('Profile of test (sampling):')
+    assert '_leaf (test_profile.py:' in (tmp_path / 'test.outer.collapsed').read_text()
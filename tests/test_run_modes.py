@@ -0,0 +1,30 @@
+import pytest
+from tests.conftest import process_input, read_text
+
+PROCESS_TYPES = ['extraction', 'transformation', 'pipeline']
+RUN_MODES = {
+    'whole': (),
+    'chunked': ('-chunk_size', '7'),
+    'workers': ('-workers', '2', '-chunk_size', '13')
+}
+
+
+@pytest.mark.parametrize('process_type', PROCESS_TYPES)
+def test_run_modes_write_same_output(tmp_path, extraction_input, run_process, process_type):
+    input_path = process_input(process_type, tmp_path, extraction_input, run_process)
+    outputs = [read_text(run_process(process_type, input_path, str(tmp_path / f'{run_mode}.csv'), *options))
+               for run_mode, options in RUN_MODES.items()]
+
+    assert outputs[0] and outputs.count(outputs[0]) == len(outputs)
+
+
+@pytest.mark.parametrize('run_mode', RUN_MODES)
+def test_pipeline_matches_extraction_then_transformation(tmp_path, extraction_input, run_process, run_mode):
+    extraction_path = run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+    transformation_path = run_process('transformation', extraction_path, str(tmp_path / 'transformation.csv'))
+    intermediate_path = str(tmp_path / 'intermediate.csv')
+    pipeline_path = run_process('pipeline', extraction_input, str(tmp_path / 'pipeline.csv'), *RUN_MODES[run_mode],
+                                '-intermediate', intermediate_path)
+
+    assert read_text(pipeline_path) == read_text(transformation_path)
+    assert read_text(intermediate_path) == read_text(extraction_path)
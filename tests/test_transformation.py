@@ -0,0 +1,16 @@
+import pandas as pd
+from tests.conftest import read_text
+
+
+def test_unmatched_department_group_comes_first(tmp_path, extraction_input, run_process):
+    extraction_path = run_process('extraction', extraction_input, str(tmp_path / 'extraction.csv'))
+    whole_path = run_process('transformation', extraction_path, str(tmp_path / 'whole.csv'))
+    chunked_path = run_process('transformation', extraction_path, str(tmp_path / 'chunked.csv'), '-chunk_size', '7')
+    pipeline_path = run_process('pipeline', extraction_input, str(tmp_path / 'pipeline.csv'))
+
+    assert read_text(whole_path) == read_text(chunked_path) == read_text(pipeline_path)
+    # Groups are ordered by department and type values, as when grouping str columns: unmatched ('') first.
+    df = pd.read_csv(whole_path, sep='|', dtype=str, keep_default_na=False)
+    keys = list(zip(df['Department'], df['Employment_Type']))
+    assert keys == sorted(keys)
+    assert keys[0][0] == ''
@@ -0,0 +1,157 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+RETURN_SUCCESS = 0
+RETURN_FAILURE = 1
+STATUS_SUCCESS = 'success'
+STATUS_FAILURE = 'failure'
+STATUS_SKIPPED = 'skipped'
+
+
+def resolve_dependencies(jobs):
+    """
+    Resolve dependencies between jobs: a job depends on jobs listed in its <depends_on> element
+    and on every job producing one of its <inputs>.
+    :param jobs: list of dict; Provided jobs, each with <name> and optional <inputs>, <outputs>, <depends_on> elements
+    :return: dict; Mapping of job name to set of names of jobs it depends on
+    """
+    producers = dict()
+    for job in jobs:
+        for output in job.get('outputs', list()):
+            producers[output] = job['name']
+
+    dependencies = dict()
+    for job in jobs:
+        if job['name'] in dependencies:
+            raise ValueError(f'Job <{job["name"]}> is defined more than once')
+        job_dependencies = set(job.get('depends_on', list()))
+        for job_input in job.get('inputs', list()):
+            if job_input in producers and producers[job_input] != job['name']:
+                job_dependencies.add(producers[job_input])
+        dependencies[job['name']] = job_dependencies
+
+    for name, job_dependencies in dependencies.items():
+        unknown = job_dependencies - dependencies.keys()
+        if unknown:
+            raise KeyError(f'Job <{name}> depends on unknown jobs <{sorted(unknown)}>')
+    _validate_acyclic(dependencies)
+    return dependencies
+
+
+def run_jobs(jobs, run_job, workers=1):
+    """
+    Run jobs in a pool of threads, starting each job as soon as all jobs it depends on have succeeded.
+    Jobs depending on a failed or skipped job are skipped.
+    :param jobs: list of dict; Provided jobs, see resolve_dependencies
+    :param run_job: callable; Called as run_job(job, upstream) where upstream maps names of jobs it depends on
+                    to values they returned; its own return value is passed on to dependent jobs
+    :param workers: int, default=1; Number of jobs running concurrently
+    :return: list of dict; Per job summary with <name>, <status>, <return_code>, <error>, <elapsed> elements,
+             in order of given jobs
+    """
+    dependencies = resolve_dependencies(jobs)
+    jobs_by_name = {job['name']: job for job in jobs}
+    results = dict()
+    values = dict()
+    running = dict()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while len(results) < len(jobs):
+            for name, job_dependencies in dependencies.items():
+                if name in results or name in running:
+                    continue
+                failed = [dep for dep in job_dependencies if dep in results
+                          and results[dep]['status'] != STATUS_SUCCESS]
+                if failed:
+                    results[name] = _job_result(name, STATUS_SKIPPED, f'Upstream jobs failed: <{sorted(failed)}>')
+                    logging.warning(f'Job <{name}> skipped, upstream jobs failed: <{sorted(failed)}>')
+                elif all(dep in values for dep in job_dependencies):
+                    upstream = {dep: values[dep] for dep in job_dependencies}
+                    running[name] = executor.submit(_timed, run_job, jobs_by_name[name], upstream)
+
+            if not running:
+                continue
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name in [name for name, future in running.items() if future in done]:
+                value, error, elapsed = running.pop(name).result()
+                if error is None:
+                    values[name] = value
+                    results[name] = _job_result(name, STATUS_SUCCESS, elapsed=elapsed)
+                    logging.info(f'Job <{name}> succeeded in <{elapsed:.3f}> seconds')
+                else:
+                    results[name] = _job_result(name, STATUS_FAILURE, error, elapsed)
+                    logging.error(f'Job <{name}> failed in <{elapsed:.3f}> seconds: {error}')
+
+    return [results[job['name']] for job in jobs]
+
+
+def format_summary(results):
+    """
+    Format per job summary as a text table.
+    :param results: list of dict; Per job summary, see run_jobs
+    :return: str; Formatted summary
+    """
+    width = max([len('JOB')] + [len(result['name']) for result in results])
+    lines = [f'{"JOB":<{width}}  {"STATUS":<8}  {"RC":>2}  {"SECONDS":>9}  ERROR']
+    for result in results:
+        elapsed = '' if result['elapsed'] is None else f'{result["elapsed"]:.3f}'
+        lines.append(f'{result["name"]:<{width}}  {result["status"]:<8}  {result["return_code"]:>2}  '
+                     f'{elapsed:>9}  {result["error"] or ""}')
+    total = sum(result['elapsed'] or 0.0 for result in results)
+    failed = sum(1 for result in results if result['status'] != STATUS_SUCCESS)
+    lines.append(f'Jobs: {len(results)}, failed or skipped: {failed}, total job seconds: {total:.3f}')
+    return '\n'.join(lines)
+
+
+def _timed(run_job, job, upstream):
+    """
+    Run a single job, measuring its wall time and capturing its error.
+    :param run_job: callable; Job runner, see run_jobs
+    :param job: dict; Provided job
+    :param upstream: dict; Values returned by jobs it depends on
+    :return: tuple; Returned value, error message (None on success) and elapsed seconds
+    """
+    start = time.perf_counter()
+    try:
+        value = run_job(job, upstream)
+        return value, None, time.perf_counter() - start
+    except Exception as job_error:
+        logging.exception(f'Job <{job["name"]}> raised an exception')
+        return None, f'{type(job_error).__name__}: {job_error}', time.perf_counter() - start
+
+
+def _job_result(name, status, error=None, elapsed=None):
+    """
+    Build per job summary.
+    :param name: str; Job name
+    :param status: str; One of STATUS_SUCCESS, STATUS_FAILURE or STATUS_SKIPPED
+    :param error: str, default=None; Error message
+    :param elapsed: float, default=None; Elapsed seconds, None if job did not run
+    :return: dict; Per job summary
+    """
+    return {'name': name, 'status': status,
+            'return_code': RETURN_SUCCESS if status == STATUS_SUCCESS else RETURN_FAILURE,
+            'error': error, 'elapsed': elapsed}
+
+
+def _validate_acyclic(dependencies):
+    """
+    Validate that job dependencies contain no cycle.
+    :param dependencies: dict; Mapping of job name to set of names of jobs it depends on
+    :return: null
+    """
+    visited = dict()
+
+    def visit(name, path):
+        if visited.get(name) == 'done':
+            return
+        if visited.get(name) == 'active':
+            raise ValueError(f'Job dependencies contain a cycle: <{" -> ".join(path + [name])}>')
+        visited[name] = 'active'
+        for dep in sorted(dependencies[name]):
+            visit(dep, path + [name])
+        visited[name] = 'done'
+
+    for job_name in dependencies:
+        visit(job_name, list())
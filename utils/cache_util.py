@@ -0,0 +1,197 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+# Default cache location and size cap, used when configuration does not provide them.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'opendata')
+READ_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'read')
+STAGE_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'stage')
+SHEET_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'sheet')
+CONFIG_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'config')
+DEFAULT_MAX_SIZE_MB = 1024
+CACHE_EXT = '.pkl'
+
+# In-process memo of objects built from files (e.g. compiled configs, mapping dataframes), only kept by long-running
+# processes, see enable_memo.
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def file_signature(path):
+    """
+    Build a signature of given file, changing whenever the file is replaced or modified.
+    :param path: str; Fully qualified file name
+    :return: list; Real path, modification time (ns) and size of the file
+    """
+    stat = os.stat(path)
+    return [os.path.realpath(path), stat.st_mtime_ns, stat.st_size]
+
+
+def file_digest(path, cache_dir=STAGE_CACHE_DIR):
+    """
+    Hash content of given file. Digest is kept in cache under the file signature, so that the file is only read
+    again once it is modified or replaced.
+    :param path: str; Fully qualified file name
+    :param cache_dir: str, default=STAGE_CACHE_DIR; Cache directory keeping digests
+    :return: str; Hex digest of file content
+    """
+    key = make_key('file_digest', file_signature(path))
+    digest = load(cache_dir, key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file_source:
+            for block in iter(lambda: file_source.read(1 << 20), b''):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        store(cache_dir, key, digest)
+    return digest
+
+
+def func_digest(func):
+    """
+    Hash source of the module defining given function (e.g. a plugin), so that editing it changes the digest.
+    :param func: callable; Provided function, None if there is none
+    :return: str; Hex digest of module source, qualified function name if source is not available
+    """
+    if func is None:
+        return None
+    try:
+        with open(inspect.getsourcefile(func), 'rb') as file_source:
+            return hashlib.sha256(file_source.read()).hexdigest()
+    except (OSError, TypeError):
+        return f'{getattr(func, "__module__", None)}.{getattr(func, "__qualname__", repr(func))}'
+
+
+def make_key(*parts):
+    """
+    Build a cache key out of given JSON serializable parts.
+    :param parts: Provided key parts
+    :return: str; Hex digest identifying given parts
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load(cache_dir, key):
+    """
+    Load a cached object, marking it as recently used.
+    :param cache_dir: str; Cache directory
+    :param key: str; Cache key, see make_key
+    :return: Cached object, None on a cache miss
+    """
+    path = os.path.join(cache_dir, key + CACHE_EXT)
+    try:
+        with open(path, 'rb') as file_cache:
+            value = pickle.load(file_cache)
+    except FileNotFoundError:
+        return None
+    except Exception as load_error:
+        # A corrupted entry is a miss; it will be overwritten by the next store.
+        logging.warning(f'Cache entry <{path}> could not be loaded: {load_error}')
+        return None
+
+    os.utime(path)
+    logging.info(f'Cache hit <{key}> in <{cache_dir}>')
+    return value
+
+
+def store(cache_dir, key, value, max_size_mb=DEFAULT_MAX_SIZE_MB):
+    """
+    Store an object into cache, atomically, then evict least recently used entries above size cap.
+    :param cache_dir: str; Cache directory
+    :param key: str; Cache key, see make_key
+    :param value: Object to cache, must be picklable
+    :param max_size_mb: int, default=DEFAULT_MAX_SIZE_MB; Size cap of cache directory, in megabytes
+    :return: null
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file_cache:
+            pickle.dump(value, file_cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(cache_dir, key + CACHE_EXT))
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    logging.info(f'Cache entry <{key}> stored in <{cache_dir}>')
+    evict(cache_dir, max_size_mb)
+
+
+def evict(cache_dir, max_size_mb=DEFAULT_MAX_SIZE_MB):
+    """
+    Remove least recently used entries until cache directory fits into size cap.
+    :param cache_dir: str; Cache directory
+    :param max_size_mb: int, default=DEFAULT_MAX_SIZE_MB; Size cap of cache directory, in megabytes
+    :return: int; Number of evicted entries
+    """
+    entries = list()
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(CACHE_EXT):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    max_size = max_size_mb * 1024 * 1024
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        os.remove(path)
+        total_size -= size
+        evicted += 1
+    if evicted:
+        logging.info(f'Cache entries <{evicted}> evicted from <{cache_dir}>')
+    return evicted
+
+
+def clear(cache_dir):
+    """
+    Remove every entry of given cache directory.
+    :param cache_dir: str; Cache directory
+    :return: null
+    """
+    if os.path.isdir(cache_dir):
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_EXT):
+                os.remove(entry.path)
+        logging.info(f'Cache <{cache_dir}> cleared')
+
+
+def enable_memo():
+    """
+    Keep objects built through memoize in memory for the lifetime of this process (e.g. daemon mode).
+    :return: null
+    """
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = dict()
+
+
+def memoize(name, signature, build):
+    """
+    Build an object, or return the one built before under the same name while its signature is unchanged (e.g. its
+    source files are neither modified nor replaced). Only the latest object is kept per name, and only once memo is
+    enabled (see enable_memo); otherwise the object is built every time.
+    :param name: str; Name of the object, e.g. a key made by make_key
+    :param signature: callable; Returns the current signature of the object, e.g. signatures of its source files
+    :param build: callable; Builds the object
+    :return: Built object, shared by every caller: it must not be updated
+    """
+    if _memo is None:
+        return build()
+    current = signature()
+    with _memo_lock:
+        entry = _memo.get(name)
+    if entry is not None and entry[0] == current:
+        return entry[1]
+    value = build()
+    with _memo_lock:
+        _memo[name] = (current, value)
+    logging.info(f'Memo <{name}> built')
+    return value
@@ -0,0 +1,284 @@
+import asyncio
+import fnmatch
+import functools
+import json
+import logging
+import os
+import signal
+import stat
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import utils.batch_util as batchu
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_POLL_INTERVAL = 0.5
+# Latencies of this many last jobs are kept for percentiles, see status.
+LATENCY_WINDOW = 1000
+# Longest request line accepted on the socket.
+SOCKET_LIMIT = 1 << 20
+COMMAND_STATUS = 'status'
+
+
+def serve(run_job, watches=None, socket_path=None, socket_job=None, workers=1, queue_size=DEFAULT_QUEUE_SIZE,
+          poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Run jobs submitted through watched drop directories and a local Unix socket, until SIGINT or SIGTERM.
+    Jobs wait in a queue of <queue_size> jobs and run in a pool of <workers> threads; once the queue is full,
+    watchers stop scanning and socket clients wait for their submission to be accepted (backpressure).
+    On stop, no more jobs are accepted and those already queued are run to completion.
+    A file dropped into a watched directory is submitted once it stays unchanged (size and modification time)
+    between two scans, so that a file still being written is left alone; hidden files are ignored (e.g. temporary
+    files renamed once written). It is then moved into <done_dir> or <error_dir> of its watch, when given,
+    or submitted again only once it is modified.
+    A socket client sends one JSON request per line and gets one JSON result per line, in order; a request
+    {"command": "status"} returns the daemon status instead of running a job.
+    :param run_job: callable; Called as run_job(job) in a worker thread, returns the output path of the job
+    :param watches: list of dict, default=None; Watched directories, each with <path>, <job> (callable building a job
+                    out of a dropped file name) and optional <pattern>, <done_dir>, <error_dir> elements
+    :param socket_path: str, default=None; Fully qualified Unix socket file name, no socket if not given
+    :param socket_job: callable, default=None; Builds a job out of a socket request, raising an error if it is invalid
+    :param workers: int, default=1; Number of jobs running concurrently
+    :param queue_size: int, default=DEFAULT_QUEUE_SIZE; Number of jobs waiting to run
+    :param poll_interval: float, default=DEFAULT_POLL_INTERVAL; Seconds between scans of watched directories
+    :return: dict; Daemon status once stopped, see status
+    """
+    return asyncio.run(_serve(run_job, watches or list(), socket_path, socket_job, max(1, workers),
+                              max(1, queue_size), poll_interval))
+
+
+def status(daemon):
+    """
+    Status of a daemon: number of jobs run, failed, queued and running, and latency percentiles of the last ones.
+    :param daemon: dict; Daemon state, see _serve
+    :return: dict; Daemon status
+    """
+    latencies = sorted(daemon['latencies'])
+    percentiles = {name: latencies[min(len(latencies) - 1, int(len(latencies) * share))] if latencies else None
+                   for name, share in (('p50', 0.5), ('p95', 0.95), ('max', 1.0))}
+    return {'jobs': daemon['jobs'], 'failed': daemon['failed'], 'queued': daemon['queue'].qsize(),
+            'running': daemon['running'], 'latency_ms': percentiles}
+
+
+def format_status(daemon_status):
+    """
+    Format daemon status as a single line.
+    :param daemon_status: dict; Daemon status, see status
+    :return: str; Formatted status
+    """
+    latency = ', '.join(f'{name} {value:.1f}' for name, value in daemon_status['latency_ms'].items()
+                        if value is not None)
+    return (f'Jobs: {daemon_status["jobs"]}, failed: {daemon_status["failed"]}, queued: {daemon_status["queued"]}, '
+            f'running: {daemon_status["running"]}, latency ms: {latency or "-"}')
+
+
+async def _serve(run_job, watches, socket_path, socket_job, workers, queue_size, poll_interval):
+    """
+    Daemon event loop, see serve.
+    :return: dict; Daemon status once stopped
+    """
+    daemon = {'queue': asyncio.Queue(maxsize=queue_size), 'stop': asyncio.Event(), 'jobs': 0, 'failed': 0,
+              'running': 0, 'latencies': deque(maxlen=LATENCY_WINDOW)}
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, daemon['stop'].set)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='opendata-daemon')
+    consumers = [asyncio.create_task(_consume(daemon, run_job, executor)) for _ in range(workers)]
+    producers = [asyncio.create_task(_watch(daemon, watch, poll_interval)) for watch in watches]
+    server = None
+    try:
+        if socket_path:
+            _remove_stale_socket(socket_path)
+            server = await asyncio.start_unix_server(functools.partial(_handle_client, daemon, socket_job),
+                                                     path=socket_path, limit=SOCKET_LIMIT)
+        logging.info(f'Daemon started: <{len(watches)}> watched directories, socket <{socket_path}>, '
+                     f'<{workers}> workers')
+        await daemon['stop'].wait()
+        logging.info('Daemon stopping, running queued jobs')
+    finally:
+        # Connected clients are not waited for: their pending results are written as queued jobs complete.
+        if server is not None:
+            server.close()
+            os.remove(socket_path)
+        for task in producers:
+            task.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+        await daemon['queue'].join()
+        for task in consumers:
+            task.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        executor.shutdown(wait=True)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+    return status(daemon)
+
+
+async def _consume(daemon, run_job, executor):
+    """
+    Worker task: run queued jobs one at a time in the thread pool, resolving the future of every job with its result.
+    :param daemon: dict; Daemon state
+    :param run_job: callable; Job runner, see serve
+    :param executor: ThreadPoolExecutor; Thread pool running jobs
+    :return: null
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        job, future = await daemon['queue'].get()
+        daemon['running'] += 1
+        try:
+            result = await loop.run_in_executor(executor, _run_timed, run_job, job)
+            daemon['jobs'] += 1
+            daemon['failed'] += result['status'] != batchu.STATUS_SUCCESS
+            daemon['latencies'].append(result['elapsed_ms'])
+            if not future.done():
+                future.set_result(result)
+        finally:
+            daemon['running'] -= 1
+            daemon['queue'].task_done()
+
+
+def _run_timed(run_job, job):
+    """
+    Run a single job, measuring its wall time and capturing its error; an invalid command line (which exits
+    the argument parser) fails the job rather than the daemon.
+    :param run_job: callable; Job runner, see serve
+    :param job: dict; Provided job, with a <name> element
+    :return: dict; Job result with <name>, <status>, <output_path>, <error> and <elapsed_ms> elements
+    """
+    start = time.perf_counter()
+    try:
+        output_path = run_job(job)
+        result = {'name': job['name'], 'status': batchu.STATUS_SUCCESS, 'output_path': output_path, 'error': None}
+    except SystemExit as exit_error:
+        logging.error(f'Job <{job["name"]}> has an invalid command line')
+        result = {'name': job['name'], 'status': batchu.STATUS_FAILURE, 'output_path': None,
+                  'error': f'Invalid command line, exit code <{exit_error.code}>'}
+    except Exception as job_error:
+        logging.exception(f'Job <{job["name"]}> raised an exception')
+        result = {'name': job['name'], 'status': batchu.STATUS_FAILURE, 'output_path': None,
+                  'error': f'{type(job_error).__name__}: {job_error}'}
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+    logging.info(f'Job <{job["name"]}> {result["status"]} in <{result["elapsed_ms"]:.1f}> ms')
+    return result
+
+
+async def _watch(daemon, watch, poll_interval):
+    """
+    Watcher task: scan a drop directory, submitting every file once it is complete, see serve.
+    :param daemon: dict; Daemon state
+    :param watch: dict; Watched directory, see serve
+    :param poll_interval: float; Seconds between scans
+    :return: null
+    """
+    loop = asyncio.get_running_loop()
+    pattern = watch.get('pattern') or '*'
+    # Signatures of files seen by the previous scan, of files submitted, and of files done but left in place.
+    seen, submitted, done = dict(), set(), dict()
+    while True:
+        try:
+            entries = [entry for entry in os.scandir(watch['path']) if not entry.name.startswith('.')
+                       and fnmatch.fnmatch(entry.name, pattern) and entry.is_file()]
+        except FileNotFoundError:
+            logging.warning(f'Watched directory <{watch["path"]}> does not exist')
+            entries = list()
+
+        current = dict()
+        for entry in sorted(entries, key=lambda item: item.name):
+            try:
+                entry_stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            signature = (entry_stat.st_mtime_ns, entry_stat.st_size)
+            current[entry.path] = signature
+            if entry.path in submitted or done.get(entry.path) == signature or seen.get(entry.path) != signature:
+                continue
+            try:
+                job = watch['job'](entry.path)
+            except Exception as job_error:
+                logging.error(f'File <{entry.path}> cannot be submitted: {job_error}')
+                done[entry.path] = signature
+                continue
+            submitted.add(entry.path)
+            future = loop.create_future()
+            future.add_done_callback(functools.partial(_file_done, watch, entry.path, signature, submitted, done))
+            logging.info(f'File <{entry.path}> submitted as job <{job["name"]}>')
+            await daemon['queue'].put((job, future))
+        seen = current
+        for path in [path for path in done if path not in current]:
+            del done[path]
+        await asyncio.sleep(poll_interval)
+
+
+def _file_done(watch, path, signature, submitted, done, future):
+    """
+    Move a processed file into <done_dir> or <error_dir> of its watch, or remember it is processed if not given.
+    :param watch: dict; Watched directory, see serve
+    :param path: str; Fully qualified file name
+    :param signature: tuple; Signature of the file when it was submitted
+    :param submitted: set; Files submitted and not processed yet, of the watch
+    :param done: dict; Signatures of files processed but left in place, of the watch
+    :param future: asyncio.Future; Resolved with the job result
+    :return: null
+    """
+    submitted.discard(path)
+    success = not future.cancelled() and future.result()['status'] == batchu.STATUS_SUCCESS
+    target_dir = watch.get('done_dir') if success else watch.get('error_dir')
+    if not target_dir:
+        done[path] = signature
+        return
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        os.replace(path, os.path.join(target_dir, os.path.basename(path)))
+    except OSError as move_error:
+        logging.error(f'File <{path}> could not be moved into <{target_dir}>: {move_error}')
+        done[path] = signature
+
+
+async def _handle_client(daemon, socket_job, reader, writer):
+    """
+    Socket connection: run every requested job in turn, writing back its result, see serve.
+    :param daemon: dict; Daemon state
+    :param socket_job: callable; Builds a job out of a request
+    :param reader: asyncio.StreamReader; Connection reader
+    :param writer: asyncio.StreamWriter; Connection writer
+    :return: null
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict) and request.get('command') == COMMAND_STATUS:
+                    response = status(daemon)
+                elif daemon['stop'].is_set():
+                    response = {'status': batchu.STATUS_FAILURE, 'error': 'Daemon is stopping'}
+                else:
+                    job = socket_job(request)
+                    future = loop.create_future()
+                    await daemon['queue'].put((job, future))
+                    response = await future
+            except Exception as request_error:
+                response = {'status': batchu.STATUS_FAILURE, 'error': f'Invalid request: {request_error}'}
+            writer.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+            await writer.drain()
+    except (ConnectionError, ValueError) as connection_error:
+        logging.warning(f'Daemon client disconnected: {connection_error}')
+    finally:
+        writer.close()
+
+
+def _remove_stale_socket(socket_path):
+    """
+    Remove the socket file left by a daemon which did not stop cleanly; any other file is left alone.
+    :param socket_path: str; Fully qualified Unix socket file name
+    :return: null
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+    except FileNotFoundError:
+        pass
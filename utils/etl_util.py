@@ -1,9 +1,57 @@
+import logging
+import math
+import os
+import weakref
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import utils.cache_util as cacheu
 import utils.file_util as fileu
 import utils.misc_util as miscu
+import utils.plan_util as planu
 import datetime
 
+# Partial states carried for every supported aggregation function, when aggregating chunk by chunk.
+AGGREGATE_PARTIAL_STATES = {
+    'sum': ['sum'],
+    'count': ['count'],
+    'min': ['min'],
+    'max': ['max'],
+    'mean': ['sum', 'count']
+}
+# Reader data types of <apply_dtype> types, see read_feature; other types are only set by apply_dtype_feature.
+READ_DTYPES = {
+    'str': str,
+    'float': 'float64',
+    'category': 'category'
+}
+# Join strategies of mapping feature; 'auto' chooses one from the mapping table, see mapping_feature.
+JOIN_STRATEGY_AUTO = 'auto'
+JOIN_STRATEGY_BROADCAST = 'broadcast'
+JOIN_STRATEGY_HASH = 'hash'
+JOIN_STRATEGY_SORTED = 'sorted'
+JOIN_STRATEGIES = (JOIN_STRATEGY_AUTO, JOIN_STRATEGY_BROADCAST, JOIN_STRATEGY_HASH, JOIN_STRATEGY_SORTED)
+# Mapping tables from this size on, when already sorted on their key, are binary searched rather than hashed.
+SORTED_JOIN_MIN_ROWS = 1000000
+# Number of distinct unmatched keys reported by mapping feature.
+UNMATCHED_SAMPLE_SIZE = 10
+# Merge indicator column of hash joins, dropped once unmatched records are counted.
+MERGE_INDICATOR = '_mapping_merge_'
+# Aggregation function merging partial states of the same kind.
+AGGREGATE_STATE_COMBINE = {
+    'sum': 'sum',
+    'count': 'sum',
+    'min': 'min',
+    'max': 'max'
+}
+# Aggregations given a <memory_budget_mb> spill their data to disk, hash-partitioned by group keys, once the working
+# memory of their groupby, taken as this many times the size of its input, exceeds the budget.
+AGGREGATE_MEMORY_FACTOR = 2
+MIN_SPILL_PARTITIONS = 8
+# Number of values measured to estimate the memory taken by an object column.
+SIZE_SAMPLE_ROWS = 1000
+SPILL_FILE_FORMAT = 'part-{:05d}.pkl'
+
 
 def aggregate_feature(df, config):
     """
@@ -11,18 +59,300 @@ def aggregate_feature(df, config):
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
     :return: df_target: pd.DataFrame; Resulted dataframe
+    Given a <memory_budget_mb>, input exceeding the budget is hash-partitioned by group keys into spill files, every
+    partition being aggregated on its own; each group then holds the same records in the same order, hence the same
+    result as aggregated in memory.
     Sample:
     "aggregate"
     """
     if config:
-        return df.groupby(miscu.eval_elem_mapping(config, "group_by")).agg(miscu.eval_elem_mapping(config, "agg")).reset_index()
+        budget = _aggregate_memory_budget(config)
+        if budget and len(df.index):
+            columns = list(dict.fromkeys(_group_keys(config) + list(miscu.eval_elem_mapping(config, "agg"))))
+            size = _frame_size(df, columns)
+            if size * AGGREGATE_MEMORY_FACTOR > budget:
+                return _spill_aggregate_feature(df[columns] if len(columns) < len(df.columns) else df, config, size,
+                                                budget)
+        return df.groupby(_group_keys(config), observed=True).agg(
+            miscu.eval_elem_mapping(config, "agg")).reset_index()
     else:
         return df
 
 
+def _spill_aggregate_feature(df, config, size, budget):
+    """
+    Aggregate given dataframe partition by partition, spilling it to disk hash-partitioned by group keys.
+    :param df: pd.DataFrame; Provided dataframe, restricted to group keys and aggregated columns
+    :param config: dict; Provided <aggregate> feature configuration
+    :param size: float; Estimated size of the dataframe in bytes, see _frame_size
+    :param budget: float; Memory budget in bytes
+    :return: df_target: pd.DataFrame; Resulted dataframe
+    """
+    group_keys = _group_keys(config)
+    # Records are spilled slice by slice, so that partitioning does not copy the whole dataframe at once.
+    slice_rows = max(1, int(len(df.index) * budget / (AGGREGATE_MEMORY_FACTOR * size)))
+    with fileu.spill_directory(miscu.eval_elem_mapping(config, "spill_dir")) as directory:
+        paths = _spill_paths(directory, _spill_partition_count(config, size, budget))
+        logging.info(f'Aggregation input of ~{size / 1024 / 1024:.1f} MB exceeds memory budget, spilling it into '
+                     f'<{len(paths)}> partitions under <{directory}>')
+        spilled = 0
+        for start in range(0, len(df.index), slice_rows):
+            spilled += _spill_partitioned(df.iloc[start:start + slice_rows], group_keys, paths)
+        logging.info(f'Aggregation spilled {spilled} bytes')
+
+        frames = list()
+        for path in paths:
+            parts = list(fileu.read_spill(path))
+            if parts:
+                df_spilled = pd.concat(parts, ignore_index=True)
+                frames.append(df_spilled.groupby(group_keys, observed=True).agg(
+                    miscu.eval_elem_mapping(config, "agg")).reset_index())
+    return _concat_partition_frames(frames, group_keys)
+
+
+def aggregate_chunks_feature(chunks, config):
+    """
+    ETL feature to aggregate given dataframe chunks, producing the same result as aggregate_feature on their union.
+    Every chunk is reduced to partial states which are merged into running ones, so memory grows with number of groups.
+    Given a <memory_budget_mb>, running partial states exceeding the budget are spilled to disk, hash-partitioned by
+    group keys, along with those of the remaining chunks; every partition is then merged and finalized on its own,
+    in the same order as in memory.
+    :param chunks: iterable of pd.DataFrame; Provided dataframe chunks
+    :param config: dict; Provided feature configuration
+    :return: df_target: pd.DataFrame; Resulted dataframe
+    """
+    if not config:
+        return pd.concat(chunks, ignore_index=True)
+
+    budget = _aggregate_memory_budget(config)
+    chunks = iter(chunks)
+    df_partial = None
+    for df_chunk in chunks:
+        df_chunk_partial = partial_aggregate_feature(df_chunk, config)
+        df_partial = df_chunk_partial if df_partial is None else combine_aggregate_feature(df_partial,
+                                                                                           df_chunk_partial, config)
+        if budget and _frame_size(df_partial) * AGGREGATE_MEMORY_FACTOR > budget:
+            break
+    else:
+        return finalize_aggregate_feature(df_partial, config)
+
+    group_keys = _group_keys(config)
+    size = _frame_size(df_partial)
+    with fileu.spill_directory(miscu.eval_elem_mapping(config, "spill_dir")) as directory:
+        paths = _spill_paths(directory, _spill_partition_count(config, size, budget))
+        logging.info(f'Partial aggregation states of ~{size / 1024 / 1024:.1f} MB exceed memory budget, spilling them '
+                     f'into <{len(paths)}> partitions under <{directory}>')
+        spilled = _spill_partitioned(df_partial, group_keys, paths)
+        df_partial = df_chunk = df_chunk_partial = None
+        for df_chunk in chunks:
+            spilled += _spill_partitioned(partial_aggregate_feature(df_chunk, config), group_keys, paths)
+        df_chunk = None
+        logging.info(f'Aggregation spilled {spilled} bytes')
+
+        frames = list()
+        for path in paths:
+            df_partial = None
+            for df_spilled in fileu.read_spill(path):
+                df_partial = df_spilled if df_partial is None else combine_aggregate_feature(df_partial, df_spilled,
+                                                                                             config)
+            if df_partial is not None:
+                frames.append(finalize_aggregate_feature(df_partial, config))
+    return _concat_partition_frames(frames, group_keys)
+
+
+def partial_aggregate_feature(df, config):
+    """
+    ETL feature to reduce given dataframe to partial aggregation states (sum, count, min, max) per group.
+    :param df: pd.DataFrame; Provided dataframe
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: df_target: pd.DataFrame; Partial states, one column per <column>__<state>
+    """
+    group_keys = _group_keys(config)
+    partial_agg = dict()
+    for col_name, state in _aggregate_states(config):
+        partial_agg[_aggregate_state_name(col_name, state)] = (col_name, state)
+    return df.groupby(group_keys, observed=True).agg(**partial_agg).reset_index()
+
+
+def combine_aggregate_feature(df_partial, df_other, config):
+    """
+    ETL feature to merge two dataframes of partial aggregation states.
+    :param df_partial: pd.DataFrame; Provided partial states
+    :param df_other: pd.DataFrame; Provided partial states to merge with
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: df_target: pd.DataFrame; Merged partial states
+    """
+    group_keys = _group_keys(config)
+    combine_agg = dict()
+    for col_name, state in _aggregate_states(config):
+        combine_agg[_aggregate_state_name(col_name, state)] = AGGREGATE_STATE_COMBINE[state]
+    df_target = pd.concat([df_partial, df_other], ignore_index=True)
+    return df_target.groupby(group_keys, observed=True).agg(combine_agg).reset_index()
+
+
+def finalize_aggregate_feature(df_partial, config):
+    """
+    ETL feature to turn partial aggregation states into final aggregated values, shaped as aggregate_feature result.
+    :param df_partial: pd.DataFrame; Provided partial states
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: df_target: pd.DataFrame; Resulted dataframe
+    """
+    df_target = df_partial[_group_keys(config)].copy()
+    config_agg = miscu.eval_elem_mapping(config, "agg")
+    # A list of functions for any column results in (column, function) column labels, as in DataFrame.agg.
+    multi_columns = any(isinstance(funcs, list) for funcs in config_agg.values())
+    for col_name, funcs in config_agg.items():
+        for func in (funcs if isinstance(funcs, list) else [funcs]):
+            if func == 'mean':
+                values = (df_partial[_aggregate_state_name(col_name, 'sum')]
+                          / df_partial[_aggregate_state_name(col_name, 'count')])
+            else:
+                values = df_partial[_aggregate_state_name(col_name, func)]
+            df_target[(col_name, func) if multi_columns else col_name] = values.values
+
+    if multi_columns:
+        df_target.columns = pd.MultiIndex.from_tuples(
+            [col if isinstance(col, tuple) else (col, '') for col in df_target.columns])
+    return df_target
+
+
+def _aggregate_states(config):
+    """
+    List partial states needed by <agg> config section, validating that every function can be aggregated by chunks.
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: list of tuple; Distinct (column, state) pairs
+    """
+    states = list()
+    for col_name, funcs in miscu.eval_elem_mapping(config, "agg").items():
+        for func in (funcs if isinstance(funcs, list) else [funcs]):
+            if func not in AGGREGATE_PARTIAL_STATES:
+                raise ValueError(f'Aggregation <{func}> of column <{col_name}> cannot be computed by chunks')
+            for state in AGGREGATE_PARTIAL_STATES[func]:
+                if (col_name, state) not in states:
+                    states.append((col_name, state))
+    return states
+
+
+def _aggregate_state_name(col_name, state):
+    """
+    Name of the column holding given partial state of given column.
+    :param col_name: str; Aggregated column name
+    :param state: str; Partial state, see AGGREGATE_PARTIAL_STATES
+    :return: str; Partial state column name
+    """
+    return f'{col_name}__{state}'
+
+
+def _group_keys(config):
+    """
+    Group keys of <aggregate> config section, as a list.
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: list; Group key column names
+    """
+    group_by = miscu.eval_elem_mapping(config, "group_by")
+    return [group_by] if isinstance(group_by, str) else list(group_by)
+
+
+def _aggregate_memory_budget(config):
+    """
+    Memory budget of an aggregation, from <memory_budget_mb> element of <aggregate> config section.
+    :param config: dict; Provided <aggregate> feature configuration
+    :return: float; Memory budget in bytes, None if aggregation is not bounded
+    """
+    # Read as given, so that a zero budget is reported rather than taken as missing.
+    budget_mb = config.get("memory_budget_mb")
+    if budget_mb is None:
+        return None
+    if isinstance(budget_mb, bool) or not isinstance(budget_mb, (int, float)) or budget_mb <= 0:
+        logging.error(f'Aggregation memory budget <{budget_mb}> is not a positive number of megabytes')
+        raise ValueError(f'Aggregation memory budget <{budget_mb}> is not a positive number of megabytes')
+    return budget_mb * 1024 * 1024
+
+
+def _spill_partition_count(config, size, budget):
+    """
+    Number of spill partitions: <spill_partitions> element of <aggregate> config section if given, otherwise enough
+    partitions for each one to be aggregated within the memory budget, MIN_SPILL_PARTITIONS at least.
+    :param config: dict; Provided <aggregate> feature configuration
+    :param size: float; Estimated size of spilled data in bytes
+    :param budget: float; Memory budget in bytes
+    :return: int; Number of spill partitions
+    """
+    # Read as given, so that zero partitions are reported rather than taken as missing.
+    partitions = config.get("spill_partitions")
+    if partitions is None:
+        return max(MIN_SPILL_PARTITIONS, math.ceil(size * AGGREGATE_MEMORY_FACTOR / budget))
+    if isinstance(partitions, bool) or not isinstance(partitions, int) or partitions <= 0:
+        logging.error(f'Number of spill partitions <{partitions}> is not a positive integer')
+        raise ValueError(f'Number of spill partitions <{partitions}> is not a positive integer')
+    return partitions
+
+
+def _spill_paths(directory, partitions):
+    """
+    Spill files of every partition.
+    :param directory: str; Spill directory, see fileu.spill_directory
+    :param partitions: int; Number of spill partitions
+    :return: list of str; Fully qualified spill file names, one per partition
+    """
+    return [os.path.join(directory, SPILL_FILE_FORMAT.format(part)) for part in range(partitions)]
+
+
+def _spill_partitioned(df, group_keys, paths):
+    """
+    Append records of given dataframe to spill files, by hash of their group keys, keeping their order.
+    :param df: pd.DataFrame; Provided dataframe
+    :param group_keys: list; Group key column names
+    :param paths: list of str; Spill files of every partition, see _spill_paths
+    :return: int; Number of bytes spilled
+    """
+    part_ids = pd.util.hash_pandas_object(df[group_keys], index=False).to_numpy() % len(paths)
+    order = np.argsort(part_ids, kind='stable')
+    bounds = np.searchsorted(part_ids[order], np.arange(len(paths) + 1))
+    df_sorted = df.take(order)
+    spilled = 0
+    for part, path in enumerate(paths):
+        if bounds[part + 1] > bounds[part]:
+            spilled += fileu.append_spill(path, df_sorted.iloc[bounds[part]:bounds[part + 1]])
+    return spilled
+
+
+def _concat_partition_frames(frames, group_keys):
+    """
+    Concatenate aggregated partitions, sorted by group keys as a groupby result is.
+    :param frames: list of pd.DataFrame; Aggregated partitions, group keys first
+    :param group_keys: list; Group key column names
+    :return: df_target: pd.DataFrame; Resulted dataframe
+    """
+    frames = [df for df in frames if len(df.index)] or frames[:1]
+    df_target = pd.concat(frames, ignore_index=True)
+    # Group keys are the first columns, labelled (key, '') when aggregated columns are multi-level.
+    return df_target.sort_values(list(df_target.columns[:len(group_keys)]), ignore_index=True)
+
+
+def _frame_size(df, columns=None):
+    """
+    Estimate memory taken by columns of a dataframe; object columns (e.g. strings) are measured on a sample of values.
+    :param df: pd.DataFrame; Provided dataframe
+    :param columns: list, default=None; Column names, every column if not given
+    :return: float; Estimated size in bytes
+    """
+    rows = len(df.index)
+    size = 0
+    for col_name in (df.columns if columns is None else columns):
+        values = df[col_name]
+        if values.dtype == object and rows > SIZE_SAMPLE_ROWS:
+            sample = values.iloc[::rows // SIZE_SAMPLE_ROWS]
+            size += sample.memory_usage(index=False, deep=True) * rows / len(sample.index)
+        else:
+            size += values.memory_usage(index=False, deep=True)
+    return size
+
+
 def apply_dtype_feature(df, config):
     """
     ETL feature to apply data types to dataframe columns and limit columns to ones specified
+    Columns already having the requested type (e.g. set by the reader, see read_feature) are left untouched
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
     :return: df_target: pd.DataFrame; Resulted dataframe
@@ -30,42 +360,104 @@ def apply_dtype_feature(df, config):
     "apply_dtype": {
         "INSURANCE_CODE": "str",
         "INSURANCE_AMOUNT": "float",
-        "CLIENT_TYPE": "int"
+        "CLIENT_TYPE": "int",
+        "CLIENT_CATEGORY": "category"
     }
     """
     if config and isinstance(config, dict):
         for column_key, type_value in config.items():
             if column_key in df:
+                type_name = _dtype_name(type_value)
+                if isinstance(df[column_key].dtype, pd.CategoricalDtype) and type_name != 'category':
+                    # Text categories (e.g. assigned constants) already hold str values, keep them categorical.
+                    if type_name == 'str' and pd.api.types.is_string_dtype(df[column_key].cat.categories):
+                        type_name = 'category'
+                    else:
+                        df[column_key] = df[column_key].astype(object)
                 # str type.
-                if type_value is str or type_value == 'str':
-                    df[column_key] = df[column_key].fillna('')
-                    df[column_key] = df[column_key].astype(str)
+                if type_name == 'str':
+                    if df[column_key].hasnans:
+                        df[column_key] = df[column_key].fillna('')
+                    if not pd.api.types.is_string_dtype(df[column_key]):
+                        df[column_key] = df[column_key].astype(str)
                 # int type.
-                elif type_value is int or type_value == 'int':
-                    df[column_key] = df[column_key].fillna(0)
-                    df[column_key] = df[column_key].astype(int)
+                elif type_name == 'int':
+                    if df[column_key].hasnans:
+                        df[column_key] = df[column_key].fillna(0)
+                    if df[column_key].dtype != np.dtype(int):
+                        df[column_key] = df[column_key].astype(int)
                 # float type.
-                elif type_value is float or type_value == 'float':
-                    df[column_key] = df[column_key].fillna(0.0)
-                    df[column_key] = df[column_key].astype(float)
-                # TODO: Implement datetime.date type
-                elif type_value is datetime.date or type_value == "datetime.date":
-                    df[column_key] = df[column_key].fillna(datetime.date(1997, 2, 6))
-                    df[column_key] = pd.to_datetime(df[column_key])
-                    #df[column_key] = df[column_key].astype(datetime.date)
+                elif type_name == 'float':
+                    if df[column_key].hasnans:
+                        df[column_key] = df[column_key].fillna(0.0)
+                    if df[column_key].dtype != np.dtype(float):
+                        df[column_key] = df[column_key].astype(float)
+                # category type, missing values become an empty string category, as for str type.
+                elif type_name == 'category':
+                    if not isinstance(df[column_key].dtype, pd.CategoricalDtype):
+                        df[column_key] = df[column_key].astype('category')
+                    if df[column_key].hasnans:
+                        if '' not in df[column_key].cat.categories:
+                            df[column_key] = df[column_key].cat.add_categories('')
+                        df[column_key] = df[column_key].fillna('')
+                    df[column_key] = _sorted_categories(df[column_key])
+                # datetime.date type, parsed by csv reader (see _read_dtype_arguments) or converted here,
+                # missing values become the default date.
+                elif type_name == 'datetime.date':
+                    if pd.api.types.is_datetime64_any_dtype(df[column_key]):
+                        if df[column_key].hasnans:
+                            df[column_key] = df[column_key].fillna(pd.Timestamp(datetime.date(1997, 2, 6)))
+                    else:
+                        df[column_key] = df[column_key].fillna(datetime.date(1997, 2, 6))
+                        df[column_key] = pd.to_datetime(df[column_key])
             else:
                 raise KeyError(f'Column <{column_key}> is missing from given dataframe')
 
-        # Limit dataframe to specified columns.
-        df = df[list(config.keys())]
+        # Limit dataframe to specified columns, unless it already is.
+        if list(df.columns) != list(config.keys()):
+            df = df[list(config.keys())]
     return df
 
 
-def assign_feature(df, config):
+def _sorted_categories(column):
+    """
+    Sort text categories of a categorical column, so that grouping on it orders groups as grouping on its str values
+    would (e.g. the empty string category of missing values comes first).
+    :param column: pd.Series; Provided categorical column
+    :return: pd.Series; Categorical column with sorted categories
+    """
+    categories = column.cat.categories
+    if pd.api.types.is_string_dtype(categories) and not categories.is_monotonic_increasing:
+        return column.cat.reorder_categories(categories.sort_values())
+    return column
+
+
+def auto_category_feature(df, threshold):
+    """
+    ETL feature to convert low-cardinality text columns into category type
+    :param df: pd.DataFrame; Provided dataframe
+    :param threshold: float; Maximum ratio of distinct values to records of a column to be converted
+    :return: df_target: pd.DataFrame; Resulted dataframe
+    Sample:
+    "auto_category": 0.05
+    """
+    length = len(df.index)
+    to_category = dict()
+    if length:
+        for column_key in df.columns:
+            if df[column_key].dtype == object and df[column_key].nunique(dropna=False) <= threshold * length:
+                to_category[column_key] = 'category'
+    return df.astype(to_category) if to_category else df
+
+
+def assign_feature(df, config, as_category=True):
     """
     ETL feature to assign new columns to a given dataframe
+    Text values are stored as single-category columns, so that a constant column costs one byte per record
+    and its value is only materialized when written; plugins working on them get plain str columns instead
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
+    :param as_category: bool, default=True; Whether text values are stored as single-category columns
     :return: df_target: pd.DataFrame; Resulted dataframe
     """
     if not config:
@@ -86,7 +478,7 @@ def assign_feature(df, config):
             config_assign.update(config_assign_var)
 
         for col_name, col_value in config_assign.items():
-            df_target[col_name] = [col_value] * length
+            df_target[col_name] = _constant_column(col_value, length, as_category)
 
         return df_target
 
@@ -94,6 +486,7 @@ def assign_feature(df, config):
 def dupl_feature(df, config):
     """
     ETL feature to duplicate every row with an ability to change particular values.
+    Columns keep their data types; values given in config override the first copy of every row.
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
     :return: df_target: pd.DataFrame; Resulted dataframe
@@ -101,55 +494,604 @@ def dupl_feature(df, config):
     if not config:
         return df
     else:
-        length = len(df.values)
-        df_target = pd.DataFrame(np.repeat(df.values, [2] * length, axis=0),
-                                 columns=df.columns.values)
+        length = len(df.index)
+        df_target = df.take(np.repeat(np.arange(length), 2)).reset_index(drop=True)
+        first_copy = np.zeros(2 * length, dtype=bool)
+        first_copy[::2] = True
+
         config_assign = miscu.eval_elem_mapping(config, 'col_const')
         for col_name, col_value in config_assign.items():
-            df_target.loc[::2, col_name] = col_value
+            if col_name in df_target:
+                column = df_target[col_name]
+            else:
+                column = pd.Series(np.nan, index=df_target.index)
+            if isinstance(column.dtype, pd.CategoricalDtype) and col_value not in column.cat.categories:
+                column = column.cat.add_categories([col_value])
+            df_target[col_name] = column.mask(first_copy, col_value)
 
         return df_target
 
 
-def mapping_feature(df, config):
+def _constant_column(value, length, as_category=True):
+    """
+    Build a column holding given value in every record, a single-category column for text values.
+    :param value: Provided value
+    :param length: int; Number of records
+    :param as_category: bool, default=True; Whether a text value is stored as a single-category column
+    :return: pd.Categorical or np.ndarray; Resulted column values
+    """
+    if isinstance(value, str):
+        if as_category:
+            return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+        return np.full(length, value, dtype=object)
+    return np.full(length, value)
+
+
+def mapping_feature(df, config, df_mapping=None):
     """
-    ETL feature to merge given dataframe with extracted mapping dataframe
+    ETL feature to merge given dataframe with extracted mapping dataframe, then with those of optional <lookups>,
+    each looked up on its own keys, in order (a lookup may use columns brought by the previous ones)
+    Every table is joined with a strategy chosen from its size, key uniqueness and sortedness, unless given by
+    <strategy>:
+    - broadcast: unique keys of the mapping table are looked up, mapping columns are taken along (e.g. CODE to
+      DEPT_NAME); a categorical key is looked up once per category; the lookup index is built once per mapping table
+    - sorted: unique keys of a large mapping table sorted on them are binary searched, no hash table is built;
+      chosen when keys to look up are sorted too (e.g. chunks of a sorted input)
+    - hash: left merge, needed for mapping tables with duplicate keys (records are repeated once per match)
+    Every strategy gives the same result as a left merge: a single set of key columns, records in order, fresh index.
+    Records left unmatched are counted, and a sample of their keys reported, from the join itself.
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
+    :param df_mapping: pd.DataFrame or list, default=None; Already extracted mapping dataframe, or list of mapping and
+                       lookup dataframes, see read_mapping_feature; read from config if not given
     :return: df_target: pd.DataFrame; Resulted dataframe
+    Sample:
+    "mapping": {
+        "read": {"file_type": "csv", "separator": ","},
+        "left_on": ["DEPT_CODE"],
+        "right_on": ["CODE"],
+        "strategy": "auto",
+        "lookups": [
+            {
+                "read": {"path": "/data/reference/currency.csv", "file_type": "csv"},
+                "left_on": ["CURRENCY"],
+                "right_on": ["CCY_CODE"],
+                "strategy": "broadcast"
+            }
+        ]
+    }
     """
-    df_mapping = read_feature(config['read'])
-    df_target = pd.merge(df, df_mapping, how='left', left_index=True,
-                         left_on=miscu.eval_elem_mapping(config, 'left_on'),
-                         right_on=miscu.eval_elem_mapping(config, 'right_on'))
-    df_target.drop(columns=miscu.eval_elem_mapping(config, 'right_on'), inplace=True)
+    if df_mapping is None:
+        df_mapping = read_mapping_feature(config)
+    frames = df_mapping if isinstance(df_mapping, list) else [df_mapping]
+    joins = planu.mapping_joins(config)
+    if len(frames) != len(joins):
+        logging.error(f'Mapping feature got <{len(frames)}> dataframes for <{len(joins)}> mapping tables')
+        raise ValueError(f'Mapping feature got <{len(frames)}> dataframes for <{len(joins)}> mapping tables')
 
+    df_target = df
+    for join_config, df_join in zip(joins, frames):
+        df_target = _join_feature(df_target, df_join, join_config)
     return df_target
 
 
+def read_mapping_feature(config, cache_config=None):
+    """
+    ETL feature to read every mapping table of mapping feature, through persistent cache (see read_cached_feature)
+    :param config: dict; Provided mapping configuration
+    :param cache_config: dict, default=None; Provided cache configuration, None to bypass cache
+    :return: pd.DataFrame or list; Mapping dataframe, or list of mapping and lookup dataframes when <lookups> are given
+    """
+    frames = [read_cached_feature(join_config['read'], cache_config) for join_config in planu.mapping_joins(config)]
+    return frames[0] if len(frames) == 1 else frames
+
+
+def _join_feature(df, df_mapping, config):
+    """
+    Join given dataframe with a single mapping table, see mapping_feature
+    Join keys of mapping dataframe are renamed after the left ones before merge, so that the result holds
+    a single set of key columns and nothing has to be dropped from (i.e. copied out of) the merged dataframe
+    :param df: pd.DataFrame; Provided dataframe
+    :param df_mapping: pd.DataFrame; Extracted mapping dataframe
+    :param config: dict; Provided join configuration, see planu.mapping_joins
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    left_on = list(miscu.eval_elem_mapping(config, 'left_on'))
+    right_on = list(miscu.eval_elem_mapping(config, 'right_on'))
+    strategy = miscu.eval_elem_mapping(config, 'strategy', default_value=JOIN_STRATEGY_AUTO)
+    description = miscu.eval_elem_mapping(miscu.eval_elem_mapping(config, 'read'), 'path', default_value=right_on)
+    if strategy not in JOIN_STRATEGIES:
+        logging.error(f'Join strategy <{strategy}> of <{description}> is not supported, use one of <{JOIN_STRATEGIES}>')
+        raise ValueError(f'Join strategy <{strategy}> of <{description}> is not supported, '
+                         f'use one of <{JOIN_STRATEGIES}>')
+
+    key_rename = dict(zip(right_on, left_on))
+    other_columns = [col_name for col_name in df_mapping.columns if col_name not in key_rename]
+    table = None
+    if strategy != JOIN_STRATEGY_HASH:
+        reason = _lookup_unsupported(df, df_mapping, left_on, right_on, other_columns)
+        if reason is None:
+            # Binary search pays off over hashing only when left keys come in order too (e.g. sorted input chunks).
+            left_sorted = strategy == JOIN_STRATEGY_AUTO and len(left_on) == 1 and \
+                len(df_mapping.index) >= SORTED_JOIN_MIN_ROWS and \
+                not isinstance(df[left_on[0]].dtype, pd.CategoricalDtype) and df[left_on[0]].is_monotonic_increasing
+            table = _lookup_table(df_mapping, right_on, strategy, description, left_sorted)
+        elif strategy != JOIN_STRATEGY_AUTO:
+            logging.warning(f'Join strategy <{strategy}> of <{description}> not used ({reason}), merging instead')
+
+    if table is None:
+        df_target = _merge_feature(df, df_mapping, left_on, right_on, other_columns)
+        unmatched = (df_target.pop(MERGE_INDICATOR) == 'left_only').to_numpy()
+    else:
+        indexer = _lookup_indexer(table, df, left_on)
+        unmatched = indexer < 0
+        # Shallow copy: mapping columns are added without copying those of the left dataframe.
+        df_target = df.copy(deep=False)
+        for left_name, right_name in zip(left_on, right_on):
+            # Merge turns categorical keys into plain ones, unless both sides share the same categories.
+            if isinstance(df[left_name].dtype, pd.CategoricalDtype) and df[left_name].dtype != \
+                    df_mapping[right_name].dtype:
+                df_target[left_name] = df[left_name].astype(df[left_name].dtype.categories.dtype)
+        fill = bool(unmatched.any())
+        for col_name in other_columns:
+            column = df_mapping[col_name]
+            values = column.array if isinstance(column.dtype, pd.api.extensions.ExtensionDtype) else column.to_numpy()
+            df_target[col_name] = pd.api.extensions.take(values, indexer, allow_fill=fill)
+        df_target.index = pd.RangeIndex(len(df_target.index))
+
+    if config.get('report_unmatched', True) and unmatched.any():
+        keys = df_target.loc[unmatched, left_on].drop_duplicates().head(UNMATCHED_SAMPLE_SIZE)
+        logging.warning(f'Mapping <{description}> left <{int(unmatched.sum())}> of <{len(unmatched)}> records '
+                        f'unmatched, keys e.g. <{keys.to_dict(orient="records")}>')
+    return df_target
+
+
+def _merge_feature(df, df_mapping, left_on, right_on, other_columns):
+    """
+    Join given dataframe with a mapping table by a left merge (hash join strategy), marking unmatched records
+    :param df: pd.DataFrame; Provided dataframe
+    :param df_mapping: pd.DataFrame; Extracted mapping dataframe
+    :param left_on: list; Join keys of given dataframe
+    :param right_on: list; Join keys of mapping dataframe
+    :param other_columns: list; Mapping columns other than join keys
+    :return: pd.DataFrame; Resulted dataframe, with MERGE_INDICATOR column
+    """
+    if not set(left_on) & set(other_columns):
+        df_mapping = df_mapping.rename(columns=dict(zip(right_on, left_on)), copy=False)
+        return pd.merge(df, df_mapping, how='left', on=left_on, indicator=MERGE_INDICATOR)
+
+    # Renaming would clash with another mapping column, merge on distinct keys and drop right ones instead.
+    df_target = pd.merge(df, df_mapping, how='left', left_on=left_on, right_on=right_on, indicator=MERGE_INDICATOR)
+    df_target.drop(columns=right_on, inplace=True)
+    return df_target
+
+
+def _lookup_unsupported(df, df_mapping, left_on, right_on, other_columns):
+    """
+    Check whether a mapping table can be looked up (broadcast or sorted join strategy) with the result of a merge
+    :param df: pd.DataFrame; Provided dataframe
+    :param df_mapping: pd.DataFrame; Extracted mapping dataframe
+    :param left_on: list; Join keys of given dataframe
+    :param right_on: list; Join keys of mapping dataframe
+    :param other_columns: list; Mapping columns other than join keys
+    :return: str; Reason a merge is needed, None if table can be looked up
+    """
+    if len(left_on) != len(right_on) or not left_on:
+        return 'join keys do not pair up'
+    clashes = set(other_columns) & set(df.columns)
+    if clashes:
+        return f'columns <{sorted(clashes)}> are on both sides'
+    for left_name, right_name in zip(left_on, right_on):
+        left_dtype, right_dtype = df[left_name].dtype, df_mapping[right_name].dtype
+        if _key_kind(left_dtype) != _key_kind(right_dtype):
+            return f'keys <{left_name}> and <{right_name}> are of different kinds'
+        if isinstance(right_dtype, pd.CategoricalDtype) and left_dtype != right_dtype:
+            return f'key <{right_name}> is categorical'
+    return None
+
+
+def _key_kind(dtype):
+    """
+    Kind of a join key, keys of the same kind being comparable
+    :param dtype: Data type of a key column
+    :return: str; Key kind, e.g. 'numeric' or 'object'
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return {'i': 'numeric', 'u': 'numeric', 'f': 'numeric', 'b': 'bool', 'M': 'datetime', 'm': 'timedelta'}.get(
+        dtype.kind, 'object')
+
+
+# Lookup tables of mapping dataframes, built once per dataframe (e.g. once for every chunk of the input),
+# see _lookup_table; entries are dropped along with their dataframe.
+_lookup_tables = dict()
+
+
+def _lookup_table(df_mapping, right_on, strategy, description, left_sorted=False):
+    """
+    Build the lookup table of a mapping dataframe, choosing its join strategy, once per dataframe
+    :param df_mapping: pd.DataFrame; Extracted mapping dataframe
+    :param right_on: list; Join keys of mapping dataframe
+    :param strategy: str; Configured join strategy, see JOIN_STRATEGIES
+    :param description: Mapping table description, for logging
+    :param left_sorted: bool, default=False; Whether keys to look up are sorted, favouring sorted join strategy
+    :return: dict; Lookup table with <strategy>, <index> (sorted for sorted strategy), <order> (positions of sorted keys
+             in mapping dataframe, None if already sorted) and <nan_position> elements, None if a merge is needed
+    """
+    cache_key = (id(df_mapping), tuple(right_on), strategy, left_sorted)
+    cached = _lookup_tables.get(cache_key)
+    if cached is not None and cached[0]() is df_mapping:
+        return cached[1]
+
+    if len(right_on) > 1:
+        index = pd.MultiIndex.from_frame(df_mapping[right_on])
+    else:
+        # Categorical keys are looked up by value, as keys of the left dataframe are.
+        keys = df_mapping[right_on[0]]
+        index = pd.Index(keys.to_numpy() if isinstance(keys.dtype, pd.CategoricalDtype) else keys)
+    if strategy == JOIN_STRATEGY_AUTO:
+        if left_sorted and index.is_monotonic_increasing and index.is_unique and not index.hasnans:
+            strategy = JOIN_STRATEGY_SORTED
+        else:
+            strategy = JOIN_STRATEGY_BROADCAST if index.is_unique else JOIN_STRATEGY_HASH
+    elif strategy == JOIN_STRATEGY_SORTED and len(right_on) > 1:
+        logging.warning(f'Join strategy <{strategy}> of <{description}> needs a single key, looking it up instead')
+        strategy = JOIN_STRATEGY_BROADCAST
+
+    nan_positions = np.flatnonzero(index.isna()) if len(right_on) == 1 else np.array([], dtype=np.intp)
+    order = None
+    if strategy == JOIN_STRATEGY_SORTED and (len(nan_positions) or not index.is_monotonic_increasing):
+        # NaN keys are matched through their position, the other ones are binary searched in key order.
+        order = np.flatnonzero(~index.isna())
+        index = index.take(order)
+        if not index.is_monotonic_increasing:
+            sort_order = index.argsort()
+            index = index.take(sort_order)
+            order = order[sort_order]
+    if strategy != JOIN_STRATEGY_HASH and (not index.is_unique or len(nan_positions) > 1):
+        logging.warning(f'Join strategy <{strategy}> of <{description}> needs unique keys, merging instead')
+        strategy = JOIN_STRATEGY_HASH
+
+    nan_position = nan_positions[0] if len(nan_positions) else -1
+    table = None if strategy == JOIN_STRATEGY_HASH else {'strategy': strategy, 'index': index, 'order': order,
+                                                         'nan_position': nan_position}
+    logging.info(f'Mapping <{description}> of <{len(df_mapping.index)}> records joined by <{strategy}> strategy')
+    _lookup_tables[cache_key] = (weakref.ref(df_mapping), table)
+    weakref.finalize(df_mapping, _lookup_tables.pop, cache_key, None)
+    return table
+
+
+def _lookup_indexer(table, df, left_on):
+    """
+    Look keys of given dataframe up in a lookup table
+    :param table: dict; Lookup table, see _lookup_table
+    :param df: pd.DataFrame; Provided dataframe
+    :param left_on: list; Join keys of given dataframe
+    :return: np.ndarray; Position of matching record of mapping dataframe for every record, -1 if there is none
+    """
+    if len(left_on) > 1:
+        return table['index'].get_indexer(pd.MultiIndex.from_frame(df[left_on]))
+    keys = df[left_on[0]]
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        # Categories are looked up only, records get the position of their category (code -1 standing for NaN).
+        category_indexer = _lookup_positions(table, keys.cat.categories)
+        return np.append(category_indexer, table['nan_position'])[keys.cat.codes.to_numpy()]
+    return _lookup_positions(table, pd.Index(keys))
+
+
+def _lookup_positions(table, keys):
+    """
+    Look keys up in a lookup table, by hash (broadcast strategy) or binary search (sorted strategy)
+    :param table: dict; Lookup table, see _lookup_table
+    :param keys: pd.Index; Provided keys
+    :return: np.ndarray; Position of matching record of mapping dataframe for every key, -1 if there is none
+    """
+    index = table['index']
+    if table['strategy'] == JOIN_STRATEGY_BROADCAST:
+        return index.get_indexer(keys)
+
+    missing = keys.isna()
+    positions = np.full(len(keys), -1, dtype=np.intp)
+    positions[missing] = table['nan_position']
+    if len(index):
+        values = keys[~missing]
+        found = np.minimum(index.searchsorted(values), len(index) - 1)
+        matched = np.asarray(index.take(found) == values)
+        if table['order'] is not None:
+            found = table['order'][found]
+        positions[np.flatnonzero(~missing)[matched]] = found[matched]
+    return positions
+
+
 def read_feature(config):
     """
     ETL feature to read a file, based on provided ETL configuration section
     This is a composite feature, since it can call apply_dtype_feature, if appropriate config section exists
+    Path can also be a glob pattern or a directory, whose files are read concurrently and concatenated, in path order;
+    optional <source_column> records the file every record was read from.
+    Excel sheets are read in one pass (<sheet_name> can list several sheets, concatenated in order) and converted sheets
+    are cached, see fileu.read; <sheet_cache> gives the cache directory, or false to parse workbooks every time.
     :param config: dict; Provided configuration mapping
     :return: pd.DataFrame; Resulted dataframe
+    Sample:
+    "read": {
+        "path": "/data/input/region_*.csv",
+        "source_column": "SOURCE_FILE",
+        "read_workers": 8
+    }
+    "read": {
+        "path": "/data/input/regions.xlsx",
+        "sheet_name": ["North", "South"],
+        "use_cols": ["REGION", "SALES"],
+        "sheet_cache": "/var/cache/opendata/sheet"
+    }
     """
+    paths = source_paths(config)
+    if paths != [miscu.eval_elem_mapping(config, 'path')]:
+        return _read_parts_feature(config, paths)
+
     df_target = fileu.read(description=miscu.eval_elem_mapping(config, 'description'),
                            path=miscu.eval_elem_mapping(config, 'path'),
                            file_type=miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
                            separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
                            skip_rows=miscu.eval_elem_mapping(config, 'skip_rows', default_value=0),
-                           use_cols=miscu.eval_elem_mapping(config, 'use_cols'),
-                           sheet_name=miscu.eval_elem_mapping(config, 'sheet_name', default_value=0))
+                           use_cols=_read_use_cols(config),
+                           sheet_name=miscu.eval_elem_mapping(config, 'sheet_name', default_value=0),
+                           byte_range=miscu.eval_elem_mapping(config, 'byte_range'),
+                           sheet_cache_dir=_read_sheet_cache_dir(config),
+                           compression=miscu.eval_elem_mapping(config, 'compression'),
+                           **_read_dtype_arguments(config))
+
+    return _prepare_read_feature(df_target, config, paths=paths)
+
+
+def source_paths(config):
+    """
+    Files read by read feature, see fileu.expand_paths
+    :param config: dict; Provided configuration mapping
+    :return: list; Fully qualified file names
+    """
+    return fileu.expand_paths(miscu.eval_elem_mapping(config, 'path'),
+                              miscu.eval_elem_mapping(config, 'file_type', default_value='excel'))
 
-    df_target.columns = df_target.columns.str.strip()
+
+def _read_parts_feature(config, paths):
+    """
+    Read given files concurrently, in a pool of threads, and concatenate them in path order
+    :param config: dict; Provided configuration mapping
+    :param paths: list; Fully qualified file names
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    part_config = {key: value for key, value in config.items() if key != 'source_column'}
+    workers = miscu.eval_elem_mapping(config, 'read_workers', default_value=fileu.DEFAULT_IO_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as executor:
+        frames = list(executor.map(lambda path: read_feature(dict(part_config, path=path)), paths))
+    return _add_source_column(concat_feature(frames), config, paths, [len(df_part.index) for df_part in frames])
+
+
+def concat_feature(frames):
+    """
+    ETL feature to concatenate dataframes of the same columns (e.g. parts or chunks of a dataset), keeping categorical
+    columns categorical (categories are united).
+    :param frames: list of pd.DataFrame; Provided dataframes
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    for col_name in frames[0].columns:
+        if isinstance(frames[0][col_name].dtype, pd.CategoricalDtype) and len(frames) > 1:
+            categories = pd.api.types.union_categoricals([df_part[col_name] for df_part in frames
+                                                          if col_name in df_part.columns]).categories
+            for df_part in frames:
+                if col_name in df_part.columns:
+                    df_part[col_name] = df_part[col_name].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _add_source_column(df, config, paths, lengths):
+    """
+    Add optional <source_column>, recording the file every record was read from, as a categorical column.
+    :param df: pd.DataFrame; Provided dataframe, records of given files in path order
+    :param config: dict; Provided configuration mapping
+    :param paths: list; Fully qualified file names
+    :param lengths: list; Number of records of every file
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    source_column = miscu.eval_elem_mapping(config, 'source_column')
+    if source_column:
+        # Assigned rather than set, chunks of a part may be slices of the file chunk.
+        return df.assign(**{source_column: pd.Categorical.from_codes(
+            np.repeat(np.arange(len(paths), dtype='int32'), lengths), categories=paths)})
+    return df
+
+
+def read_cached_feature(config, cache_config=None):
+    """
+    ETL feature to read a file through a persistent cache of read and dtype-applied dataframes
+    Cache key covers file path, modification time and size, along with provided read configuration
+    :param config: dict; Provided configuration mapping
+    :param cache_config: dict, default=None; Provided cache configuration, None to bypass cache
+    :return: pd.DataFrame; Resulted dataframe
+    Sample:
+    "cache": {
+        "path": "/var/cache/opendata",
+        "max_size_mb": 1024
+    }
+    """
+    if cache_config is None:
+        return read_feature(config)
+
+    paths = source_paths(config)
+    for path in paths:
+        fileu.validate_path(path)
+    cache_dir = miscu.eval_elem_mapping(cache_config, 'path', default_value=cacheu.READ_CACHE_DIR)
+    # Description is only used for logging, so that it does not take part in the key.
+    read_config = {key: value for key, value in config.items() if key != 'description'}
+    cache_key = cacheu.make_key('read_feature', [cacheu.file_signature(path) for path in paths], read_config)
+
+    df_target = cacheu.load(cache_dir, cache_key)
+    if df_target is None:
+        df_target = read_feature(config)
+        cacheu.store(cache_dir, cache_key, df_target,
+                     max_size_mb=miscu.eval_elem_mapping(cache_config, 'max_size_mb',
+                                                         default_value=cacheu.DEFAULT_MAX_SIZE_MB))
+    return df_target
+
+
+def read_chunks_feature(config, chunk_size, apply_dtype=True):
+    """
+    ETL feature to read a file in chunks of rows, based on provided ETL configuration section
+    Every chunk is prepared exactly as read_feature prepares a whole file, including apply_dtype_feature
+    :param config: dict; Provided configuration mapping
+    :param chunk_size: int; Number of rows per chunk
+    :param apply_dtype: bool, default=True; Whether to call apply_dtype_feature, or leave it to the consumer
+                        (see apply_read_dtype_feature)
+    :return: generator of pd.DataFrame; Resulted dataframe chunks
+    """
+    # Files of a glob pattern or a directory are streamed one after another.
+    for path in source_paths(config):
+        yield from _read_file_chunks(dict(config, path=path), chunk_size, apply_dtype)
+
+
+def _read_file_chunks(config, chunk_size, apply_dtype=True):
+    """
+    Read a single file in chunks of rows, see read_chunks_feature
+    :param config: dict; Provided configuration mapping, its path being a single file
+    :param chunk_size: int; Number of rows per chunk
+    :param apply_dtype: bool, default=True; Whether to call apply_dtype_feature
+    :return: generator of pd.DataFrame; Resulted dataframe chunks
+    """
+    path = miscu.eval_elem_mapping(config, 'path')
+    chunks = fileu.read_chunks(description=miscu.eval_elem_mapping(config, 'description'),
+                               path=path,
+                               chunk_size=chunk_size,
+                               file_type=miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
+                               separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
+                               skip_rows=miscu.eval_elem_mapping(config, 'skip_rows', default_value=0),
+                               use_cols=_read_use_cols(config),
+                               sheet_name=miscu.eval_elem_mapping(config, 'sheet_name', default_value=0),
+                               sheet_cache_dir=_read_sheet_cache_dir(config),
+                               compression=miscu.eval_elem_mapping(config, 'compression'),
+                               **_read_dtype_arguments(config))
+    for df_chunk in chunks:
+        yield _prepare_read_feature(df_chunk, config, apply_dtype=apply_dtype, paths=[path])
+
+
+def _read_use_cols(config):
+    """
+    Columns to load by read feature: <use_cols> if given, otherwise, for columnar file types only,
+    the <apply_dtype> keys, since apply_dtype_feature limits dataframe to those columns anyway.
+    :param config: dict; Provided configuration mapping
+    :return: list or callable; Columns to load, None for all of them
+    """
+    use_cols = miscu.eval_elem_mapping(config, 'use_cols')
+    apply_dtype_config = miscu.eval_elem_mapping(config, 'apply_dtype')
+    file_type = miscu.eval_elem_mapping(config, 'file_type', default_value='excel')
+    if not use_cols and apply_dtype_config and file_type.lower() in fileu.COLUMNAR_FILE_TYPES:
+        use_cols = list(apply_dtype_config.keys())
+    if use_cols and file_type.lower() == 'csv' and all(isinstance(col_name, str) for col_name in use_cols):
+        # Match csv header with surrounding spaces stripped, as read feature does.
+        use_col_names = set(use_cols)
+        return lambda col_name: col_name in use_col_names or col_name.strip() in use_col_names
+    return use_cols
+
+
+def _read_sheet_cache_dir(config):
+    """
+    Cache directory of converted Excel sheets: <sheet_cache> if it is a path, cacheu.SHEET_CACHE_DIR unless it is false
+    :param config: dict; Provided configuration mapping
+    :return: str; Cache directory, None to parse sheets every time
+    """
+    # An explicit false disables the cache, which eval_elem_mapping would take for a missing value.
+    sheet_cache = config.get('sheet_cache', True)
+    if not sheet_cache:
+        return None
+    return sheet_cache if isinstance(sheet_cache, str) else cacheu.SHEET_CACHE_DIR
+
+
+def _read_dtype_arguments(config):
+    """
+    Convert <apply_dtype> config section into csv reader arguments, so that columns are parsed into their
+    final type straight away; missing values and int columns are then handled by apply_dtype_feature.
+    Columns are matched against file header with surrounding spaces stripped, as read feature does.
+    :param config: dict; Provided configuration mapping
+    :return: dict; <dtype> and <parse_dates> reader arguments, empty for non csv files
+    """
+    apply_dtype_config = miscu.eval_elem_mapping(config, 'apply_dtype')
+    file_type = miscu.eval_elem_mapping(config, 'file_type', default_value='excel')
+    if not apply_dtype_config or not isinstance(apply_dtype_config, dict) or file_type.lower() != 'csv':
+        return dict()
+
+    header = fileu.read_header(path=miscu.eval_elem_mapping(config, 'path'),
+                               separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
+                               skip_rows=miscu.eval_elem_mapping(config, 'skip_rows', default_value=0),
+                               compression=miscu.eval_elem_mapping(config, 'compression'))
+    file_columns = {column.strip(): column for column in header}
+    dtype = dict()
+    parse_dates = list()
+    for column_key, type_value in apply_dtype_config.items():
+        # Missing columns are reported by apply_dtype_feature.
+        if column_key in file_columns:
+            type_name = _dtype_name(type_value)
+            if type_name in READ_DTYPES:
+                dtype[file_columns[column_key]] = READ_DTYPES[type_name]
+            elif type_name == 'datetime.date':
+                parse_dates.append(file_columns[column_key])
+    return {'dtype': dtype or None, 'parse_dates': parse_dates or None}
+
+
+def _dtype_name(type_value):
+    """
+    Name of a data type given in <apply_dtype> config section, either as a type or as its name.
+    :param type_value: type or str; Provided data type
+    :return: str; Data type name
+    """
+    if type_value is datetime.date:
+        return 'datetime.date'
+    if type_value in (str, int, float):
+        return type_value.__name__
+    return type_value
+
+
+def _prepare_read_feature(df, config, apply_dtype=True, paths=None):
+    """
+    Clean up column names of a freshly read dataframe and call apply_dtype_feature, if appropriate config section exists
+    :param df: pd.DataFrame; Provided dataframe
+    :param config: dict; Provided configuration mapping
+    :param apply_dtype: bool, default=True; Whether to call apply_dtype_feature
+    :param paths: list, default=None; File the dataframe was read from, as a single element list
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    df.columns = df.columns.str.strip()
+    if apply_dtype:
+        df = apply_read_dtype_feature(df, config)
+    if paths:
+        df = _add_source_column(df, config, paths, [len(df.index)])
+    return df
+
+
+def apply_read_dtype_feature(df, config):
+    """
+    ETL feature to apply data types of a read configuration section to a dataframe: <apply_dtype>, then <auto_category>.
+    Source column of read feature, if any, is kept.
+    :param df: pd.DataFrame; Provided dataframe
+    :param config: dict; Provided read configuration mapping
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    source_column = miscu.eval_elem_mapping(config, 'source_column')
+    source = df[source_column] if source_column and source_column in df.columns else None
 
     # Call apply_dtype_feature, if appropriate config section exists
     apply_dtype_config = miscu.eval_elem_mapping(config, 'apply_dtype')
     if apply_dtype_config:
-        df_target = apply_dtype_feature(df_target, apply_dtype_config)
+        df = apply_dtype_feature(df, apply_dtype_config)
 
-    return df_target
+    # Call auto_category_feature, if appropriate config section exists
+    auto_category_config = miscu.eval_elem_mapping(config, 'auto_category')
+    if auto_category_config:
+        df = auto_category_feature(df, auto_category_config)
+
+    if source is not None and source_column not in df.columns:
+        df[source_column] = source
+    return df
 
 
 def rearrange_feature(df, config):
@@ -171,23 +1113,54 @@ def rearrange_feature(df, config):
 
         # Reorder columns.
         config_to_reorder = miscu.eval_elem_mapping(config, 'col_reorder')
-        if config_to_reorder and isinstance(config_to_reorder, list):
+        if config_to_reorder and isinstance(config_to_reorder, list) \
+                and list(df_target.columns) != config_to_reorder:
             df_target = df_target.reindex(columns=config_to_reorder)
 
     return df_target
 
 
-def write_feature(df, config):
+def write_feature(df, config, mode="new"):
     """
     ETL feature to write a dataset to a file, based on provided ETL configuration section
     :param df: pd.DataFrame; Provided dataframe
     :param config: dict; Provided feature configuration
-    :return null
-    """
-    fileu.write(df=df,
-                description=miscu.eval_elem_mapping(config, 'description'),
-                path=miscu.eval_elem_mapping(config, 'path'),
-                file_type=miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
-                index=miscu.eval_elem_mapping(config, 'index'),
-                separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
-                mode="new")
\ No newline at end of file
+    :param mode: str, default="new"; Write mode, see fileu.write
+    :return str; Path of the written file, or dataset directory when <partition_by> columns are given
+    Csv files are compressed when <compression> is given or the path ends with a compression extension (e.g. '.gz'),
+    <compress_workers> blocks being compressed concurrently, see fileu.write
+    Sample:
+    "write": {
+        "file_type": "csv",
+        "partition_by": ["MAP_ACCOUNT"],
+        "write_workers": 8
+    }
+    "write": {
+        "file_type": "csv",
+        "compression": "gzip",
+        "compress_workers": 4
+    }
+    """
+    partition_by = miscu.eval_elem_mapping(config, 'partition_by')
+    if partition_by:
+        return fileu.write_partitions(df=df,
+                                      description=miscu.eval_elem_mapping(config, 'description'),
+                                      path=miscu.eval_elem_mapping(config, 'path'),
+                                      file_type=miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
+                                      index=miscu.eval_elem_mapping(config, 'index'),
+                                      partition_by=list(partition_by),
+                                      separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
+                                      mode=mode,
+                                      workers=miscu.eval_elem_mapping(config, 'write_workers',
+                                                                      default_value=fileu.DEFAULT_IO_WORKERS),
+                                      compression=miscu.eval_elem_mapping(config, 'compression'))
+    return fileu.write(df=df,
+                       description=miscu.eval_elem_mapping(config, 'description'),
+                       path=miscu.eval_elem_mapping(config, 'path'),
+                       file_type=miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
+                       index=miscu.eval_elem_mapping(config, 'index'),
+                       separator=miscu.eval_elem_mapping(config, 'separator', default_value=','),
+                       mode=mode,
+                       compression=miscu.eval_elem_mapping(config, 'compression'),
+                       workers=miscu.eval_elem_mapping(config, 'compress_workers',
+                                                       default_value=fileu.DEFAULT_COMPRESS_WORKERS))
\ No newline at end of file
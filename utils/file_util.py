@@ -1,82 +1,646 @@
+import bz2
+import contextlib
+import contextvars
+import glob
+import gzip
+import io
 import logging
-import pandas as pd
+import lzma
 import os
+import pickle
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import utils.cache_util as cacheu
+import utils.misc_util as miscu
 
+try:
+    import fcntl
+except ImportError:
+    # Platforms without fcntl (Windows) allocate versions under the in-process lock only.
+    fcntl = None
 
-def read(description, path, file_type='excel', separator=',', skip_rows=0, use_cols=None, sheet_name=0):
+# Columnar file types; those keep column data types and can load a subset of columns without parsing the rest.
+COLUMNAR_FILE_TYPES = ('parquet', 'feather')
+# File types whose written files can be appended to, see write; parquet files are written chunk by chunk only while
+# they are open, see parquet_writer.
+APPENDABLE_FILE_TYPES = ('csv',)
+# File extensions of every file type; the first one names partition files.
+FILE_EXTENSIONS = {'csv': ('.csv', '.txt'), 'excel': ('.xlsx', '.xls'), 'parquet': ('.parquet',),
+                   'feather': ('.feather',)}
+PARTITION_FILE_NAME = 'part'
+PARTITION_NULL_VALUE = 'null'
+DEFAULT_IO_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Excel workbooks streamed row by row by the read-only parser; any other one (e.g. legacy xls) is read whole.
+EXCEL_STREAM_EXTENSIONS = ('.xlsx', '.xlsm')
+# Compressions of csv based files, detected from the file extension unless given.
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+# Compressed files are written as a series of independently compressed blocks (gzip members, bz2 or xz streams),
+# compressed concurrently; every decompressor reads such a file as a single one.
+COMPRESSION_BLOCK_ROWS = 100000
+DEFAULT_COMPRESS_WORKERS = os.cpu_count() or 1
+# Counters of the last version allocated for every path, kept under the cache directory (one file per path) so that
+# output directories only hold outputs, see create_new_path.
+VERSION_DIR = os.path.join(cacheu.DEFAULT_CACHE_DIR, 'version')
+VERSION_EXT = '.version'
+# Number of chunks waiting for the background writer, see async_writer.
+DEFAULT_WRITE_QUEUE_SIZE = 2
+# Spill directories are created under the system temporary directory unless given, see spill_directory.
+SPILL_DIR_PREFIX = 'opendata-spill-'
+
+# Paths are expanded and validated without pandas (e.g. by a dry run), it is imported once a file is read or written.
+pd = miscu.lazy_import('pandas')
+
+_version_lock = threading.Lock()
+# Marks the end of chunks given to the background writer.
+_WRITE_END = object()
+
+
+def read(description, path, file_type='excel', separator=',', skip_rows=0, use_cols=None, sheet_name=0, dtype=None,
+         parse_dates=None, byte_range=None, sheet_cache_dir=None, compression=None):
     """
     Read file, along with validating provided path.
     :param description: str; File description
     :param path: str; Fully qualified file name to read
-    :param file_type: str, default='Excel'; Read type with possible values of 'csv' or 'excel'
+    :param file_type: str, default='Excel'; Read type with possible values of 'csv', 'excel', 'parquet' or 'feather'
     :param separator: str, default=','; Values separator
     :param skip_rows: int, default=0; Number of rows to skip
     :param use_cols: int, default=None; A list of columns to read (all others are discarded)
-    :param sheet_name: int or str; default=0; A sheet name or index to read
+    :param sheet_name: int, str or list; default=0; A sheet name or index to read, or a list of them to read
+                       and concatenate in one pass; None reads every sheet
+    :param dtype: dict, default=None; Data types of columns, applied by csv reader while parsing
+    :param parse_dates: list, default=None; Columns parsed as dates by csv reader
+    :param byte_range: list, default=None; Start and end byte offsets of csv records to read, both at line boundaries;
+                       records of a range starting past the header get column names from the header
+    :param sheet_cache_dir: str, default=None; Cache directory of converted Excel sheets, None to parse every time
+    :param compression: str, default=None; Compression of csv based file, 'gzip', 'bz2' or 'xz', detected from
+                        the file extension if not given; the file is decompressed while being parsed
     :return: pd.DataFrame; Resulted dataframe
     """
     df_target = None
     if validate_path(path):
-        if file_type.lower() == 'csv':
+        compression = compression_of(path, file_type, compression)
+        if compression and byte_range:
+            logging.error(f'Byte ranges of compressed files cannot be read: <{path}>')
+            raise ValueError(f'Byte ranges of compressed files cannot be read: <{path}>')
+        if file_type.lower() == 'csv' and byte_range:
+            # Read given byte range of csv based file, e.g. records appended since a previous read.
+            source, names = _read_byte_range(path, byte_range, separator, skip_rows)
+            df_target = pd.read_csv(source, sep=separator, skiprows=skip_rows if names is None else 0,
+                                    header=0 if names is None else None, names=names, usecols=use_cols, dtype=dtype,
+                                    parse_dates=parse_dates)
+        elif file_type.lower() == 'csv':
             # Read csv based file.
-            df_target = pd.read_csv(path, sep=separator, skiprows=skip_rows, usecols=use_cols)
+            df_target = pd.read_csv(path, sep=separator, skiprows=skip_rows, usecols=use_cols, dtype=dtype,
+                                    parse_dates=parse_dates, compression=compression)
         elif file_type.lower() == 'excel':
-            # Read Excel based file.
-            if len((pd.ExcelFile(path)).sheet_names) > 1:
+            # Read Excel based file, opening the workbook once.
+            df_target = _read_excel(path, skip_rows, use_cols, sheet_name, sheet_cache_dir)
+        elif file_type.lower() == 'parquet':
+            # Read parquet based file, loading only requested columns.
+            df_target = pd.read_parquet(path, columns=use_cols)
+        elif file_type.lower() == 'feather':
+            # Read feather based file, loading only requested columns.
+            df_target = pd.read_feather(path, columns=use_cols)
 
-                df_target = pd.read_excel(path, sep=separator, skiprows=skip_rows,
-                                          usecol=use_cols, sheet_name=sheet_name)
+    logging.info(f'{description} records <{len(df_target.index)}> were read from <{path}>')
+    return df_target
 
-            else:
-                df_target = pd.read_excel(path, sep=separator, skiprows=skip_rows, usecol=use_cols)
 
-    logging.info(f'{description} records <{len(df_target.index)}> were read from <{path}>')
+def read_chunks(description, path, chunk_size, file_type='excel', separator=',', skip_rows=0, use_cols=None,
+                sheet_name=0, dtype=None, parse_dates=None, sheet_cache_dir=None, compression=None):
+    """
+    Read file in chunks of rows, along with validating provided path.
+    Only csv, parquet and xlsx based files can be streamed; any other file type is read whole and yielded as a single
+    chunk.
+    :param description: str; File description
+    :param path: str; Fully qualified file name to read
+    :param chunk_size: int; Number of rows per chunk
+    :param file_type: str, default='Excel'; Read type with possible values of 'csv', 'excel', 'parquet' or 'feather'
+    :param separator: str, default=','; Values separator
+    :param skip_rows: int, default=0; Number of rows to skip
+    :param use_cols: int, default=None; A list of columns to read (all others are discarded)
+    :param sheet_name: int, str or list; default=0; A sheet name or index to read, or a list of them; None reads
+                       every sheet
+    :param dtype: dict, default=None; Data types of columns, applied by csv reader while parsing
+    :param parse_dates: list, default=None; Columns parsed as dates by csv reader
+    :param sheet_cache_dir: str, default=None; Cache directory of converted Excel sheets, None to parse every time
+    :param compression: str, default=None; Compression of csv based file, detected from the file extension if not given
+    :return: generator of pd.DataFrame; Resulted dataframe chunks
+    """
+    compression = compression_of(path, file_type, compression)
+    if file_type.lower() == 'parquet':
+        yield from _read_parquet_chunks(description, path, chunk_size, use_cols)
+        return
+    if file_type.lower() == 'excel':
+        yield from _read_excel_chunks(description, path, chunk_size, skip_rows, use_cols, sheet_name, sheet_cache_dir)
+        return
+    if file_type.lower() != 'csv':
+        yield read(description, path, file_type=file_type, separator=separator, skip_rows=skip_rows,
+                   use_cols=use_cols, sheet_name=sheet_name)
+        return
+
+    records = 0
+    if validate_path(path):
+        # Compressed files are decompressed as chunks are parsed, never in full.
+        with pd.read_csv(path, sep=separator, skiprows=skip_rows, usecols=use_cols, dtype=dtype,
+                         parse_dates=parse_dates, chunksize=chunk_size, compression=compression) as reader:
+            for df_chunk in reader:
+                records += len(df_chunk.index)
+                yield df_chunk
+
+    logging.info(f'{description} records <{records}> were read in chunks of <{chunk_size}> from <{path}>')
+
+
+def expand_paths(path, file_type='excel'):
+    """
+    Expand a read path into the files it stands for: a glob pattern matches files, a directory stands for every file
+    of given type within it (recursively, e.g. a partitioned dataset), any other path for itself.
+    Hidden and underscore-prefixed files (e.g. _SUCCESS markers) of a directory are left out.
+    :param path: str; Fully qualified file name, glob pattern or directory
+    :param file_type: str, default='Excel'; Read type, selecting files of a directory by extension
+    :return: list; Fully qualified file names, sorted
+    """
+    if glob.has_magic(path):
+        paths = sorted(part for part in glob.glob(path, recursive=True) if os.path.isfile(part))
+    elif os.path.isdir(path):
+        extensions = FILE_EXTENSIONS.get(file_type.lower(), ())
+        paths = sorted(os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names
+                       if not name.startswith(('.', '_')) and _has_extension(name, extensions))
+    else:
+        return [path]
+
+    if not paths:
+        logging.error(f'Provided path matches no file: <{path}>')
+        raise FileNotFoundError(f'Provided path matches no file: <{path}>')
+    return paths
+
+
+def read_header(path, separator=',', skip_rows=0, compression=None):
+    """
+    Read column names of a csv based file, without reading any record.
+    :param path: str; Fully qualified file name to read
+    :param separator: str, default=','; Values separator
+    :param skip_rows: int, default=0; Number of rows to skip
+    :param compression: str, default=None; Compression of the file, detected from the file extension if not given
+    :return: list; Column names, as found in the file
+    """
+    validate_path(path)
+    return list(pd.read_csv(path, sep=separator, skiprows=skip_rows, nrows=0,
+                            compression=compression_of(path, 'csv', compression)).columns)
+
+
+def compression_of(path, file_type='csv', compression=None):
+    """
+    Compression of a file: given one, otherwise the one its extension stands for (e.g. '.csv.gz').
+    Only csv based files can be compressed; columnar file types compress their content themselves.
+    :param path: str; Fully qualified file name
+    :param file_type: str, default='csv'; Read or write type
+    :param compression: str, default=None; Provided compression, 'gzip', 'bz2' or 'xz'
+    :return: str; Compression, None for an uncompressed file
+    """
+    if compression and compression not in COMPRESSION_EXTENSIONS.values():
+        logging.error(f'Compression <{compression}> is not supported, use one of '
+                      f'<{list(COMPRESSION_EXTENSIONS.values())}>')
+        raise ValueError(f'Compression <{compression}> is not supported, use one of '
+                         f'<{list(COMPRESSION_EXTENSIONS.values())}>')
+    compression = compression or COMPRESSION_EXTENSIONS.get(os.path.splitext(str(path))[1].lower())
+    if compression and file_type.lower() != 'csv':
+        logging.error(f'Only csv files can be compressed, not {file_type} ones: <{path}>')
+        raise ValueError(f'Only csv files can be compressed, not {file_type} ones: <{path}>')
+    return compression
+
+
+def split_ext(path):
+    """
+    Split a file name into its root and its extension, a compression extension included (e.g. '.csv.gz').
+    :param path: str; File name
+    :return: tuple; Root and extension
+    """
+    root, ext = os.path.splitext(str(path))
+    if ext.lower() in COMPRESSION_EXTENSIONS:
+        root, inner_ext = os.path.splitext(root)
+        ext = inner_ext + ext
+    return root, ext
+
+
+def _has_extension(name, extensions):
+    """
+    Check whether a file name ends with one of given extensions, possibly followed by a compression extension.
+    :param name: str; File name
+    :param extensions: tuple; Provided extensions, e.g. ('.csv', '.txt')
+    :return: bool; True if file name has one of given extensions
+    """
+    root, ext = os.path.splitext(name.lower())
+    if ext in COMPRESSION_EXTENSIONS:
+        root, ext = os.path.splitext(root)
+    return ext in extensions
+
+
+def _read_byte_range(path, byte_range, separator=',', skip_rows=0):
+    """
+    Load given byte range of a csv based file into memory.
+    :param path: str; Fully qualified file name to read
+    :param byte_range: list; Start and end byte offsets
+    :param separator: str, default=','; Values separator
+    :param skip_rows: int, default=0; Number of rows to skip before the header
+    :return: tuple; In-memory file of the range, and column names if the range starts past the header (None otherwise)
+    """
+    start, end = byte_range
+    with open(path, 'rb') as file_source:
+        file_source.seek(start)
+        source = io.BytesIO(file_source.read(end - start))
+    return source, (read_header(path, separator, skip_rows) if start > 0 else None)
+
+
+def _read_parquet_chunks(description, path, chunk_size, use_cols=None):
+    """
+    Read parquet file in batches of rows, along with validating provided path.
+    :param description: str; File description
+    :param path: str; Fully qualified file name to read
+    :param chunk_size: int; Number of rows per chunk
+    :param use_cols: list, default=None; A list of columns to read (all others are not loaded)
+    :return: generator of pd.DataFrame; Resulted dataframe chunks
+    """
+    import pyarrow.parquet as pq
+
+    records = 0
+    if validate_path(path):
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=use_cols):
+            records += batch.num_rows
+            yield batch.to_pandas()
+
+    logging.info(f'{description} records <{records}> were read in chunks of <{chunk_size}> from <{path}>')
+
+
+def _read_excel(path, skip_rows=0, use_cols=None, sheet_name=0, cache_dir=None):
+    """
+    Read sheets of an Excel based file, opening the workbook once; several sheets are concatenated in given order.
+    A workbook with a single sheet is read whatever sheet is asked for.
+    Converted sheets are kept in cache under the workbook signature, with all their columns, so that an unchanged
+    workbook is loaded from cache for any column selection instead of being parsed again.
+    :param path: str; Fully qualified file name to read
+    :param skip_rows: int, default=0; Number of rows to skip
+    :param use_cols: list or callable, default=None; Columns to read (all others are discarded)
+    :param sheet_name: int, str or list, default=0; Sheet names or indexes to read, None for every sheet
+    :param cache_dir: str, default=None; Cache directory of converted sheets, None to bypass cache
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    # Excel column letters (e.g. 'A:C') only make sense to the parser.
+    cache_key = None
+    if cache_dir and not isinstance(use_cols, str):
+        cache_key = cacheu.make_key('excel_sheets', cacheu.file_signature(path), sheet_name, skip_rows)
+        df_target = cacheu.load(cache_dir, cache_key)
+        if df_target is not None:
+            return _select_columns(df_target, use_cols)
+
+    with pd.ExcelFile(path) as workbook:
+        frames = [workbook.parse(sheet_name=name, skiprows=skip_rows, usecols=None if cache_key else use_cols)
+                  for name in _excel_sheet_names(workbook.sheet_names, sheet_name, path)]
+    df_target = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    if cache_key:
+        cacheu.store(cache_dir, cache_key, df_target)
+        df_target = _select_columns(df_target, use_cols)
     return df_target
 
 
-def write(df, description, path, file_type, index, separator=',', mode='overwrite'):
+def _read_excel_chunks(description, path, chunk_size, skip_rows=0, use_cols=None, sheet_name=0, cache_dir=None):
+    """
+    Read sheets of an Excel based file in chunks of rows, along with validating provided path.
+    Rows are streamed by the read-only parser, so that memory stays bounded whatever the workbook size; a workbook
+    found in cache of converted sheets (see _read_excel) is served from there instead.
+    Values are typed as the workbook stores them; blank rows are skipped, as whole reads do.
+    :param description: str; File description
+    :param path: str; Fully qualified file name to read
+    :param chunk_size: int; Number of rows per chunk
+    :param skip_rows: int, default=0; Number of rows to skip before the header of every sheet
+    :param use_cols: list or callable, default=None; Columns to read (all others are discarded)
+    :param sheet_name: int, str or list, default=0; Sheet names or indexes to read, None for every sheet
+    :param cache_dir: str, default=None; Cache directory of converted sheets, None to bypass cache
+    :return: generator of pd.DataFrame; Resulted dataframe chunks
+    """
+    validate_path(path)
+    df_cached = None
+    if cache_dir and not isinstance(use_cols, str):
+        df_cached = cacheu.load(cache_dir, cacheu.make_key('excel_sheets', cacheu.file_signature(path), sheet_name,
+                                                           skip_rows))
+    if df_cached is not None:
+        df_target = _select_columns(df_cached, use_cols)
+        for start in range(0, len(df_target.index), chunk_size):
+            yield df_target.iloc[start:start + chunk_size].reset_index(drop=True)
+        logging.info(f'{description} records <{len(df_target.index)}> were read in chunks of <{chunk_size}> '
+                     f'from cache of <{path}>')
+        return
+    if isinstance(use_cols, str) or not path.lower().endswith(EXCEL_STREAM_EXTENSIONS):
+        yield read(description, path, file_type='excel', skip_rows=skip_rows, use_cols=use_cols,
+                   sheet_name=sheet_name, sheet_cache_dir=cache_dir)
+        return
+
+    import openpyxl
+
+    records = 0
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for name in _excel_sheet_names(workbook.sheetnames, sheet_name, path):
+            rows = workbook[name].iter_rows(values_only=True)
+            for _ in range(skip_rows):
+                next(rows, None)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _excel_columns(header)
+            selected = list(_select_columns(pd.DataFrame(columns=columns), use_cols).columns)
+            positions = [columns.index(col_name) for col_name in selected]
+            batch = list()
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append([row[position] if position < len(row) else None for position in positions])
+                if len(batch) == chunk_size:
+                    records += len(batch)
+                    yield pd.DataFrame(batch, columns=selected)
+                    batch = list()
+            if batch:
+                records += len(batch)
+                yield pd.DataFrame(batch, columns=selected)
+    finally:
+        workbook.close()
+
+    logging.info(f'{description} records <{records}> were read in chunks of <{chunk_size}> from <{path}>')
+
+
+def _excel_sheet_names(sheet_names, sheet_name, path):
+    """
+    Resolve sheets to read out of the sheets of a workbook.
+    :param sheet_names: list; Sheet names of the workbook, in workbook order
+    :param sheet_name: int, str or list; Sheet names or indexes to read, None for every sheet
+    :param path: str; Fully qualified file name, for error reporting
+    :return: list; Sheet names to read
+    """
+    if len(sheet_names) == 1 or sheet_name is None:
+        return list(sheet_names)
+    names = list()
+    for sheet in (sheet_name if isinstance(sheet_name, (list, tuple)) else [sheet_name]):
+        if isinstance(sheet, int) and -len(sheet_names) <= sheet < len(sheet_names):
+            names.append(sheet_names[sheet])
+        elif sheet in sheet_names:
+            names.append(sheet)
+        else:
+            logging.error(f'Sheet <{sheet}> does not exist in <{path}>, sheets are <{sheet_names}>')
+            raise ValueError(f'Sheet <{sheet}> does not exist in <{path}>, sheets are <{sheet_names}>')
+    return names
+
+
+def _excel_columns(header):
+    """
+    Name columns of a sheet header row the way the Excel reader does: blank cells as 'Unnamed: <position>',
+    repeated names suffixed with '.<occurrence>'.
+    :param header: tuple; Header row values
+    :return: list; Column names
+    """
+    columns = list()
+    seen = dict()
+    for position, value in enumerate(header):
+        col_name = f'Unnamed: {position}' if value is None else value
+        if col_name in seen:
+            seen[col_name] += 1
+            col_name = f'{col_name}.{seen[col_name]}'
+        else:
+            seen[col_name] = 0
+        columns.append(col_name)
+    return columns
+
+
+def _select_columns(df, use_cols):
+    """
+    Select columns of a dataframe as readers do with <usecols>: names or positions, kept in file order,
+    or a callable taking a column name.
+    :param df: pd.DataFrame; Provided dataframe
+    :param use_cols: list or callable; Columns to select, None for all of them
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    if use_cols is None:
+        return df
+    if callable(use_cols):
+        return df[[col_name for col_name in df.columns if use_cols(col_name)]]
+    if all(isinstance(col_name, int) for col_name in use_cols):
+        return df.iloc[:, sorted(set(use_cols))]
+    missing = [col_name for col_name in use_cols if col_name not in df.columns]
+    if missing:
+        logging.error(f'Columns <{missing}> do not exist, columns are <{list(df.columns)}>')
+        raise ValueError(f'Columns <{missing}> do not exist, columns are <{list(df.columns)}>')
+    use_col_names = set(use_cols)
+    return df[[col_name for col_name in df.columns if col_name in use_col_names]]
+
+
+def write(df, description, path, file_type, index, separator=',', mode='overwrite', compression=None,
+          workers=DEFAULT_COMPRESS_WORKERS):
     """
     Write file, along with validating provided path.
+    File is written into a temporary file next to it, then moved into place atomically (see atomic_path and
+    publish_new), so that readers never see a partially written file; appending writes in place.
     :param df: pd.DataFrame; Provided dataframe
     :param description: str; File description
     :param path: str; Fully qualified file name to read
-    :param file_type: str, default='Excel'; Read type with possible values of 'csv' or 'excel'
+    :param file_type: str, default='Excel'; Write type with possible values of 'csv', 'excel', 'parquet' or 'feather'
     :param index: bool; Index to write
     :param separator: str, default=','; Values separator
-    :param mode: str; mode can be "new" or "overwrite"; default is "overwrite"
-    :return: null
+    :param mode: str; mode can be "new", "overwrite" or "append"; default is "overwrite"
+    :param compression: str, default=None; Compression of csv based file, 'gzip', 'bz2' or 'xz', detected from
+                        the file extension if not given
+    :param workers: int, default=DEFAULT_COMPRESS_WORKERS; Number of blocks compressed concurrently
+    :return: str; Path of the written file
     """
     if validate_path(Path(path).parent, isfile=False):
+        compression = compression_of(path, file_type, compression)
         if file_type.lower() == 'csv':
             if mode == "overwrite":
-                df.to_csv(path_or_buf=path, sep=separator, index=index)
+                with atomic_path(path) as tmp_path:
+                    _write_csv(df, tmp_path, separator, index, compression=compression, workers=workers)
                 logging.info(
                     f'New {file_type} file generated from DataFrame by overwriting, description: {description}.')
             elif mode == "new":
-                new_path = create_new_path(path)
-                df.to_csv(path_or_buf=new_path, sep=separator, index=index)
+                new_path = _write_new_version(path, lambda target_path: _write_csv(
+                    df, target_path, separator, index, compression=compression, workers=workers))
                 logging.info(
                     f'New {file_type} file generated from DataFrame by creating a new path, description: {description}.')
+                return new_path
+            elif mode == "append":
+                _write_csv(df, path, separator, index, append=True, compression=compression, workers=workers)
+                logging.info(f'{file_type} file appended from DataFrame, description: {description}.')
             else:
-                logging.error(f'Mode can only be "overwrite" or "new". ')
+                logging.error(f'Mode can only be "overwrite", "new" or "append". ')
 
         elif file_type.lower() == 'excel':
             if mode == "overwrite":
-                df.to_excel(excel_writer=path, index=False)
+                with atomic_path(path) as tmp_path:
+                    df.to_excel(excel_writer=tmp_path, index=False)
+                logging.info(
+                    f'New {file_type} file generated from DataFrame by overwriting, description: {description}.')
+            elif mode == "new":
+                new_path = _write_new_version(path, lambda target_path: df.to_excel(excel_writer=target_path,
+                                                                                    index=False))
+                logging.info(
+                    f'New {file_type} file generated from DataFrame by creating a new path, description: {description}.')
+                return new_path
+            elif mode == "append":
+                raise ValueError(f'Append mode is not supported for {file_type} files: <{path}>')
+            else:
+                logging.error(f'Mode can only be "overwrite" or "new" for excel files. ')
+
+        elif file_type.lower() in COLUMNAR_FILE_TYPES:
+            if mode == "overwrite":
+                with atomic_path(path) as tmp_path:
+                    _write_columnar(df, tmp_path, file_type, index)
                 logging.info(
                     f'New {file_type} file generated from DataFrame by overwriting, description: {description}.')
             elif mode == "new":
-                new_path = create_new_path(path)
-                df.to_excel(excel_writer=new_path, index=False)
+                new_path = _write_new_version(path, lambda target_path: _write_columnar(df, target_path, file_type,
+                                                                                        index))
                 logging.info(
                     f'New {file_type} file generated from DataFrame by creating a new path, description: {description}.')
+                return new_path
+            elif mode == "append":
+                raise ValueError(f'Append mode is not supported for {file_type} files: <{path}>')
             else:
-                logging.error(f'Mode can only be "overwrite" or "new". ')
+                logging.error(f'Mode can only be "overwrite" or "new" for {file_type} files. ')
         else:
-            logging.error(f'File type can only be "csv" or "excel. ')
+            logging.error(f'File type can only be "csv", "excel", "parquet" or "feather". ')
     else:
         logging.error(f'Path validation failed: <{path}>')
+    return path
+
+
+def write_partitions(df, description, path, file_type, index, partition_by, separator=',', mode='overwrite',
+                     workers=DEFAULT_IO_WORKERS, compression=None):
+    """
+    Write dataframe as a partitioned dataset: one file per combination of values of <partition_by> columns, laid out
+    as <dataset>/<column>=<value>/part.<ext>, where dataset is the path without its extension. Files are written
+    concurrently. Partition columns are kept in the files. Compressed partition files get the compression extension
+    too (e.g. part.csv.gz).
+    Mode "new" writes a new dataset (<dataset>_<N>) if the dataset already exists, "overwrite" replaces partition
+    files being written, "append" appends to partition files (creating the new ones).
+    :param df: pd.DataFrame; Provided dataframe
+    :param description: str; File description
+    :param path: str; Fully qualified file name, or dataset directory returned by a previous write
+    :param file_type: str; Write type with possible values of 'csv', 'excel', 'parquet' or 'feather'
+    :param index: bool; Index to write
+    :param partition_by: list; Partition columns
+    :param separator: str, default=','; Values separator
+    :param mode: str; mode can be "new", "overwrite" or "append"; default is "overwrite"
+    :param workers: int, default=DEFAULT_IO_WORKERS; Number of partition files written concurrently
+    :param compression: str, default=None; Compression of csv based files, detected from the path extension if not given
+    :return: str; Path of the dataset directory
+    """
+    compression = compression_of(path, file_type, compression)
+    dataset_path = split_ext(path)[0]
+    if mode == 'new' and os.path.exists(dataset_path):
+        dataset_path = _create_new_directory(dataset_path)
+    file_name = PARTITION_FILE_NAME + FILE_EXTENSIONS.get(file_type.lower(), ('',))[0]
+    if compression:
+        file_name += {value: key for key, value in COMPRESSION_EXTENSIONS.items()}[compression]
+
+    def write_partition(partition):
+        values, df_partition = partition
+        values = values if isinstance(values, tuple) else (values,)
+        directory = os.path.join(dataset_path, *[f'{col_name}={_partition_value(value)}'
+                                                 for col_name, value in zip(partition_by, values)])
+        os.makedirs(directory, exist_ok=True)
+        partition_path = os.path.join(directory, file_name)
+        partition_mode = 'append' if mode == 'append' and os.path.isfile(partition_path) else 'overwrite'
+        # Partitions are written concurrently already, every file is compressed by its own thread.
+        return write(df_partition, description, partition_path, file_type, index, separator, mode=partition_mode,
+                     compression=compression, workers=1)
+
+    partitions = df.groupby(partition_by, observed=True, dropna=False, sort=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        written = list(executor.map(write_partition, partitions))
+    logging.info(f'{description} partitions <{len(written)}> written by <{partition_by}> into <{dataset_path}>')
+    return dataset_path
+
+
+def _partition_value(value):
+    """
+    Format a partition value as a directory name.
+    :param value: Provided partition value
+    :return: str; Directory name
+    """
+    if pd.isna(value):
+        return PARTITION_NULL_VALUE
+    return str(value).replace(os.sep, '_')
+
+
+def _write_csv(df, path, separator, index, append=False, compression=None, workers=DEFAULT_COMPRESS_WORKERS):
+    """
+    Write dataframe into a csv based file. A compressed file is written block by block: blocks of
+    COMPRESSION_BLOCK_ROWS records are formatted and compressed concurrently, then written in order, so that
+    compression does not hold back the write; appending adds blocks to the existing file.
+    :param df: pd.DataFrame; Provided dataframe
+    :param path: str; Fully qualified file name to write
+    :param separator: str; Values separator
+    :param index: bool; Index to write
+    :param append: bool, default=False; Whether to append records, without header
+    :param compression: str, default=None; Compression, 'gzip', 'bz2' or 'xz'
+    :param workers: int, default=DEFAULT_COMPRESS_WORKERS; Number of blocks compressed concurrently
+    :return: null
+    """
+    if not compression:
+        if append:
+            df.to_csv(path_or_buf=path, sep=separator, index=index, mode='a', header=False)
+        else:
+            df.to_csv(path_or_buf=path, sep=separator, index=index)
+        return
+
+    def compress_block(start):
+        text = df.iloc[start:start + COMPRESSION_BLOCK_ROWS].to_csv(sep=separator, index=index,
+                                                                    header=start == 0 and not append)
+        return _compress(text.encode('utf-8'), compression)
+
+    # A dataframe without records still gets its header block.
+    starts = range(0, max(len(df.index), 1), COMPRESSION_BLOCK_ROWS)
+    with open(path, 'ab' if append else 'wb') as file_target, \
+            ThreadPoolExecutor(max_workers=max(1, min(workers, len(starts)))) as executor:
+        for block in executor.map(compress_block, starts):
+            file_target.write(block)
+
+
+def _compress(data, compression):
+    """
+    Compress a block of data as a self-contained gzip member, bz2 or xz stream.
+    :param data: bytes; Provided data
+    :param compression: str; Compression, 'gzip', 'bz2' or 'xz'
+    :return: bytes; Compressed data
+    """
+    if compression == 'gzip':
+        # No modification time in the header, so that the same records always compress to the same bytes.
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == 'bz2':
+        return bz2.compress(data)
+    return lzma.compress(data)
+
+
+def _write_columnar(df, path, file_type, index):
+    """
+    Write dataframe into a columnar (parquet or feather) file, preserving column data types.
+    :param df: pd.DataFrame; Provided dataframe
+    :param path: str; Fully qualified file name to write
+    :param file_type: str; Either 'parquet' or 'feather'
+    :param index: bool; Index to write
+    :return: null
+    """
+    if file_type.lower() == 'parquet':
+        df.to_parquet(path, index=bool(index))
+    else:
+        # Feather format can store neither a custom index nor a non-default one.
+        df = df.reset_index() if index else df.reset_index(drop=True)
+        df.to_feather(path)
 
 
 def validate_path(path, isfile=True):
@@ -99,18 +663,268 @@ def validate_path(path, isfile=True):
 
 def create_new_path(path):
     """
+    Allocate a new path for given one: the path itself if it does not exist yet, otherwise <root>_<N><ext>.
+    Version numbers come from a counter of the path (see VERSION_DIR), incremented under a lock,
+    so that allocation takes constant time whatever the number of versions and concurrent runs get distinct ones;
+    the directory is only scanned to initialize the counter.
     :param path: str; new path needs to be created from this path
     :return: str, a new path name
     """
-    try:
-        validate_path(path)
-        root = os.path.splitext(path)[0]
-        ext = os.path.splitext(path)[1]
-        counter = 1
-        new_path = os.path.join("", "".join([root, "_", str(counter), ext]))
-        while os.path.isfile(new_path):
-            counter += 1
-            new_path = os.path.join("", "".join([root, "_", str(counter), ext]))
+    if not os.path.exists(path):
+        return path
+    root, ext = split_ext(path)
+    new_path = f'{root}_{_next_version(path)}{ext}'
+    while os.path.exists(new_path):
+        # Version created behind the counter's back, e.g. copied by hand.
+        new_path = f'{root}_{_next_version(path)}{ext}'
+    return new_path
+
+
+def publish_new(tmp_path, path):
+    """
+    Move a written temporary file into a new path allocated for given one (see create_new_path), atomically and
+    without ever replacing an existing file, even when concurrent runs publish versions of the same path.
+    :param tmp_path: str; Fully qualified temporary file name, see temp_path
+    :param path: str; Fully qualified file name the new path is allocated for
+    :return: str; Published path
+    """
+    while True:
+        new_path = create_new_path(path)
+        try:
+            # Linking fails if another run published the same path in between, renaming would replace it.
+            os.link(tmp_path, new_path)
+        except FileExistsError:
+            continue
+        except OSError:
+            # File system without hard links.
+            os.replace(tmp_path, new_path)
+            return new_path
+        os.remove(tmp_path)
         return new_path
-    except FileNotFoundError:
-        return path
\ No newline at end of file
+
+
+def temp_path(path):
+    """
+    Create an empty temporary file next to given path, hidden and with the same extension (e.g. '.csv.gz'),
+    so that file type and compression are detected as for the path itself.
+    :param path: str; Fully qualified file name
+    :return: str; Fully qualified temporary file name
+    """
+    validate_path(Path(path).parent, isfile=False)
+    directory, name = os.path.split(os.path.abspath(path))
+    root, ext = split_ext(name)
+    tmp_path = os.path.join(directory, f'.{root}.{uuid.uuid4().hex[:16]}.tmp{ext}')
+    os.close(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+    return tmp_path
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    Temporary file to write instead of given path; it replaces the path atomically once written, and is removed
+    if writing fails.
+    Usage: with atomic_path(path) as tmp_path: df.to_csv(tmp_path)
+    :param path: str; Fully qualified file name
+    :return: str; Fully qualified temporary file name
+    """
+    tmp_path = temp_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def spill_directory(spill_dir=None):
+    """
+    Temporary directory holding data spilled to disk, removed with its files on exit, whether the caller
+    succeeds or fails.
+    Usage: with spill_directory(spill_dir) as directory: append_spill(os.path.join(directory, 'part'), df)
+    :param spill_dir: str, default=None; Parent directory, created if needed, system temporary directory if not given
+    :return: str; Fully qualified temporary directory name
+    """
+    if spill_dir:
+        os.makedirs(spill_dir, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=SPILL_DIR_PREFIX, dir=spill_dir or None)
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def append_spill(path, df):
+    """
+    Append a dataframe to a spill file, keeping its data types; a spill file holds a sequence of dataframes.
+    :param path: str; Fully qualified spill file name
+    :param df: pd.DataFrame; Provided dataframe
+    :return: int; Number of bytes written
+    """
+    data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(path, 'ab') as file_spill:
+        file_spill.write(data)
+    return len(data)
+
+
+def read_spill(path):
+    """
+    Read back dataframes appended to a spill file, in order, see append_spill.
+    :param path: str; Fully qualified spill file name
+    :return: iterable of pd.DataFrame; Spilled dataframes, none if the file does not exist
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, 'rb') as file_spill:
+        while True:
+            try:
+                yield pickle.load(file_spill)
+            except EOFError:
+                return
+
+
+@contextlib.contextmanager
+def async_writer(write_frame, queue_size=DEFAULT_WRITE_QUEUE_SIZE):
+    """
+    Write chunks on a background thread, in order, while the caller computes the next ones.
+    At most <queue_size> chunks wait for being written, so that memory stays bounded when writing is the slower side.
+    Writer runs in a copy of the current context (e.g. to measure stages). An error of the writer is raised
+    by the next put, or on exit; remaining chunks are then dropped.
+    Usage: with async_writer(lambda df: write(df, ...)) as put: for df in frames: put(df)
+    :param write_frame: callable; Writes a chunk
+    :param queue_size: int, default=DEFAULT_WRITE_QUEUE_SIZE; Number of chunks waiting for being written
+    :return: callable; Puts a chunk in line for writing
+    """
+    pending = queue.Queue(maxsize=max(1, queue_size))
+    errors = list()
+
+    def writer():
+        while True:
+            df = pending.get()
+            if df is _WRITE_END:
+                return
+            if not errors:
+                try:
+                    write_frame(df)
+                except BaseException as write_error:
+                    errors.append(write_error)
+
+    def put(df):
+        if errors:
+            raise errors[0]
+        pending.put(df)
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(writer,), daemon=True,
+                              name='opendata-writer')
+    thread.start()
+    try:
+        yield put
+    finally:
+        pending.put(_WRITE_END)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+@contextlib.contextmanager
+def parquet_writer(path, index=False):
+    """
+    Write dataframes one after another into a single parquet file, a row group each (e.g. output chunks).
+    Schema is the one of the first dataframe; its columns without any value are taken as text, so that next
+    dataframes fit in. File is complete once the writer is closed.
+    Usage: with parquet_writer(path) as put: for df in frames: put(df)
+    :param path: str; Fully qualified file name to write
+    :param index: bool, default=False; Index to write
+    :return: callable; Writes a dataframe
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, schema = None, None
+
+    def put(df):
+        nonlocal writer, schema
+        if writer is None:
+            table_schema = pa.Table.from_pandas(df, preserve_index=bool(index)).schema
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                for field in table_schema], metadata=table_schema.metadata)
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=bool(index)))
+
+    try:
+        yield put
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_new_version(path, write_file):
+    """
+    Write a new file for given path through a temporary file, published once written, see publish_new.
+    :param path: str; Fully qualified file name the new path is allocated for
+    :param write_file: callable; Writes the file, given the path to write
+    :return: str; Path of the written file
+    """
+    tmp_path = temp_path(path)
+    try:
+        write_file(tmp_path)
+        return publish_new(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _create_new_directory(path):
+    """
+    Create a new directory for given one, see create_new_path.
+    :param path: str; Fully qualified directory name
+    :return: str; Created directory
+    """
+    while True:
+        new_path = create_new_path(path)
+        try:
+            os.mkdir(new_path)
+            return new_path
+        except FileExistsError:
+            continue
+
+
+def _next_version(path):
+    """
+    Increment the version counter of given path under a lock, both in-process and across processes.
+    Counter is initialized with the highest version found in the directory, and initialized again once the last
+    version it allocated is gone (e.g. the directory was emptied or replaced).
+    :param path: str; Fully qualified file or directory name
+    :return: int; Allocated version
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    directory = os.path.realpath(directory)
+    root, ext = split_ext(name)
+    os.makedirs(VERSION_DIR, exist_ok=True)
+    counter_path = os.path.join(VERSION_DIR, cacheu.make_key(directory, name) + VERSION_EXT)
+    with _version_lock, open(counter_path, 'a+') as file_counter:
+        if fcntl is not None:
+            fcntl.flock(file_counter, fcntl.LOCK_EX)
+        file_counter.seek(0)
+        content = file_counter.read().strip()
+        last_version = int(content) if content.isdigit() else 0
+        if not last_version or not os.path.exists(os.path.join(directory, f'{root}_{last_version}{ext}')):
+            last_version = _max_version(directory, name)
+        version = last_version + 1
+        file_counter.seek(0)
+        file_counter.truncate()
+        file_counter.write(str(version))
+    return version
+
+
+def _max_version(directory, name):
+    """
+    Highest version of a file or directory name found in a directory.
+    :param directory: str; Directory to scan
+    :param name: str; File or directory name, e.g. 'output.csv' for versions 'output_<N>.csv'
+    :return: int; Highest version, 0 if there is none
+    """
+    root, ext = split_ext(name)
+    pattern = re.compile(re.escape(root) + r'_(\d+)' + re.escape(ext))
+    versions = [int(match.group(1)) for match in map(pattern.fullmatch, os.listdir(directory)) if match]
+    return max(versions, default=0)
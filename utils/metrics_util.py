@@ -0,0 +1,188 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+import utils.profile_util as profileu
+
+METRICS_EXT = '.metrics.jsonl'
+PROMETHEUS_EXT = '.prom'
+PROMETHEUS_PREFIX = 'opendata'
+# Numeric stage metrics, exported as Prometheus gauges.
+STAGE_METRICS = ('wall_s', 'cpu_s', 'process_cpu_s', 'rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'peak_mem_delta_mb', 'calls')
+
+# Run collecting stage metrics in current context; every thread (e.g. batch job) starts its own run.
+_current_run = contextvars.ContextVar('current_run', default=None)
+# Stages being measured in current context, innermost last.
+_open_stages = contextvars.ContextVar('open_stages', default=())
+_lock = threading.Lock()
+
+
+def start_run(process):
+    """
+    Start collecting stage metrics of a process run, in current context.
+    :param process: str; Process name, e.g. 'wendizhang_extraction'
+    :return: dict; Run record
+    """
+    run = {'run_id': uuid.uuid4().hex, 'process': process, 'start': datetime.now().isoformat(timespec='seconds'),
+           'status': None, 'wall_s': None, 'stages': dict(), '_wall_start': time.perf_counter()}
+    _current_run.set(run)
+    return run
+
+
+def end_run(run, status):
+    """
+    Stop collecting stage metrics of a process run.
+    :param run: dict; Run record, see start_run
+    :param status: str; Run status, e.g. 'success' or 'failure'
+    :return: dict; Run record
+    """
+    run['status'] = status
+    run['wall_s'] = time.perf_counter() - run.pop('_wall_start', time.perf_counter())
+    if _current_run.get() is run:
+        _current_run.set(None)
+    return run
+
+
+@contextlib.contextmanager
+def stage(name, **metrics):
+    """
+    Measure a workflow stage: wall time, CPU time and growth of peak memory, along with given metrics.
+    CPU time (cpu_s) is the one of the thread running the stage, so that stages measured concurrently (e.g. batch jobs
+    or backfill dates) do not count each other's work. Process CPU time (process_cpu_s) also counts threads started by
+    the stage itself (e.g. concurrent reads or block compression), along with any other thread running meanwhile.
+    Metrics of a stage measured several times within a run (e.g. once per chunk) are summed up.
+    Wall and CPU times of nested stages (e.g. input chunks read lazily during aggregation) are excluded from
+    the enclosing stage, so that every stage reports its own time only.
+    Stage is profiled too, when a profiling session is started (see profileu.start_session).
+    Usage: with stage('mapping', rows_in=len(df)) as record: ...; record['rows_out'] = len(df)
+    :param name: str; Stage name, e.g. 'input', 'plugin', 'mapping', 'assign', 'aggregate', 'dupl', 'rearrange', 'write'
+    :param metrics: Initial stage metrics, e.g. rows_in, bytes_read
+    :return: dict; Stage metrics of this measurement, to be completed by the caller
+    """
+    record = dict(metrics)
+    nested = {'wall_s': 0.0, 'cpu_s': 0.0, 'process_cpu_s': 0.0}
+    token = _open_stages.set(_open_stages.get() + (nested,))
+    peak_start = _peak_mem_mb()
+    start = {'wall_s': time.perf_counter(), 'cpu_s': time.thread_time(), 'process_cpu_s': time.process_time()}
+    try:
+        with profileu.profile_stage(name):
+            yield record
+    finally:
+        spent = {'wall_s': time.perf_counter() - start['wall_s'], 'cpu_s': time.thread_time() - start['cpu_s'],
+                 'process_cpu_s': time.process_time() - start['process_cpu_s']}
+        _open_stages.reset(token)
+        enclosing = _open_stages.get()
+        for key, value in spent.items():
+            if enclosing:
+                enclosing[-1][key] += value
+            record[key] = value - nested[key]
+        record['peak_mem_delta_mb'] = _peak_mem_mb() - peak_start
+        record['calls'] = 1
+        run = _current_run.get()
+        if run is not None:
+            # Stages of a run may be measured by several threads at once (e.g. dates of a backfill).
+            with _lock:
+                totals = run['stages'].setdefault(name, dict())
+                for key, value in record.items():
+                    if isinstance(value, (int, float)):
+                        totals[key] = totals.get(key, 0) + value
+
+
+def rows(df):
+    """
+    Number of records of a dataframe, None if it is not a dataframe (e.g. a plugin returned something else).
+    :param df: pd.DataFrame; Provided dataframe
+    :return: int; Number of records
+    """
+    return len(df.index) if hasattr(df, 'index') else None
+
+
+def file_size(path):
+    """
+    Size of a file, or total size of files within a directory (e.g. a partitioned dataset), 0 if it does not exist.
+    :param path: str; Fully qualified file or directory name
+    :return: int; Size in bytes
+    """
+    try:
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(directory, name))
+                       for directory, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def metrics_paths(log_path, process):
+    """
+    Metrics file names, placed next to logging file.
+    JSON-lines file is shared by all processes; every process gets its own Prometheus textfile,
+    so that processes logging into the same directory do not overwrite each other's metrics.
+    :param log_path: str; Fully qualified logging file
+    :param process: str; Process name, e.g. 'wendizhang_extraction'
+    :return: tuple; JSON-lines and Prometheus textfile names
+    """
+    root = os.path.splitext(log_path)[0]
+    return root + METRICS_EXT, f'{root}.{process}{PROMETHEUS_EXT}'
+
+
+def write_jsonl(path, run):
+    """
+    Append stage metrics of a run to a JSON-lines file, one line per stage.
+    :param path: str; Fully qualified metrics file name
+    :param run: dict; Run record, see start_run
+    :return: null
+    """
+    lines = list()
+    for stage_name, totals in run['stages'].items():
+        lines.append(json.dumps({'run_id': run['run_id'], 'process': run['process'], 'start': run['start'],
+                                 'status': run['status'], 'stage': stage_name, **totals}))
+    lines.append(json.dumps({'run_id': run['run_id'], 'process': run['process'], 'start': run['start'],
+                             'status': run['status'], 'stage': 'total', 'wall_s': run['wall_s']}))
+    with _lock:
+        with open(path, 'a') as file_metrics:
+            file_metrics.write('\n'.join(lines) + '\n')
+
+
+def write_prometheus(path, run):
+    """
+    Write stage metrics of a run as a Prometheus textfile-collector file, atomically.
+    :param path: str; Fully qualified textfile name, ending with '.prom'
+    :param run: dict; Run record, see start_run
+    :return: null
+    """
+    labels = f'process="{run["process"]}"'
+    lines = list()
+    for metric in STAGE_METRICS:
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_stage_{metric} gauge')
+        for stage_name, totals in run['stages'].items():
+            if totals.get(metric) is not None:
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_{metric}{{{labels},stage="{stage_name}"}} {totals[metric]}')
+    lines.append(f'# TYPE {PROMETHEUS_PREFIX}_run_wall_s gauge')
+    lines.append(f'{PROMETHEUS_PREFIX}_run_wall_s{{{labels}}} {run["wall_s"]}')
+    lines.append(f'# TYPE {PROMETHEUS_PREFIX}_run_success gauge')
+    lines.append(f'{PROMETHEUS_PREFIX}_run_success{{{labels}}} {1 if run["status"] == "success" else 0}')
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as file_prometheus:
+        file_prometheus.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+    logging.info(f'Prometheus metrics written into <{path}>')
+
+
+def _peak_mem_mb():
+    """
+    Peak resident set size of this process so far.
+    :return: float; Peak resident set size in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
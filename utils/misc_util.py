@@ -1,6 +1,8 @@
 
 from argparse import Namespace as ArgNamespace
 import importlib
+import logging
+import threading
 from types import SimpleNamespace
 
 
@@ -38,23 +40,65 @@ def eval_elem_mapping(mapping, key, default_value=None):
 def eval_func(mapping, func_key):
     """
     Extract function name from configuration mapping and construct function / callable object
+    Errors are raised rather than ignored, so that a misconfigured function does not silently turn into no function.
     :param mapping: dict; Provided mapping
     :param key: int or str; Provided key
-    :return: Resulted function object
+    :return: Resulted function object, None if no function is configured
     """
     func_target = None
     if func_key in mapping and mapping[func_key]:
+        if '.' not in mapping[func_key]:
+            logging.error(f'Function <{mapping[func_key]}> is not a dotted path <module.function>')
+            raise ValueError(f'Function <{mapping[func_key]}> is not a dotted path <module.function>')
         module_name, func_name = mapping[func_key].rsplit(".", 1)
         try:
             module = importlib.import_module(module_name)
-            if hasattr(module, func_name):
-                func_target = getattr(module, func_name)
-        except Exception:
-            pass
+        except ImportError as import_error:
+            logging.error(f'Module <{module_name}> of function <{mapping[func_key]}> cannot be imported: '
+                          f'{import_error}')
+            raise
+        if not hasattr(module, func_name):
+            logging.error(f'Function <{func_name}> does not exist in module <{module_name}>')
+            raise AttributeError(f'Function <{func_name}> does not exist in module <{module_name}>')
+        func_target = getattr(module, func_name)
 
     return func_target
 
 
+def lazy_import(name):
+    """
+    Import a module on first access to one of its attributes, so that heavy libraries (e.g. pandas) are only imported
+    once a stage actually needs them. First access is serialized, it is safe to share the module among threads.
+    Usage: pd = miscu.lazy_import('pandas') at module level, then pd.read_csv(...) as usual
+    :param name: str; Fully qualified module name, e.g. 'utils.etl_util'
+    :return: Module proxy, importing the module on first attribute access
+    """
+    return _LazyModule(name)
+
+
+class _LazyModule:
+    """
+    Proxy of a module imported on first attribute access, see lazy_import.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{' (imported)' if self._module is not None else ''}>"
+
+
 def eval_func2(mapping, func_key):
     """
     Extract function name from configuration mapping and construct function / callable object
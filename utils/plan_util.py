@@ -0,0 +1,263 @@
+import utils.misc_util as miscu
+import utils.registry_util as registryu
+
+
+def compile_extraction(stages):
+    """
+    Compile prepared Extraction configuration sections into a logical plan.
+    :param stages: dict; Prepared configuration sections, keyed by workflow stage
+    :return: list of dict; Plan nodes, in order of execution
+    """
+    plan = [_read_node('input', stages['input_read']),
+            _plugin_node('input', stages['input'])]
+
+    mapping_config = stages['mapping']
+    for index, join_config in enumerate(mapping_joins(mapping_config)):
+        plan.append({'op': 'mapping', 'name': 'mapping' if not index else f'lookup_{index}',
+                     'left_on': list(miscu.eval_elem_mapping(join_config, 'left_on', default_value=list())),
+                     'right_on': list(miscu.eval_elem_mapping(join_config, 'right_on', default_value=list())),
+                     'strategy': miscu.eval_elem_mapping(join_config, 'strategy', default_value='auto'),
+                     'read': _read_node('mapping' if not index else f'lookup_{index}',
+                                        miscu.eval_elem_mapping(join_config, 'read'))})
+    plan.append(_plugin_node('mapping', mapping_config))
+
+    plan += [_assign_node('assign', stages['assign']),
+             _plugin_node('assign', stages['assign'])]
+    plan += _output_nodes(stages)
+    return [node for node in plan if node]
+
+
+def mapping_joins(config):
+    """
+    Mapping tables joined by mapping stage: the one of <mapping> config section itself, then every <lookups> element.
+    :param config: dict; Provided <mapping> config section
+    :return: list of dict; Join configurations, each with <read>, <left_on>, <right_on> and optional <strategy>
+    """
+    return [config] + list(miscu.eval_elem_mapping(config, 'lookups', default_value=list()))
+
+
+def compile_transformation(stages):
+    """
+    Compile prepared Transformation configuration sections into a logical plan.
+    :param stages: dict; Prepared configuration sections, keyed by workflow stage
+    :return: list of dict; Plan nodes, in order of execution
+    """
+    plan = [_read_node('input', stages['input_read']),
+            _plugin_node('input', stages['input'])]
+
+    aggregate_config = stages['aggregate']
+    if aggregate_config:
+        group_by = miscu.eval_elem_mapping(aggregate_config, 'group_by', default_value=list())
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+        agg_columns = list(miscu.eval_elem_mapping(aggregate_config, 'agg', default_value=dict()).keys())
+        plan.append({'op': 'aggregate', 'name': 'aggregate', 'group_by': group_by, 'columns': group_by + agg_columns,
+                     'memory_budget_mb': miscu.eval_elem_mapping(aggregate_config, 'memory_budget_mb')})
+
+    plan += [_assign_node('assign', stages['assign']),
+             _plugin_node('assign', stages['assign']),
+             _assign_node('dupl', stages['dupl'], op='dupl')]
+    plan += _output_nodes(stages)
+    return [node for node in plan if node]
+
+
+def optimize(plan):
+    """
+    Optimize logical plan: walking it backwards from the output, compute columns actually needed by every stage
+    and push projection down to readers (input and mapping ones).
+    Plugins before the final reorder may use any column, so that they stop the pushdown.
+    :param plan: list of dict; Plan nodes, see compile_extraction or compile_transformation
+    :return: list of dict; Optimized plan nodes; read nodes get a <projection> element, None meaning all columns
+    """
+    optimized = [dict(node) for node in plan]
+    # Columns needed downstream of the current node, None meaning all of them.
+    required = None
+    for node in reversed(optimized):
+        op = node['op']
+        if op == 'project':
+            required = set(node['columns'])
+        elif op == 'plugin':
+            if node['name'] != 'output':
+                required = None
+        elif op == 'rename':
+            if required is not None:
+                inverse = {new_name: old_name for old_name, new_name in node['mapping'].items()}
+                required = {inverse.get(col_name, col_name) for col_name in required}
+        elif op == 'assign':
+            if required is not None:
+                required -= set(node['columns'])
+        elif op == 'dupl':
+            # Duplicated copies get their values from config, original records keep their input ones: columns stay
+            # required as they are.
+            pass
+        elif op == 'aggregate':
+            required = set(node['columns'])
+        elif op == 'mapping':
+            mapping_read = dict(node['read'])
+            mapping_columns = mapping_read['columns']
+            if required is None or mapping_columns is None:
+                mapping_read['projection'] = None
+                required = None
+            else:
+                # Right join keys are needed to merge only; mapping columns needed downstream are kept along.
+                mapping_read['projection'] = [col_name for col_name in mapping_columns
+                                              if col_name in required or col_name in node['right_on']]
+                required = (required - set(mapping_columns)) | set(node['left_on'])
+            node['read'] = mapping_read
+        elif op == 'read':
+            if required is None or node['columns'] is None:
+                node['projection'] = None
+            else:
+                # At least one column is kept, so that the number of records is preserved.
+                node['projection'] = ([col_name for col_name in node['columns'] if col_name in required]
+                                      or node['columns'][:1])
+    return optimized
+
+
+def apply_plan(plan, stages):
+    """
+    Push projections of optimized plan down into read configuration sections of prepared stages.
+    Pruned columns are removed from both <use_cols> and <apply_dtype>, so that they are neither loaded nor cast.
+    :param plan: list of dict; Optimized plan nodes, see optimize
+    :param stages: dict; Prepared configuration sections, updated in place
+    :return: dict; Updated configuration sections
+    """
+    mapping_nodes = [node for node in plan if node['op'] == 'mapping']
+    for node in plan:
+        if node['op'] == 'read' and node['name'] == 'input':
+            _apply_projection(stages['input_read'], node.get('projection'))
+    for node, join_config in zip(mapping_nodes, mapping_joins(stages['mapping']) if mapping_nodes else list()):
+        _apply_projection(join_config['read'], node['read'].get('projection'))
+    return stages
+
+
+def explain(plan, title='Plan'):
+    """
+    Format logical plan as a text, one node per line.
+    :param plan: list of dict; Plan nodes
+    :param title: str, default='Plan'; Plan title
+    :return: str; Formatted plan
+    """
+    lines = [f'{title}:']
+    for node in plan:
+        op = node['op']
+        if op == 'read':
+            lines.append(f'  {_explain_read(node)}')
+        elif op == 'mapping':
+            lines.append(f'  {node["name"]} left_on={node["left_on"]} right_on={node["right_on"]} '
+                         f'strategy={node["strategy"]} (key columns dropped before merge)')
+            lines.append(f'    {_explain_read(node["read"])}')
+        elif op == 'plugin':
+            lines.append(f'  plugin {node["name"]} <{node["func"]}> [{node["scope"]}]')
+        elif op == 'aggregate':
+            budget = (f' memory_budget_mb={node["memory_budget_mb"]} (spills to disk beyond)'
+                      if node.get('memory_budget_mb') else '')
+            lines.append(f'  aggregate group_by={node["group_by"]} columns={node["columns"]}{budget}')
+        elif op in ('assign', 'dupl'):
+            lines.append(f'  {op} columns={node["columns"]}')
+        elif op == 'rename':
+            lines.append(f'  rename {node["mapping"]} (in place)')
+        elif op == 'project':
+            lines.append(f'  project columns={node["columns"]}')
+        elif op == 'write':
+            lines.append(f'  write {node["name"]} [{node["file_type"]}] <{node["path"]}>')
+    return '\n'.join(lines)
+
+
+def _read_node(name, config):
+    """
+    Build a read plan node; its columns are known only when <apply_dtype> config section limits them.
+    :param name: str; Read name, e.g. 'input', 'mapping' or 'lookup_1'
+    :param config: dict; Provided read configuration section
+    :return: dict; Plan node
+    """
+    apply_dtype_config = miscu.eval_elem_mapping(config, 'apply_dtype')
+    use_cols = miscu.eval_elem_mapping(config, 'use_cols')
+    columns = None
+    if apply_dtype_config and isinstance(apply_dtype_config, dict):
+        columns = list(apply_dtype_config.keys())
+    elif use_cols and all(isinstance(col_name, str) for col_name in use_cols):
+        columns = list(use_cols)
+    return {'op': 'read', 'name': name, 'columns': columns,
+            'file_type': miscu.eval_elem_mapping(config, 'file_type', default_value='excel'),
+            'path': miscu.eval_elem_mapping(config, 'path')}
+
+
+def _plugin_node(name, config):
+    """
+    Build a plugin plan node, if plugin is configured; plugin is resolved and validated here, once, at startup.
+    :param name: str; Name of config section engaging the plugin
+    :param config: dict; Provided config section
+    :return: dict; Plan node, None if no plugin is configured
+    """
+    func = miscu.eval_elem_mapping(config, 'plugin')
+    if not func:
+        return None
+    return {'op': 'plugin', 'name': name, 'func': func, 'scope': registryu.scope_of(registryu.resolve(func), func)}
+
+
+def _assign_node(name, config, op='assign'):
+    """
+    Build an assign (or dupl) plan node, listing columns it sets.
+    :param name: str; Name of config section
+    :param config: dict; Provided config section
+    :param op: str, default='assign'; Node operation, either 'assign' or 'dupl'
+    :return: dict; Plan node, None if config section is empty
+    """
+    if not config:
+        return None
+    columns = list()
+    for key in ('col_const', 'col_var'):
+        columns += list(miscu.eval_elem_mapping(config, key, default_value=dict()).keys())
+    return {'op': op, 'name': name, 'columns': columns}
+
+
+def _output_nodes(stages):
+    """
+    Build plan nodes of output section: rename, reorder (project), output plugin and write.
+    :param stages: dict; Prepared configuration sections
+    :return: list of dict; Plan nodes
+    """
+    rearrange_config = miscu.eval_elem_mapping(stages['output'], 'rearrange')
+    col_rename = miscu.eval_elem_mapping(rearrange_config, 'col_rename')
+    col_reorder = miscu.eval_elem_mapping(rearrange_config, 'col_reorder')
+    write_config = stages['output_write']
+    nodes = list()
+    if col_rename and isinstance(col_rename, dict):
+        nodes.append({'op': 'rename', 'name': 'rearrange', 'mapping': dict(col_rename)})
+    if col_reorder and isinstance(col_reorder, list):
+        nodes.append({'op': 'project', 'name': 'rearrange', 'columns': list(col_reorder)})
+    nodes.append(_plugin_node('output', stages['output']))
+    nodes.append({'op': 'write', 'name': 'output',
+                  'file_type': miscu.eval_elem_mapping(write_config, 'file_type', default_value='excel'),
+                  'path': miscu.eval_elem_mapping(write_config, 'path')})
+    return nodes
+
+
+def _apply_projection(config, projection):
+    """
+    Limit read configuration section to projected columns.
+    :param config: dict; Provided read configuration section, updated in place
+    :param projection: list; Projected columns, None meaning all columns
+    :return: null
+    """
+    if projection is None or not isinstance(config, dict):
+        return
+    apply_dtype_config = miscu.eval_elem_mapping(config, 'apply_dtype')
+    if apply_dtype_config and isinstance(apply_dtype_config, dict):
+        config['apply_dtype'] = {col_name: type_value for col_name, type_value in apply_dtype_config.items()
+                                 if col_name in projection}
+    config['use_cols'] = list(projection)
+
+
+def _explain_read(node):
+    """
+    Format a read plan node.
+    :param node: dict; Read plan node
+    :return: str; Formatted node
+    """
+    text = f'read {node["name"]} [{node["file_type"]}] <{node["path"]}>'
+    projection = node.get('projection')
+    if projection is None:
+        return f'{text} columns={node["columns"] or "all"}'
+    pruned = [col_name for col_name in node['columns'] if col_name not in projection]
+    return f'{text} columns={projection} pruned={pruned}'
@@ -0,0 +1,264 @@
+import contextlib
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+MODE_DETERMINISTIC = 'deterministic'
+MODE_SAMPLING = 'sampling'
+PROFILE_MODES = (MODE_DETERMINISTIC, MODE_SAMPLING)
+DEFAULT_SAMPLING_INTERVAL = 0.005
+DEFAULT_TOP = 10
+# Collapsed stacks of deterministic profiles are weighted in microseconds, frames deeper than this are cut.
+COLLAPSED_MAX_DEPTH = 64
+COLLAPSED_MIN_US = 1
+
+# Profiling session of current context, see start_session.
+_current_session = contextvars.ContextVar('current_session', default=None)
+# Profilers enabled in current context, innermost last.
+_open_profilers = contextvars.ContextVar('open_profilers', default=())
+
+
+def start_session(process, mode=MODE_DETERMINISTIC, interval=DEFAULT_SAMPLING_INTERVAL):
+    """
+    Start profiling workflow stages of a process run, in current context.
+    Deterministic mode runs cProfile within every stage; sampling mode records call stacks of threads running
+    a stage every <interval> seconds from a background thread, which is cheap enough for production runs.
+    :param process: str; Process name, e.g. 'wendizhang_extraction'
+    :param mode: str, default=MODE_DETERMINISTIC; Either MODE_DETERMINISTIC or MODE_SAMPLING
+    :param interval: float, default=DEFAULT_SAMPLING_INTERVAL; Seconds between samples, sampling mode only
+    :return: dict; Profiling session
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f'Profile mode <{mode}> is not supported, use one of <{PROFILE_MODES}>')
+    session = {'process': process, 'mode': mode, 'profilers': dict(), 'samples': dict(),
+               'threads': dict(), 'lock': threading.Lock(), 'stop': threading.Event(), 'sampler': None}
+    if mode == MODE_SAMPLING:
+        session['sampler'] = threading.Thread(target=_sample, args=(session, interval), daemon=True,
+                                              name='opendata-profile-sampler')
+        session['sampler'].start()
+    _current_session.set(session)
+    return session
+
+
+def end_session(session):
+    """
+    Stop profiling workflow stages of a process run.
+    :param session: dict; Profiling session, see start_session
+    :return: dict; Profiling session
+    """
+    session['stop'].set()
+    if session['sampler'] is not None:
+        session['sampler'].join()
+    if _current_session.get() is session:
+        _current_session.set(None)
+    return session
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """
+    Profile a workflow stage within current profiling session, if any; profiles of a stage run several times
+    (e.g. once per chunk) are accumulated. Nested stages are profiled on their own, pausing the enclosing one.
+    :param name: str; Stage name, e.g. 'input', 'plugin', 'mapping'
+    :return: null
+    """
+    session = _current_session.get()
+    if session is None:
+        yield
+    elif session['mode'] == MODE_SAMPLING:
+        thread_id = threading.get_ident()
+        with session['lock']:
+            stage_names = session['threads'].setdefault(thread_id, list())
+            stage_names.append(name)
+        try:
+            yield
+        finally:
+            with session['lock']:
+                stage_names.pop()
+                if not stage_names:
+                    del session['threads'][thread_id]
+    else:
+        with session['lock']:
+            profiler = session['profilers'].setdefault(name, cProfile.Profile())
+        enclosing = _open_profilers.get()
+        if enclosing:
+            enclosing[-1].disable()
+        token = _open_profilers.set(enclosing + (profiler,))
+        enabled = _enable(profiler, name)
+        try:
+            yield
+        finally:
+            if enabled:
+                profiler.disable()
+            _open_profilers.reset(token)
+            if enclosing:
+                _enable(enclosing[-1], name)
+
+
+def write_profiles(session, directory, top=DEFAULT_TOP):
+    """
+    Write profiles of every stage into given directory: <process>.<stage>.pstats (deterministic mode only)
+    and <process>.<stage>.collapsed, the collapsed-stack format read by flamegraph.pl, speedscope or inferno.
+    Summary of top hot functions per stage is written into <process>.summary.txt too.
+    :param session: dict; Profiling session, see start_session
+    :param directory: str; Output directory, created if needed
+    :param top: int, default=DEFAULT_TOP; Number of hot functions per stage in summary
+    :return: str; Summary of top hot functions per stage
+    """
+    os.makedirs(directory, exist_ok=True)
+    root = os.path.join(directory, session['process'])
+    if session['mode'] == MODE_DETERMINISTIC:
+        for stage_name, profiler in session['profilers'].items():
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            if not stats.stats:
+                continue
+            stats.dump_stats(f'{root}.{stage_name}.pstats')
+            _write_collapsed(f'{root}.{stage_name}.collapsed', collapse_stats(stats, stage_name))
+    else:
+        for stage_name, samples in session['samples'].items():
+            _write_collapsed(f'{root}.{stage_name}.collapsed', samples)
+
+    summary = format_summary(session, top)
+    with open(f'{root}.summary.txt', 'w') as file_summary:
+        file_summary.write(summary + '\n')
+    logging.info(f'Profiles of <{session["process"]}> written into <{directory}>')
+    return summary
+
+
+def format_summary(session, top=DEFAULT_TOP):
+    """
+    Format top hot functions per stage, by own (exclusive) time or number of samples.
+    :param session: dict; Profiling session, see start_session
+    :param top: int, default=DEFAULT_TOP; Number of hot functions per stage
+    :return: str; Formatted summary
+    """
+    lines = [f'Profile of {session["process"]} ({session["mode"]}):']
+    if session['mode'] == MODE_DETERMINISTIC:
+        for stage_name, profiler in session['profilers'].items():
+            stats = pstats.Stats(profiler, stream=io.StringIO()).stats
+            lines.append(f'  {stage_name}:')
+            lines.append(f'    {"OWN_S":>9}  {"CUM_S":>9}  {"CALLS":>9}  FUNCTION')
+            for func, (_, calls, own, cumulative, _) in sorted(stats.items(), key=lambda item: -item[1][2])[:top]:
+                lines.append(f'    {own:>9.4f}  {cumulative:>9.4f}  {calls:>9}  {_func_name(func)}')
+    else:
+        for stage_name, samples in session['samples'].items():
+            own_samples = Counter()
+            for stack, count in samples.items():
+                own_samples[stack.rsplit(';', 1)[-1]] += count
+            total = sum(samples.values())
+            lines.append(f'  {stage_name}: {total} samples')
+            lines.append(f'    {"SAMPLES":>9}  {"SHARE":>6}  FUNCTION')
+            for func_name, count in own_samples.most_common(top):
+                lines.append(f'    {count:>9}  {count / total:>6.1%}  {func_name}')
+    return '\n'.join(lines)
+
+
+def collapse_stats(stats, stage_name):
+    """
+    Derive collapsed stacks from a deterministic profile. cProfile keeps caller-callee edges only, so time of
+    a function is split among its call paths in proportion of the cumulative time of every edge; time of calls made
+    from outside the profile (e.g. by the stage body itself), which no edge covers, is rooted at the stage.
+    :param stats: pstats.Stats; Provided profile
+    :param stage_name: str; Stage name, used as the root frame
+    :return: Counter; Mapping of ';'-joined stack to its own time in microseconds
+    """
+    callees = dict()
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, list()).append((func, edge[3]))
+    roots = list()
+    for func, (_, _, _, cumulative, callers) in stats.stats.items():
+        covered = sum(edge[3] for edge in callers.values())
+        if not callers:
+            roots.append((func, 1.0))
+        elif cumulative > covered:
+            roots.append((func, (cumulative - covered) / cumulative))
+    stacks = Counter()
+
+    def visit(func, path, share):
+        _, _, own, cumulative, _ = stats.stats[func]
+        path = path + [_func_name(func)]
+        weight = int(own * share * 1e6)
+        if weight >= COLLAPSED_MIN_US:
+            stacks[';'.join(path)] += weight
+        if len(path) >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee, edge_cumulative in callees.get(func, list()):
+            callee_cumulative = stats.stats[callee][3]
+            callee_share = share * edge_cumulative / callee_cumulative if callee_cumulative else 0.0
+            if _func_name(callee) not in path and callee_share * callee_cumulative * 1e6 >= COLLAPSED_MIN_US:
+                visit(callee, path, callee_share)
+
+    for root_func, root_share in roots:
+        if root_share * stats.stats[root_func][3] * 1e6 >= COLLAPSED_MIN_US or root_share == 1.0:
+            visit(root_func, [stage_name], root_share)
+    return stacks
+
+
+def _write_collapsed(path, stacks):
+    """
+    Write collapsed stacks, one '<frame>;<frame>;... <weight>' line per stack.
+    :param path: str; Fully qualified file name
+    :param stacks: dict; Mapping of ';'-joined stack to its weight
+    :return: null
+    """
+    with open(path, 'w') as file_collapsed:
+        for stack, weight in sorted(stacks.items()):
+            file_collapsed.write(f'{stack} {weight}\n')
+
+
+def _sample(session, interval):
+    """
+    Sampler thread: record call stacks of every thread running a stage, until session is stopped.
+    :param session: dict; Profiling session, see start_session
+    :param interval: float; Seconds between samples
+    :return: null
+    """
+    while not session['stop'].wait(interval):
+        frames = sys._current_frames()
+        with session['lock']:
+            running = {thread_id: stage_names[-1] for thread_id, stage_names in session['threads'].items()}
+        for thread_id, stage_name in running.items():
+            frame = frames.get(thread_id)
+            stack = list()
+            while frame is not None and len(stack) < COLLAPSED_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                samples = session['samples'].setdefault(stage_name, Counter())
+                samples[';'.join([stage_name] + stack[::-1])] += 1
+
+
+def _enable(profiler, name):
+    """
+    Enable a profiler; interpreters allowing a single active profiler (Python 3.12+) may refuse it
+    while another thread is profiled, in which case the stage is left unprofiled.
+    :param profiler: cProfile.Profile; Provided profiler
+    :param name: str; Stage name
+    :return: bool; True if profiler is enabled
+    """
+    try:
+        profiler.enable()
+        return True
+    except ValueError as profile_error:
+        logging.warning(f'Stage <{name}> is not profiled: {profile_error}')
+        return False
+
+
+def _func_name(func):
+    """
+    Format a pstats function key as a single frame name, without ';' which separates collapsed frames.
+    :param func: tuple; pstats function key (file name, line number, function name)
+    :return: str; Frame name
+    """
+    file_name, line, func_name = func
+    if file_name == '~':
+        return func_name.replace(';', ',')
+    return f'{func_name} ({os.path.basename(file_name)}:{line})'.replace(';', ',')
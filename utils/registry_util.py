@@ -0,0 +1,111 @@
+import functools
+import logging
+import utils.misc_util as miscu
+
+# Row-local plugins work record by record, so that they can run on every chunk or in every worker process;
+# global plugins need the whole frame (e.g. ranking, deduplication), which disables chunked and parallel runs.
+SCOPE_ROW_LOCAL = 'row_local'
+SCOPE_GLOBAL = 'global'
+PLUGIN_SCOPES = (SCOPE_ROW_LOCAL, SCOPE_GLOBAL)
+# Plugins not declaring their scope keep running as they always did, chunk by chunk.
+DEFAULT_SCOPE = SCOPE_ROW_LOCAL
+SCOPE_ATTRIBUTE = 'plugin_scope'
+# Plugins whose result depends on more than their input (e.g. current date) declare themselves non-cacheable,
+# so that stage cache neither stores nor serves their result.
+CACHEABLE_ATTRIBUTE = 'plugin_cacheable'
+
+
+def plugin(scope=DEFAULT_SCOPE, cacheable=True):
+    """
+    Declare a function as a plugin of given scope.
+    A plugin takes a dataframe and returns either the resulted dataframe, or a mapping of column names to vectorized
+    expressions assigned to the dataframe (see apply).
+    Usage: @registryu.plugin(scope=registryu.SCOPE_GLOBAL) above the plugin function
+    :param scope: str, default=DEFAULT_SCOPE; Either SCOPE_ROW_LOCAL or SCOPE_GLOBAL
+    :param cacheable: bool, default=True; Whether plugin result only depends on its input dataframe and source,
+                      False if it depends on anything else (e.g. current date or an external service)
+    :return: callable; Decorator
+    """
+    _validate_scope(scope, 'plugin decorator')
+
+    def decorate(func):
+        setattr(func, SCOPE_ATTRIBUTE, scope)
+        setattr(func, CACHEABLE_ATTRIBUTE, cacheable)
+        return func
+    return decorate
+
+
+@functools.lru_cache(maxsize=None)
+def resolve(reference):
+    """
+    Resolve a plugin from its dotted path (e.g. 'apps.opendata.src.plugin_util.add_datetime_into_comments_plugin'),
+    once per process, validating it: module must import, function must exist, be callable and declare a valid scope.
+    :param reference: str; Dotted path of the plugin, as configured in <plugin> element of a config section
+    :return: callable; Resolved plugin, None if reference is empty
+    """
+    if not reference:
+        return None
+    func = miscu.eval_func({'plugin': reference}, 'plugin')
+    if not callable(func):
+        logging.error(f'Plugin <{reference}> is not callable')
+        raise TypeError(f'Plugin <{reference}> is not callable')
+    logging.info(f'Plugin <{reference}> resolved, scope <{scope_of(func, reference)}>')
+    return func
+
+
+def scope_of(func, reference=None):
+    """
+    Scope declared by a plugin, see plugin.
+    :param func: callable; Resolved plugin
+    :param reference: str, default=None; Dotted path of the plugin, for error reporting
+    :return: str; Either SCOPE_ROW_LOCAL or SCOPE_GLOBAL
+    """
+    scope = getattr(func, SCOPE_ATTRIBUTE, DEFAULT_SCOPE)
+    _validate_scope(scope, reference or func)
+    return scope
+
+
+def is_cacheable(func):
+    """
+    Whether result of a plugin may be kept by stage cache, see plugin.
+    :param func: callable; Resolved plugin
+    :return: bool; False if plugin declares itself non-cacheable
+    """
+    return bool(getattr(func, CACHEABLE_ATTRIBUTE, True))
+
+
+def apply(func, df):
+    """
+    Engage a plugin on a dataframe.
+    Plugin may return a mapping of column names to vectorized expressions, assigned in order: a string is evaluated
+    by DataFrame.eval (e.g. "AMOUNT * RATE"), a callable is called with the dataframe, any other value (Series, array
+    or scalar) is assigned as is. A plugin returning None is taken as having updated the dataframe in place.
+    :param func: callable; Resolved plugin
+    :param df: pd.DataFrame; Provided dataframe
+    :return: pd.DataFrame; Resulted dataframe
+    """
+    result = func(df)
+    if result is None:
+        return df
+    if isinstance(result, dict):
+        for col_name, expression in result.items():
+            if isinstance(expression, str):
+                df[col_name] = df.eval(expression)
+            elif callable(expression):
+                df[col_name] = expression(df)
+            else:
+                df[col_name] = expression
+        return df
+    return result
+
+
+def _validate_scope(scope, owner):
+    """
+    Validate a plugin scope.
+    :param scope: str; Provided scope
+    :param owner: Plugin or dotted path declaring the scope, for error reporting
+    :return: null
+    """
+    if scope not in PLUGIN_SCOPES:
+        logging.error(f'Scope <{scope}> of <{owner}> is not supported, use one of <{PLUGIN_SCOPES}>')
+        raise ValueError(f'Scope <{scope}> of <{owner}> is not supported, use one of <{PLUGIN_SCOPES}>')
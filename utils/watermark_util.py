@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from datetime import datetime
+import utils.cache_util as cacheu
+
+# Default location of incremental state files, one per process name.
+DEFAULT_STATE_DIR = os.path.join(cacheu.DEFAULT_CACHE_DIR, 'state')
+STATE_EXT = '.json'
+PARTIAL_EXT = '.partial.pkl'
+SCAN_BLOCK_SIZE = 1 << 20
+
+
+def state_path(state_dir, process):
+    """
+    Incremental state file of a process.
+    :param state_dir: str; State directory, DEFAULT_STATE_DIR if not given
+    :param process: str; Process name, e.g. 'wendizhang_extraction'
+    :return: str; Fully qualified state file name
+    """
+    return os.path.join(state_dir or DEFAULT_STATE_DIR, process + STATE_EXT)
+
+
+def resume(path, input_path, fingerprint):
+    """
+    Resume an incremental run from its state file: find the range of input records appended since the previous run.
+    The run is a full one (range starting at 0) when there is no usable state: first run, different input, changed
+    configuration (fingerprint), input prefix changed (truncated or rewritten), or output changed since it was written.
+    Only complete lines are taken, so that a record being appended by the feed is left for the next run.
+    :param path: str; Fully qualified state file name, see state_path
+    :param input_path: str; Fully qualified input file name
+    :param fingerprint: str; Key of configuration the state was built with, see cacheu.make_key
+    :return: dict; Watermark with <full>, <start>, <end>, <digest> (of input up to end), <rows> (processed so far)
+               and <output_path> (written by the previous run) elements
+    """
+    state = load_state(path)
+    reason = _invalid_reason(state, input_path, fingerprint)
+    offset = 0 if reason else state['offset']
+    prefix_digest, end, digest = scan(input_path, offset)
+    if not reason and prefix_digest != state['digest']:
+        reason = 'processed input prefix has changed'
+
+    if reason:
+        logging.info(f'Incremental state <{path}> not used ({reason}), running in full')
+        return {'full': True, 'start': 0, 'end': end, 'digest': digest, 'rows': 0, 'output_path': None}
+    logging.info(f'Incremental run of <{input_path}> resumed from byte <{offset}>, record <{state["rows"]}>')
+    return {'full': False, 'start': offset, 'end': end, 'digest': digest, 'rows': state['rows'],
+            'output_path': state['output_path']}
+
+
+def commit(path, watermark, input_path, fingerprint, rows, output_path):
+    """
+    Record a successful incremental run into its state file, atomically.
+    :param path: str; Fully qualified state file name, see state_path
+    :param watermark: dict; Watermark the run started from, see resume
+    :param input_path: str; Fully qualified input file name
+    :param fingerprint: str; Key of configuration of the run
+    :param rows: int; Number of input records processed by the run
+    :param output_path: str; Path of the output file written by the run
+    :return: dict; Saved state
+    """
+    state = {'input_path': os.path.realpath(input_path), 'fingerprint': fingerprint, 'offset': watermark['end'],
+             'rows': watermark['rows'] + rows, 'digest': watermark['digest'],
+             'output_path': output_path, 'output_size': os.path.getsize(output_path),
+             'updated': datetime.now().isoformat(timespec='seconds')}
+    _atomic_write(path, json.dumps(state, indent=4).encode('utf-8'))
+    logging.info(f'Incremental state <{path}> saved at byte <{state["offset"]}>, record <{state["rows"]}>')
+    return state
+
+
+def load_state(path):
+    """
+    Load a state file.
+    :param path: str; Fully qualified state file name
+    :return: dict; State, None if there is none or it cannot be read
+    """
+    try:
+        with open(path) as file_state:
+            return json.load(file_state)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as state_error:
+        logging.warning(f'Incremental state <{path}> could not be loaded: {state_error}')
+        return None
+
+
+def load_partial(path):
+    """
+    Load partial aggregation states kept along with a state file.
+    :param path: str; Fully qualified state file name
+    :return: pd.DataFrame; Partial aggregation states, None if there are none
+    """
+    try:
+        with open(path[:-len(STATE_EXT)] + PARTIAL_EXT, 'rb') as file_partial:
+            return pickle.load(file_partial)
+    except FileNotFoundError:
+        return None
+
+
+def store_partial(path, df):
+    """
+    Store partial aggregation states along with a state file, atomically.
+    :param path: str; Fully qualified state file name
+    :param df: pd.DataFrame; Partial aggregation states
+    :return: null
+    """
+    _atomic_write(path[:-len(STATE_EXT)] + PARTIAL_EXT, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def scan(path, offset=0):
+    """
+    Hash a file in a single pass: its first <offset> bytes, then everything up to its last complete line.
+    :param path: str; Fully qualified file name
+    :param offset: int, default=0; Length of the prefix to hash on its own, at a line boundary
+    :return: tuple; Hex digest of the prefix, end offset of the last complete line and hex digest up to it
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file_source:
+        remaining = offset
+        while remaining > 0:
+            block = file_source.read(min(SCAN_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+        prefix_digest = hasher.hexdigest()
+
+        # Bytes after the last newline are not hashed, they belong to a record still being appended.
+        end = offset
+        pending = b''
+        for block in iter(lambda: file_source.read(SCAN_BLOCK_SIZE), b''):
+            pending += block
+            newline = pending.rfind(b'\n')
+            if newline >= 0:
+                hasher.update(pending[:newline + 1])
+                end += newline + 1
+                pending = pending[newline + 1:]
+    return prefix_digest, end, hasher.hexdigest()
+
+
+def _invalid_reason(state, input_path, fingerprint):
+    """
+    Check whether a state can be resumed, without reading the input.
+    :param state: dict; Loaded state, None if there is none
+    :param input_path: str; Fully qualified input file name
+    :param fingerprint: str; Key of configuration of the run
+    :return: str; Reason the state cannot be resumed, None if it can
+    """
+    if not state:
+        return 'no previous run'
+    if state.get('input_path') != os.path.realpath(input_path):
+        return 'different input file'
+    if state.get('fingerprint') != fingerprint:
+        return 'configuration has changed'
+    if os.path.getsize(input_path) < state['offset']:
+        return 'input file was truncated'
+    output_path = state.get('output_path')
+    if not output_path or not os.path.isfile(output_path) or os.path.getsize(output_path) != state['output_size']:
+        return 'output file has changed'
+    return None
+
+
+def _atomic_write(path, data):
+    """
+    Write a file atomically, through a temporary file in the same directory.
+    :param path: str; Fully qualified file name
+    :param data: bytes; File content
+    :return: null
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file_target:
+            file_target.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise